@@ -1,14 +1,18 @@
-from fastapi import APIRouter, HTTPException, Depends
+from fastapi import APIRouter, HTTPException, Depends, Header
 from fastapi.responses import HTMLResponse
 from pathlib import Path
 from datetime import datetime
+from typing import Optional
 import logging
+import os
+import secrets
 
 from src.models import (
     SearchRequest, SearchResponse, CaseResult,
     GuidanceRequest, GuidanceResponse,
-    SystemStats, HealthCheck
+    SystemStats, HealthCheck, IndexMaintenanceReport
 )
+from src.database import create_vector_index
 from src.rag_engine import TherapistRAGEngine
 
 logger = logging.getLogger(__name__)
@@ -30,6 +34,13 @@ def get_rag_engine() -> TherapistRAGEngine:
     
     return rag_engine
 
+def require_admin_key(x_admin_key: Optional[str] = Header(default=None)):
+    expected = os.getenv("ADMIN_API_KEY")
+    if not expected:
+        raise HTTPException(status_code=403, detail="Admin endpoints are disabled; set ADMIN_API_KEY")
+    if not x_admin_key or not secrets.compare_digest(x_admin_key, expected):
+        raise HTTPException(status_code=401, detail="Invalid admin key")
+
 @router.get("/", response_class=HTMLResponse)
 async def root():
     frontend_path = Path(__file__).parent.parent / "frontend" / "index.html"
@@ -64,7 +75,8 @@ async def search_similar_cases(
             query=request.query,
             top_k=request.top_k,
             min_similarity=request.min_similarity,
-            category_filter=request.category_filter
+            category_filter=request.category_filter,
+            ef_search=request.ef_search
         )
         
         results = []
@@ -138,6 +150,15 @@ async def get_categories(rag: TherapistRAGEngine = Depends(get_rag_engine)):
         logger.error(f"Error getting categories: {e}")
         raise HTTPException(status_code=500, detail="Error retrieving categories")
 
+@router.post("/admin/reindex", response_model=IndexMaintenanceReport, dependencies=[Depends(require_admin_key)])
+def rebuild_vector_index(force: bool = False):
+    # Plain def so the build, which can take minutes, runs in the threadpool
+    try:
+        return IndexMaintenanceReport(**create_vector_index(force=force))
+    except Exception as e:
+        logger.error(f"Error rebuilding vector index: {e}")
+        raise HTTPException(status_code=500, detail=f"Index rebuild error: {str(e)}")
+
 @router.get("/sample-queries")
 async def get_sample_queries():
     return {
@@ -163,7 +184,8 @@ async def get_api_info():
             "POST /search": "Search similar cases",
             "POST /guidance": "Generate therapeutic guidance",
             "GET /categories": "Available categories",
-            "GET /sample-queries": "Sample queries for testing"
+            "GET /sample-queries": "Sample queries for testing",
+            "POST /admin/reindex": "Rebuild the vector index if outdated (X-Admin-Key header)"
         },
         "note": "This is a Proof of Concept for demonstration purposes only"
     }
\ No newline at end of file
@@ -0,0 +1,3 @@
+"""
+Therapist RAG System - Benchmarks
+"""
\ No newline at end of file
@@ -0,0 +1,42 @@
+"""
+Timing comparison between row-wise clean_text and clean_text_series.
+
+Usage: python -m benchmarks.bench_clean_text [--repeat N]
+"""
+import argparse
+import time
+from pathlib import Path
+
+import pandas as pd
+
+from src.data_processor import TherapyDataProcessor
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--data", default=str(Path(__file__).parent.parent / "data" / "raw" / "train.csv"))
+    parser.add_argument("--repeat", type=int, default=5, help="Times the dataset is concatenated")
+    args = parser.parse_args()
+
+    df = pd.read_csv(args.data)
+    df = pd.concat([df] * args.repeat, ignore_index=True)
+    processor = TherapyDataProcessor(args.data, "")
+
+    for column in ["Context", "Response"]:
+        start = time.perf_counter()
+        expected = df[column].apply(processor.clean_text)
+        apply_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        actual = processor.clean_text_series(df[column])
+        series_time = time.perf_counter() - start
+
+        assert actual.equals(expected), f"Output mismatch in {column}"
+        print(
+            f"{column:<10} rows={len(df):>8}  apply={apply_time:.3f}s  "
+            f"vectorized={series_time:.3f}s  speedup={apply_time / series_time:.2f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+"""
+Write throughput of ORM inserts vs binary COPY into pgvector.
+
+Inserts synthetic conversations with random vectors into the database at
+DATABASE_URL through both write paths, then deletes them again.
+
+Usage: python -m benchmarks.bench_ingest_write [--rows N] [--batch-size N]
+"""
+import argparse
+import time
+
+import numpy as np
+
+from src.database import Conversation, IngestionCheckpoint, SessionLocal, init_db
+from src.embeddings import OpenAIEmbeddingManager
+
+
+def synthetic_batches(rows: int, batch_size: int, dimension: int, prefix: str):
+    rng = np.random.default_rng(0)
+    for start in range(0, rows, batch_size):
+        batch = [
+            {
+                "id": f"{prefix}-{i}",
+                "Context": f"Synthetic context {i} " * 20,
+                "Response": f"Synthetic response {i} " * 40,
+                "category": "general",
+                "quality_score": 80.0,
+                "context_length": 400,
+                "response_length": 900,
+            }
+            for i in range(start, min(start + batch_size, rows))
+        ]
+        embeddings = rng.standard_normal((len(batch), dimension)).astype(np.float32)
+        yield batch, embeddings.tolist()
+
+
+def run(manager: OpenAIEmbeddingManager, rows: int, batch_size: int, prefix: str) -> float:
+    db = SessionLocal()
+    try:
+        start = time.perf_counter()
+        for batch_number, (batch, embeddings) in enumerate(
+            synthetic_batches(rows, batch_size, manager.dimension, prefix), start=1
+        ):
+            texts = [manager._combined_text(row) for row in batch]
+            manager._store_batch(db, batch, texts, embeddings, batch_number)
+            db.commit()
+        return time.perf_counter() - start
+    finally:
+        db.query(Conversation).filter(
+            Conversation.extra_data["original_id"].astext.like(f"{prefix}-%")
+        ).delete(synchronize_session=False)
+        db.query(IngestionCheckpoint).filter(
+            IngestionCheckpoint.row_id.like(f"{prefix}-%")
+        ).delete(synchronize_session=False)
+        db.commit()
+        db.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=20_000)
+    parser.add_argument("--batch-size", type=int, default=500)
+    args = parser.parse_args()
+
+    init_db()
+    results = {}
+    for name, bulk in (("orm", False), ("copy", True)):
+        manager = OpenAIEmbeddingManager(cache=None, bulk=bulk)
+        seconds = run(manager, args.rows, args.batch_size, f"bench-{name}")
+        results[name] = seconds
+        print(f"{name:<5} rows={args.rows}  {seconds:.2f}s  {args.rows / seconds:,.0f} rows/s")
+
+    print(f"speedup={results['orm'] / results['copy']:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
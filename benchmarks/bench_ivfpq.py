@@ -0,0 +1,118 @@
+"""
+Recall and latency of the NumPy IVF-PQ index against exact search.
+
+Builds an index over synthetic clustered unit vectors (see
+bench_vector_storage) stored in a memory-mapped .npy file, reloads it from
+disk, and for each nprobe reports recall@k of the PQ scores alone and
+after exact reranking of --candidates rows, next to per-query latency and
+the exact brute-force baseline.
+
+Usage: python -m benchmarks.bench_ivfpq [--rows N] [--dimension D] [--nprobe 1 4 16 64] [--output results.json]
+"""
+import argparse
+import json
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+from benchmarks.bench_vector_storage import synthetic_vectors
+from src.ivfpq import IVFPQIndex
+
+
+def exact_top_k(matrix: np.ndarray, query: np.ndarray, k: int) -> np.ndarray:
+    scores = matrix @ query
+    top = np.argpartition(-scores, k)[:k]
+    return top[np.argsort(-scores[top])]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=200_000)
+    parser.add_argument("--dimension", type=int, default=768)
+    parser.add_argument("--nlist", type=int, help="Coarse lists (default: 4 * sqrt(rows))")
+    parser.add_argument("--m", type=int, help="Subquantizers, bytes per row (default: dimension / 16)")
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[1, 4, 16, 64])
+    parser.add_argument("--candidates", type=int, default=100, help="PQ candidates reranked exactly")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--output", help="Also write the results as JSON")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        vectors = synthetic_vectors(args.rows, args.dimension)
+        vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+        matrix = np.lib.format.open_memmap(
+            str(Path(tmp_dir) / "embeddings.npy"), mode="w+", dtype=np.float32, shape=vectors.shape
+        )
+        matrix[:] = vectors
+        matrix.flush()
+        del vectors, matrix
+        matrix = np.load(Path(tmp_dir) / "embeddings.npy", mmap_mode="r")
+
+        start = time.perf_counter()
+        IVFPQIndex.build(matrix, str(Path(tmp_dir) / "ivfpq"), nlist=args.nlist, m=args.m)
+        build_seconds = time.perf_counter() - start
+        index = IVFPQIndex.load(str(Path(tmp_dir) / "ivfpq"))
+
+        rng = np.random.default_rng(1)
+        picked = rng.choice(args.rows, args.queries, replace=False)
+        queries = np.asarray(matrix[picked]) + 0.1 * rng.standard_normal((args.queries, args.dimension)).astype(np.float32)
+        queries /= np.linalg.norm(queries, axis=1, keepdims=True)
+
+        resident = np.asarray(matrix)
+        start = time.perf_counter()
+        truth = [set(exact_top_k(resident, query, args.k)) for query in queries]
+        exact_ms = (time.perf_counter() - start) / args.queries * 1000
+
+        results = {
+            "rows": args.rows,
+            "dimension": args.dimension,
+            "nlist": index.nlist,
+            "bytes_per_row": index.m,
+            "float32_bytes_per_row": args.dimension * 4,
+            "build_seconds": build_seconds,
+            "exact_ms_per_query": exact_ms,
+            "nprobe": [],
+        }
+        for nprobe in args.nprobe:
+            pq_recall = rerank_recall = 0.0
+            pq_seconds = rerank_seconds = 0.0
+            for query, expected in zip(queries, truth):
+                start = time.perf_counter()
+                rows, _ = index.search(query, max(args.k, args.candidates), nprobe)
+                pq_seconds += time.perf_counter() - start
+                pq_recall += len(set(rows[: args.k]) & expected) / args.k
+
+                start = time.perf_counter()
+                rows = np.sort(rows)
+                reranked = rows[exact_top_k(np.asarray(matrix[rows]), query, min(args.k, len(rows) - 1))]
+                rerank_seconds += time.perf_counter() - start
+                rerank_recall += len(set(reranked) & expected) / args.k
+
+            results["nprobe"].append({
+                "nprobe": nprobe,
+                f"pq_recall_at_{args.k}": pq_recall / args.queries,
+                f"reranked_recall_at_{args.k}": rerank_recall / args.queries,
+                "ms_per_query": (pq_seconds + rerank_seconds) / args.queries * 1000,
+            })
+
+    print(
+        f"rows={args.rows} dimension={args.dimension} nlist={results['nlist']} "
+        f"bytes/row={results['bytes_per_row']} (float32: {results['float32_bytes_per_row']}) "
+        f"build={build_seconds:.1f}s exact={exact_ms:.2f}ms/query"
+    )
+    print(f"{'nprobe':>6} {'pq recall@' + str(args.k):>14} {'reranked':>9} {'ms/query':>9}")
+    for row in results["nprobe"]:
+        print(
+            f"{row['nprobe']:>6} {row[f'pq_recall_at_{args.k}']:>14.3f} "
+            f"{row[f'reranked_recall_at_{args.k}']:>9.3f} {row['ms_per_query']:>9.2f}"
+        )
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+"""
+Stage-by-stage benchmark of TherapyDataProcessor on synthetic corpora.
+
+Each corpus size runs TherapyDataProcessor.process_data in a fresh
+subprocess, so peak RSS is measured per size; stage timings come from the
+processor's own StageProfiler. Results are written as JSON for comparing
+commits.
+
+Usage: python -m benchmarks.bench_pipeline [--sizes 10000 100000 1000000] [--chunk-size N] [--workers N] [--output results.json]
+"""
+import argparse
+import json
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import List, Optional
+
+import numpy as np
+import pandas as pd
+
+from src.data_processor import TherapyDataProcessor
+from src.stage_profiler import StageProfiler
+
+ROOT = Path(__file__).parent.parent
+DEFAULT_SIZES = [10_000, 100_000, 1_000_000]
+
+
+def generate_corpus(template_path: str, rows: int, path: Path, duplicate_rate: float = 0.05, seed: int = 0):
+    """Write a CSV of rows resampled from the template with random extra words.
+
+    Lengths, vocabulary and category mix follow the template; duplicate_rate
+    of the rows are exact copies of earlier rows so deduplication has work.
+    """
+    template = pd.read_csv(template_path).dropna()
+    rng = np.random.default_rng(seed)
+    vocabulary = np.array(" ".join(template["Context"]).split())
+
+    contexts = template["Context"].to_numpy()[rng.integers(0, len(template), rows)]
+    responses = template["Response"].to_numpy()[rng.integers(0, len(template), rows)]
+    extra = rng.integers(0, len(vocabulary), (rows, 8))
+    contexts = [f"{context} {' '.join(vocabulary[words])}" for context, words in zip(contexts, extra)]
+
+    duplicates = np.flatnonzero(rng.random(rows) < duplicate_rate)
+    duplicates = duplicates[duplicates > 0]
+    sources = (rng.random(len(duplicates)) * duplicates).astype(int)
+    corpus = pd.DataFrame({"Context": contexts, "Response": responses})
+    corpus.iloc[duplicates] = corpus.iloc[sources].to_numpy()
+    corpus.to_csv(path, index=False)
+
+
+def peak_rss_mb() -> float:
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def run_stages(corpus_path: Path, output_path: Path, chunk_size: Optional[int] = None, workers: int = 1) -> dict:
+    """Run TherapyDataProcessor.process_data and save, timed by its StageProfiler."""
+    profiler = StageProfiler()
+    processor = TherapyDataProcessor(
+        str(corpus_path), str(output_path), chunk_size=chunk_size, workers=workers, profiler=profiler
+    )
+    start = time.perf_counter()
+    processor.process_data()
+    processor.save_processed_data()
+
+    return {
+        "stages": profiler.as_dict(),
+        "total_seconds": time.perf_counter() - start,
+        "output_rows": processor.stats["final_count"],
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+def run_size(rows: int, work_dir: Path, template: str, output_format: str, processor_args: List[str]) -> dict:
+    """Generate (or reuse) a corpus and benchmark it in a child process."""
+    corpus_path = work_dir / f"corpus_{rows}.csv"
+    if not corpus_path.exists():
+        print(f"Generating {rows} rows...", file=sys.stderr)
+        generate_corpus(template, rows, corpus_path)
+
+    output_path = work_dir / f"processed_{rows}.{output_format}"
+    child = subprocess.run(
+        [sys.executable, "-m", "benchmarks.bench_pipeline", "--child", str(corpus_path), str(output_path), *processor_args],
+        cwd=ROOT, capture_output=True, text=True, check=True,
+    )
+    result = json.loads(child.stdout.strip().splitlines()[-1])
+    result["rows"] = rows
+    return result
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], cwd=ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES)
+    parser.add_argument("--template", default=str(ROOT / "data" / "raw" / "train.csv"))
+    parser.add_argument("--format", choices=["csv", "parquet", "arrow"], default="csv")
+    parser.add_argument("--chunk-size", type=int, help="Stream the corpus in chunks of this many rows")
+    parser.add_argument("--workers", type=int, default=1, help="Worker processes for the per-row stages")
+    parser.add_argument("--work-dir", help="Directory for generated corpora (reused across runs)")
+    parser.add_argument("--output", default="benchmark_results.json")
+    parser.add_argument("--child", nargs=2, metavar=("CORPUS", "OUTPUT"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(run_stages(Path(args.child[0]), Path(args.child[1]), args.chunk_size, args.workers)))
+        return
+
+    processor_args = ["--workers", str(args.workers)]
+    if args.chunk_size:
+        processor_args += ["--chunk-size", str(args.chunk_size)]
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        work_dir = Path(args.work_dir or tmp_dir)
+        work_dir.mkdir(parents=True, exist_ok=True)
+        results = []
+        for rows in args.sizes:
+            result = run_size(rows, work_dir, args.template, args.format, processor_args)
+            results.append(result)
+            stages = "  ".join(f"{stage}={totals['wall_seconds']:.2f}s" for stage, totals in result["stages"].items())
+            print(f"rows={rows:>8}  {stages}  peak_rss={result['peak_rss_mb']:.0f}MB")
+
+    report = {
+        "commit": git_commit(),
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "pandas": pd.__version__,
+        "format": args.format,
+        "chunk_size": args.chunk_size,
+        "workers": args.workers,
+        "results": results,
+    }
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Wrote {args.output}")
+
+
+if __name__ == "__main__":
+    main()
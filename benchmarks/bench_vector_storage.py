@@ -0,0 +1,160 @@
+"""
+Recall and search cost of reduced-dimension and half-precision embeddings.
+
+Shortens full-size embeddings the way the provider's dimensions parameter
+does (keep the leading dimensions, rescale to unit length), optionally
+rounds them to float16 as halfvec storage does, and runs exact top-k
+cosine search against each variant. Recall is measured against the
+full-size float32 results; latency is for a brute-force scan in NumPy,
+which tracks the per-row distance cost of a sequential pgvector scan.
+halfvec rows report size and recall only: NumPy has no fast float16
+matmul, so their scan runs on widened float32 copies and its time would
+just repeat the vector row.
+binary+rerank rows are the SEARCH_MODE=binary path: a Hamming-distance
+scan over sign bits picks --candidates rows, which are reranked by exact
+cosine; their size is that of the bit index scanned in the first stage.
+
+Vectors come from the conversations table at DATABASE_URL with --from-db
+(store them at full dimension first), or are synthetic otherwise: clustered
+vectors whose variance decays over the dimensions, like text-embedding-3
+output. Synthetic numbers only show the shape of the trade-off.
+
+Usage: python -m benchmarks.bench_vector_storage [--from-db] [--rows N] [--dims 1536 768 512 256] [--output results.json]
+"""
+import argparse
+import json
+import time
+from functools import partial
+
+import numpy as np
+
+DEFAULT_DIMS = [1536, 1024, 768, 512, 256]
+
+
+def synthetic_vectors(rows: int, dimension: int, seed: int = 0) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    scale = 1.0 / np.sqrt(1.0 + np.arange(dimension) / 64.0)
+    centers = rng.standard_normal((max(rows // 50, 1), dimension))
+    vectors = centers[rng.integers(0, len(centers), rows)]
+    vectors += 0.7 * rng.standard_normal((rows, dimension))
+    return (vectors * scale).astype(np.float32)
+
+
+def stored_vectors(limit: int) -> np.ndarray:
+    from src.database import Conversation, SessionLocal
+
+    db = SessionLocal()
+    try:
+        rows = (
+            db.query(Conversation.embedding)
+            .filter(Conversation.embedding.isnot(None), Conversation.deleted_at.is_(None))
+            .limit(limit)
+        )
+        return np.array([embedding for (embedding,) in rows], dtype=np.float32)
+    finally:
+        db.close()
+
+
+def shorten(vectors: np.ndarray, dimension: int, dtype) -> np.ndarray:
+    """Leading dimensions, rescaled to unit length and stored as dtype."""
+    short = vectors[:, :dimension]
+    short = short / np.linalg.norm(short, axis=1, keepdims=True)
+    return short.astype(dtype)
+
+
+# Set bits per 16-bit word; NumPy 1.24 has no popcount
+POPCOUNT16 = np.array([bin(i).count("1") for i in range(1 << 16)], dtype=np.uint8)
+
+
+def top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    return np.argpartition(-scores, k)[:k]
+
+
+def sign_bits(vectors: np.ndarray) -> np.ndarray:
+    """binary_quantize: one bit per dimension, set where the value is positive."""
+    return np.packbits(vectors > 0, axis=1).view(np.uint16)
+
+
+def top_k_scan(corpus: np.ndarray, k: int, query: np.ndarray) -> np.ndarray:
+    return top_k(corpus @ query, k)
+
+
+def binary_search(bits, corpus, query_bits, query, k: int, candidates: int) -> np.ndarray:
+    """Hamming-distance prefilter, then exact cosine rerank of the candidates."""
+    hamming = POPCOUNT16[bits ^ query_bits].sum(axis=1, dtype=np.int32)
+    nearest = np.argpartition(hamming, candidates)[:candidates]
+    return nearest[top_k(corpus[nearest] @ query, k)]
+
+
+def run(vectors: np.ndarray, dims, queries: int, k: int, candidates: int):
+    rng = np.random.default_rng(1)
+    picked = rng.choice(len(vectors), queries, replace=False)
+    query_vectors = vectors[picked] + 0.1 * rng.standard_normal(vectors[picked].shape).astype(np.float32)
+    full, full_queries = shorten(vectors, vectors.shape[1], np.float32), shorten(query_vectors, vectors.shape[1], np.float32)
+    truth = [set(top_k(full @ query, k)) for query in full_queries]
+    candidates = min(candidates, len(vectors) - 1)
+
+    results = []
+    for dimension in dims:
+        query_set = shorten(query_vectors, dimension, np.float32)
+        variants = []
+        for storage, dtype in (("vector", np.float32), ("halfvec", np.float16)):
+            corpus = shorten(vectors, dimension, dtype)
+            # pgvector stores a 4-byte header (dim, unused) before the values
+            variants.append((storage, dimension * corpus.itemsize + 4, partial(top_k_scan, corpus.astype(np.float32), k)))
+        corpus = shorten(vectors, dimension, np.float32)
+        bits = sign_bits(corpus)
+        # bit columns carry a 4-byte varlena header and a 4-byte length
+        variants.append((
+            "binary+rerank",
+            dimension // 8 + 8,
+            lambda query, bits=bits, corpus=corpus: binary_search(bits, corpus, sign_bits(query[None])[0], query, k, candidates),
+        ))
+
+        for storage, bytes_per_row, search in variants:
+            start = time.perf_counter()
+            found = [search(query) for query in query_set]
+            seconds = time.perf_counter() - start
+            recall = np.mean([len(set(ids) & expected) / k for ids, expected in zip(found, truth)])
+            results.append({
+                "dimension": dimension,
+                "storage": storage,
+                "bytes_per_row": bytes_per_row,
+                # Widened halfvec scans time float32 math; see the module docstring
+                "ms_per_query": None if storage == "halfvec" else seconds / queries * 1000,
+                f"recall_at_{k}": float(recall),
+            })
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--from-db", action="store_true", help="Use embeddings stored in the database")
+    parser.add_argument("--rows", type=int, default=50_000)
+    parser.add_argument("--dims", type=int, nargs="+", default=DEFAULT_DIMS)
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--candidates", type=int, default=200, help="Hamming candidates reranked per query")
+    parser.add_argument("--output", help="Also write the results as JSON")
+    args = parser.parse_args()
+
+    vectors = stored_vectors(args.rows) if args.from_db else synthetic_vectors(args.rows, max(args.dims))
+    dims = [dimension for dimension in args.dims if dimension <= vectors.shape[1]]
+    results = run(vectors, dims, min(args.queries, len(vectors)), args.k, args.candidates)
+
+    full = results[0]
+    print(f"{'dimension':>9} {'storage':>13} {'bytes/row':>9} {'size':>6} {'ms/query':>9} {'recall@' + str(args.k):>9}")
+    for row in results:
+        latency = "-" if row["ms_per_query"] is None else f"{row['ms_per_query']:.2f}"
+        print(
+            f"{row['dimension']:>9} {row['storage']:>13} {row['bytes_per_row']:>9} "
+            f"{full['bytes_per_row'] / row['bytes_per_row']:>5.1f}x {latency:>9} "
+            f"{row[f'recall_at_{args.k}']:>9.3f}"
+        )
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,243 @@
+import asyncio
+import logging
+import os
+import time
+from typing import AsyncIterator, Iterable, List, Optional, Tuple, TypeVar
+
+from openai import AsyncOpenAI, RateLimitError
+
+from .batch_packer import BatchPacker, estimate_tokens
+from .embedding_backends import dimension_options
+from .embedding_cache import EmbeddingCache
+from .retry import TRANSIENT_ERRORS, RetryPolicy, retry_after_seconds
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+class TokenBucket:
+    """Continuous-refill bucket holding at most one minute of budget.
+
+    A falsy per_minute disables the limit.
+    """
+
+    def __init__(self, per_minute: Optional[float]):
+        self.per_minute = per_minute
+        self.tokens = float(per_minute or 0)
+        self._updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(
+            self.per_minute, self.tokens + (now - self._updated) * self.per_minute / 60
+        )
+        self._updated = now
+
+    async def acquire(self, amount: float):
+        if not self.per_minute:
+            return
+        # A single request larger than the whole budget waits for a full bucket
+        amount = min(amount, self.per_minute)
+        while True:
+            self._refill()
+            if self.tokens >= amount:
+                self.tokens -= amount
+                return
+            await asyncio.sleep((amount - self.tokens) * 60 / self.per_minute)
+
+
+class AdaptiveConcurrencyLimiter:
+    """Async concurrency limit adjusted by AIMD.
+
+    Each success adds 1/limit, so the limit grows by about one per round
+    of requests. A rate limit response, or a latency above
+    latency_target, multiplies it by backoff, at most once per cooldown
+    seconds so a burst of failures from the same round counts once.
+    """
+
+    def __init__(
+        self,
+        initial: int = 4,
+        minimum: int = 1,
+        maximum: int = 32,
+        backoff: float = 0.5,
+        latency_target: Optional[float] = None,
+        cooldown: float = 1.0,
+    ):
+        self.limit = float(initial)
+        self.minimum = minimum
+        self.maximum = maximum
+        self.backoff = backoff
+        self.latency_target = latency_target
+        self.cooldown = cooldown
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self._last_decrease = float("-inf")
+        self._condition = asyncio.Condition()
+
+    async def __aenter__(self):
+        async with self._condition:
+            await self._condition.wait_for(lambda: self.in_flight < int(self.limit))
+            self.in_flight += 1
+            self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+
+    async def __aexit__(self, *exc_info):
+        async with self._condition:
+            self.in_flight -= 1
+            self._condition.notify_all()
+
+    def on_success(self, latency: float):
+        if self.latency_target and latency > self.latency_target:
+            self.on_congestion()
+        else:
+            self.limit = min(self.maximum, self.limit + 1 / self.limit)
+
+    def on_congestion(self):
+        now = time.monotonic()
+        if now - self._last_decrease < self.cooldown:
+            return
+        self._last_decrease = now
+        self.limit = max(self.minimum, self.limit * self.backoff)
+        logger.info(f"Reduced embedding concurrency to {int(self.limit)}")
+
+
+class AsyncEmbeddingGenerator:
+    """Embeds many batches concurrently within request and token budgets."""
+
+    def __init__(
+        self,
+        client: AsyncOpenAI,
+        model: str,
+        dimension: int,
+        cache: Optional[EmbeddingCache] = None,
+        packer: Optional[BatchPacker] = None,
+        limiter: Optional[AdaptiveConcurrencyLimiter] = None,
+        requests_per_minute: Optional[float] = None,
+        tokens_per_minute: Optional[float] = None,
+        retry: Optional[RetryPolicy] = None,
+    ):
+        self.client = client
+        self.model = model
+        self.dimension = dimension
+        self.cache = cache
+        self.packer = packer or BatchPacker()
+        self.limiter = limiter or AdaptiveConcurrencyLimiter()
+        self.request_bucket = TokenBucket(requests_per_minute)
+        self.token_bucket = TokenBucket(tokens_per_minute)
+        self.retry = retry or RetryPolicy(max_retries=8)
+        self.options = dimension_options(model, dimension)
+        self.requests = 0
+        self.rate_limited = 0
+
+    @classmethod
+    def from_env(
+        cls,
+        model: str,
+        dimension: int,
+        cache: Optional[EmbeddingCache] = None,
+        packer: Optional[BatchPacker] = None,
+    ) -> "AsyncEmbeddingGenerator":
+        """Configure budgets and limits from EMBEDDING_MAX_* environment variables."""
+        # Retries are handled here so that 429s reach the concurrency limiter
+        client = AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"), max_retries=0)
+        limiter = AdaptiveConcurrencyLimiter(
+            maximum=int(os.getenv("EMBEDDING_MAX_CONCURRENCY", "32")),
+            latency_target=float(os.getenv("EMBEDDING_LATENCY_TARGET", "0")) or None,
+        )
+        return cls(
+            client,
+            model,
+            dimension,
+            cache=cache,
+            packer=packer or BatchPacker.from_env(model),
+            limiter=limiter,
+            requests_per_minute=float(os.getenv("EMBEDDING_MAX_RPM", "0")),
+            tokens_per_minute=float(os.getenv("EMBEDDING_MAX_TPM", "0")),
+        )
+
+    async def _request(self, texts: List[str]) -> List[List[float]]:
+        tokens = sum(estimate_tokens(text) for text in texts)
+        for attempt in range(self.retry.max_retries + 1):
+            await self.request_bucket.acquire(1)
+            await self.token_bucket.acquire(tokens)
+            async with self.limiter:
+                start = time.monotonic()
+                try:
+                    self.requests += 1
+                    response = await self.client.embeddings.create(
+                        input=texts, model=self.model, **self.options
+                    )
+                except TRANSIENT_ERRORS as e:
+                    delay = self.retry.delay(attempt)
+                    if isinstance(e, RateLimitError):
+                        self.rate_limited += 1
+                        self.limiter.on_congestion()
+                        retry_after = retry_after_seconds(e.response.headers)
+                        delay = delay if retry_after is None else retry_after
+                    if attempt == self.retry.max_retries:
+                        raise
+                    error = type(e).__name__
+                else:
+                    self.limiter.on_success(time.monotonic() - start)
+                    return [data.embedding for data in response.data]
+
+            logger.warning(f"{error}; retrying in {delay:.1f}s")
+            await asyncio.sleep(delay)
+
+    async def embed(self, texts: List[str]) -> List[List[float]]:
+        """Embed one batch, requesting only texts missing from the cache.
+
+        Texts are truncated to the model limit, and misses are split into
+        requests within the packer's token budget.
+        """
+        texts = [self.packer.fit(text) for text in texts]
+        embeddings = (
+            self.cache.get_many(self.model, self.dimension, texts)
+            if self.cache is not None
+            else [None] * len(texts)
+        )
+        misses = [i for i, embedding in enumerate(embeddings) if embedding is None]
+        requests = list(self.packer.pack((i, texts[i]) for i in misses))
+        results = await asyncio.gather(
+            *(self._request(miss_texts) for _, miss_texts in requests)
+        )
+        for (indices, miss_texts), generated in zip(requests, results):
+            for i, embedding in zip(indices, generated):
+                embeddings[i] = embedding
+            if self.cache is not None:
+                self.cache.put_many(self.model, self.dimension, miss_texts, generated)
+        return embeddings
+
+    async def _embed_tagged(self, payload: T, texts: List[str]):
+        return payload, await self.embed(texts)
+
+    async def embed_batches(
+        self, batches: Iterable[Tuple[T, List[str]]]
+    ) -> AsyncIterator[Tuple[T, List[List[float]]]]:
+        """Yield (payload, embeddings) per batch as requests complete.
+
+        Batches are pulled from the iterable only as fast as they can be
+        started, so at most limiter.maximum batches are held in memory.
+        """
+        pending = set()
+        try:
+            for payload, texts in batches:
+                pending.add(asyncio.create_task(self._embed_tagged(payload, texts)))
+                if len(pending) < self.limiter.maximum:
+                    continue
+                done, pending = await asyncio.wait(
+                    pending, return_when=asyncio.FIRST_COMPLETED
+                )
+                for task in done:
+                    yield task.result()
+
+            while pending:
+                done, pending = await asyncio.wait(
+                    pending, return_when=asyncio.FIRST_COMPLETED
+                )
+                for task in done:
+                    yield task.result()
+        finally:
+            for task in pending:
+                task.cancel()
@@ -0,0 +1,80 @@
+import logging
+import os
+from typing import Iterable, Iterator, List, Tuple, TypeVar
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# English averages about four characters per token; assuming three keeps
+# estimates above the real count, so packed requests stay under budget.
+CHARS_PER_TOKEN = 3
+
+# Input limit per text of the embedding models we use
+MODEL_MAX_INPUT_TOKENS = {
+    "text-embedding-3-small": 8191,
+    "text-embedding-3-large": 8191,
+    "text-embedding-ada-002": 8191,
+}
+
+
+def estimate_tokens(text: str) -> int:
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+class BatchPacker:
+    """Groups texts into embedding requests by estimated token count.
+
+    Each request holds at most max_items texts and max_tokens estimated
+    tokens. Texts over max_input_tokens are truncated to fit the model
+    limit, and counted in truncated_count.
+    """
+
+    def __init__(
+        self,
+        max_tokens: int = 100_000,
+        max_items: int = 512,
+        max_input_tokens: int = 8191,
+    ):
+        self.max_tokens = max_tokens
+        self.max_items = max_items
+        self.max_input_tokens = max_input_tokens
+        self.truncated_count = 0
+
+    @classmethod
+    def from_env(cls, model: str) -> "BatchPacker":
+        """Configure from EMBEDDING_BATCH_MAX_TOKENS and EMBEDDING_BATCH_MAX_ITEMS."""
+        return cls(
+            max_tokens=int(os.getenv("EMBEDDING_BATCH_MAX_TOKENS", "100000")),
+            max_items=int(os.getenv("EMBEDDING_BATCH_MAX_ITEMS", "512")),
+            max_input_tokens=MODEL_MAX_INPUT_TOKENS.get(model, 8191),
+        )
+
+    def fit(self, text: str) -> str:
+        """Return text, truncated if it is over the model input limit."""
+        if estimate_tokens(text) <= self.max_input_tokens:
+            return text
+        self.truncated_count += 1
+        logger.warning(
+            f"Truncating text of {len(text)} characters to the {self.max_input_tokens} token limit"
+        )
+        return text[: (self.max_input_tokens - 1) * CHARS_PER_TOKEN]
+
+    def pack(
+        self, items: Iterable[Tuple[T, str]]
+    ) -> Iterator[Tuple[List[T], List[str]]]:
+        """Yield (payloads, fitted texts) per request, keeping input order."""
+        payloads, texts, tokens = [], [], 0
+        for payload, text in items:
+            text = self.fit(text)
+            text_tokens = estimate_tokens(text)
+            if texts and (
+                tokens + text_tokens > self.max_tokens or len(texts) >= self.max_items
+            ):
+                yield payloads, texts
+                payloads, texts, tokens = [], [], 0
+            payloads.append(payload)
+            texts.append(text)
+            tokens += text_tokens
+        if texts:
+            yield payloads, texts
@@ -0,0 +1,171 @@
+import io
+import json
+import struct
+import uuid
+from datetime import datetime
+from typing import Callable, Dict, Iterable, List, Sequence, Tuple
+
+import numpy as np
+
+COPY_HEADER = b"PGCOPY\n\xff\r\n\x00" + struct.pack(">ii", 0, 0)
+COPY_TRAILER = struct.pack(">h", -1)
+PG_EPOCH = datetime(2000, 1, 1)
+
+
+def _encode_vector(value) -> bytes:
+    # pgvector binary format: int16 dimension, int16 unused, big-endian float4s
+    vector = np.asarray(value, dtype=">f4")
+    return struct.pack(">hh", len(vector), 0) + vector.tobytes()
+
+
+def _encode_halfvec(value) -> bytes:
+    # Same layout as vector, with big-endian float2s
+    vector = np.asarray(value, dtype=">f2")
+    return struct.pack(">hh", len(vector), 0) + vector.tobytes()
+
+
+def _encode_timestamp(value: datetime) -> bytes:
+    delta = value - PG_EPOCH
+    micros = (delta.days * 86400 + delta.seconds) * 1_000_000 + delta.microseconds
+    return struct.pack(">q", micros)
+
+
+# Binary send format per PostgreSQL type
+ENCODERS: Dict[str, Callable] = {
+    "uuid": lambda value: value.bytes,
+    "text": lambda value: str(value).encode("utf-8"),
+    "int4": lambda value: struct.pack(">i", int(value)),
+    "float8": lambda value: struct.pack(">d", float(value)),
+    "vector": _encode_vector,
+    "halfvec": _encode_halfvec,
+    "jsonb": lambda value: b"\x01" + json.dumps(value).encode("utf-8"),
+    "timestamp": _encode_timestamp,
+}
+
+CONVERSATION_COLUMNS: List[Tuple[str, str]] = [
+    ("id", "uuid"),
+    ("context", "text"),
+    ("response", "text"),
+    ("context_length", "int4"),
+    ("response_length", "int4"),
+    ("category", "text"),
+    ("quality_score", "float8"),
+    ("embedding", "vector"),
+    ("extra_data", "jsonb"),
+    ("created_at", "timestamp"),
+    ("content_hash", "text"),
+]
+
+CHECKPOINT_COLUMNS: List[Tuple[str, str]] = [
+    ("row_id", "text"),
+    ("batch_number", "int4"),
+    ("completed_at", "timestamp"),
+]
+
+
+def encode_copy_binary(
+    columns: Sequence[Tuple[str, str]], rows: Iterable[Dict]
+) -> bytes:
+    """Encode rows (dicts keyed by column name) as a COPY ... BINARY stream."""
+    encoders = [(name, ENCODERS[pg_type]) for name, pg_type in columns]
+    field_count = struct.pack(">h", len(columns))
+    buffer = io.BytesIO()
+    buffer.write(COPY_HEADER)
+    for row in rows:
+        buffer.write(field_count)
+        for name, encode in encoders:
+            value = row.get(name)
+            if value is None:
+                buffer.write(struct.pack(">i", -1))
+                continue
+            data = encode(value)
+            buffer.write(struct.pack(">i", len(data)))
+            buffer.write(data)
+    buffer.write(COPY_TRAILER)
+    return buffer.getvalue()
+
+
+class BulkConversationWriter:
+    """Writes conversations with binary COPY through a staging table.
+
+    Batches are copied into a temporary staging table and moved into
+    conversations with one INSERT ... SELECT, so a malformed batch never
+    leaves partial rows behind. Everything runs on the session's
+    connection, inside its transaction, so checkpoints written alongside
+    commit or roll back together with the rows. Rows whose content_hash
+    is already stored, and checkpoints whose row_id is, are skipped, so
+    a retried batch is a no-op.
+    """
+
+    STAGING_TABLE = "conversations_staging"
+    CHECKPOINT_STAGING_TABLE = "ingestion_checkpoints_staging"
+
+    def __init__(self, embedding_type: str = "vector"):
+        # embedding_type is the column's pgvector type, vector or halfvec
+        self.columns = [
+            (name, embedding_type if name == "embedding" else pg_type)
+            for name, pg_type in CONVERSATION_COLUMNS
+        ]
+
+    def _copy(
+        self, cursor, table: str, columns: Sequence[Tuple[str, str]], rows: List[Dict]
+    ):
+        names = ", ".join(name for name, _ in columns)
+        cursor.copy_expert(
+            f"COPY {table} ({names}) FROM STDIN WITH (FORMAT binary)",
+            io.BytesIO(encode_copy_binary(columns, rows)),
+        )
+
+    def write(
+        self, db, conversations: List[Dict], row_ids: List[str], batch_number: int
+    ):
+        now = datetime.utcnow()
+        for conversation in conversations:
+            conversation.setdefault("id", uuid.uuid4())
+            conversation.setdefault("created_at", now)
+        checkpoints = [
+            {"row_id": row_id, "batch_number": batch_number, "completed_at": now}
+            for row_id in row_ids
+        ]
+
+        cursor = db.connection().connection.cursor()
+        try:
+            self._insert_staged(
+                cursor,
+                "conversations",
+                self.STAGING_TABLE,
+                self.columns,
+                conversations,
+                "content_hash",
+            )
+            self._insert_staged(
+                cursor,
+                "ingestion_checkpoints",
+                self.CHECKPOINT_STAGING_TABLE,
+                CHECKPOINT_COLUMNS,
+                checkpoints,
+                "row_id",
+            )
+        finally:
+            cursor.close()
+
+    def _insert_staged(
+        self,
+        cursor,
+        table: str,
+        staging_table: str,
+        columns: Sequence[Tuple[str, str]],
+        rows: List[Dict],
+        conflict_column: str,
+    ):
+        names = ", ".join(name for name, _ in columns)
+        cursor.execute(
+            f"CREATE TEMP TABLE IF NOT EXISTS {staging_table} "
+            f"(LIKE {table} INCLUDING DEFAULTS) ON COMMIT DELETE ROWS"
+        )
+        self._copy(cursor, staging_table, columns, rows)
+        cursor.execute(
+            f"INSERT INTO {table} ({names}) SELECT {names} FROM {staging_table} "
+            f"ON CONFLICT ({conflict_column}) DO NOTHING"
+        )
+        cursor.execute(f"TRUNCATE {staging_table}")
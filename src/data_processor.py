@@ -1,19 +1,72 @@
+import numpy as np
 import pandas as pd
+import pyarrow as pa
 import re
 import os
+import hashlib
+import argparse
+import cProfile
+import json
 from pathlib import Path
-from typing import Dict, List
+from typing import Dict, Iterable, List, Optional
+from collections import Counter, deque
+from concurrent.futures import ProcessPoolExecutor
 import logging
 
+from .keyword_matcher import KeywordMatcher
+from .near_duplicates import MinHasher, NearDuplicateIndex
+from .processed_data import ProcessedDataWriter, iter_processed_batches, sidecar_path
+from .stage_profiler import StageProfiler
+
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Single-pass equivalent of the substitutions in clean_text: any run of
+# whitespace or disallowed characters collapses to one space.
+CLEAN_TEXT_PATTERN = re.compile(r'[^\w.,!?;:()\-"\']+')
+
+CATEGORY_KEYWORDS = {
+    'depression': ['depress', 'sad', 'hopeless', 'worthless', 'empty'],
+    'anxiety': ['anxious', 'panic', 'worry', 'fear', 'nervous'],
+    'relationships': ['marriage', 'relationship', 'partner', 'spouse', 'family'],
+    'trauma': ['abuse', 'trauma', 'ptsd', 'assault'],
+    'self_esteem': ['self-esteem', 'confidence', 'worth', 'value'],
+    'therapy': ['therapy', 'counseling', 'therapist', 'counselor']
+}
+CATEGORY_MATCHER = KeywordMatcher(CATEGORY_KEYWORDS)
+
+OUTPUT_COLUMNS = [
+    'id', 'Context', 'Response', 'category',
+    'quality_score', 'context_length', 'response_length'
+]
+OUTPUT_CATEGORIES = list(CATEGORY_KEYWORDS) + ['general']
+
+# Rows per task when an in-memory run is spread across worker processes
+PARALLEL_CHUNK_SIZE = 50_000
+
 class TherapyDataProcessor:
-    def __init__(self, raw_data_path: str, processed_data_path: str):
+    def __init__(
+        self,
+        raw_data_path: str,
+        processed_data_path: str,
+        chunk_size: Optional[int] = None,
+        workers: int = 1,
+        near_duplicate_threshold: Optional[float] = None,
+        incremental: bool = False,
+        profiler: Optional[StageProfiler] = None
+    ):
         self.raw_data_path = raw_data_path
         self.processed_data_path = processed_data_path
+        self.chunk_size = chunk_size
+        self.workers = workers
+        self.near_duplicate_threshold = near_duplicate_threshold
+        self.minhasher = MinHasher() if near_duplicate_threshold else None
+        self.incremental = incremental
+        # A caller-supplied profiler collects the stage timings of every run
+        self._shared_profiler = profiler
         self.df = None
         self.stats = {}
+        self._reset_stats()
     
     def load_data(self) -> pd.DataFrame:
         logger.info(f"Loading data from {self.raw_data_path}")
@@ -33,6 +86,11 @@ class TherapyDataProcessor:
         
         return text.strip()
     
+    def clean_text_series(self, texts: pd.Series) -> pd.Series:
+        """Vectorized clean_text over a whole column; output is identical."""
+        texts = texts.where(texts.notna(), '').astype(str)
+        return texts.str.replace(CLEAN_TEXT_PATTERN, ' ', regex=True).str.strip()
+    
     def calculate_quality_score(self, context: str, response: str) -> float:
         score = 100.0
         
@@ -53,122 +111,522 @@ class TherapyDataProcessor:
         
         return max(0, min(100, score))
     
+    def calculate_quality_scores(self, context_length: pd.Series, response_length: pd.Series) -> pd.Series:
+        """Vectorized calculate_quality_score over precomputed length columns."""
+        context = context_length.to_numpy()
+        response = response_length.to_numpy()
+        
+        score = np.full(len(context), 100.0)
+        score -= 30 * (context < 50)
+        score -= 20 * (response < 30)
+        score += 10 * ((context >= 100) & (context <= 2000))
+        score += 10 * ((response >= 50) & (response <= 1500))
+        score -= 20 * (context > 3000)
+        score -= 15 * (response > 2000)
+        
+        return pd.Series(np.clip(score, 0, 100), index=context_length.index)
+    
     def detect_categories(self, context: str) -> str:
-        context_lower = context.lower()
-        
-        categories = {
-            'depression': ['depress', 'sad', 'hopeless', 'worthless', 'empty'],
-            'anxiety': ['anxious', 'panic', 'worry', 'fear', 'nervous'],
-            'relationships': ['marriage', 'relationship', 'partner', 'spouse', 'family'],
-            'trauma': ['abuse', 'trauma', 'ptsd', 'assault'],
-            'self_esteem': ['self-esteem', 'confidence', 'worth', 'value'],
-            'therapy': ['therapy', 'counseling', 'therapist', 'counselor']
-        }
+        return CATEGORY_MATCHER.best_group(context, 'general')
+    
+    def detect_categories_batch(self, contexts: pd.Series) -> pd.Series:
+        """Vectorized detect_categories over a whole column."""
+        return CATEGORY_MATCHER.best_group_batch(contexts, 'general')
+    
+    def load_chunks(self):
+        """Yield the raw CSV in chunks of chunk_size rows."""
+        logger.info(f"Streaming data from {self.raw_data_path} in chunks of {self.chunk_size}")
+        return pd.read_csv(self.raw_data_path, chunksize=self.chunk_size)
+    
+    def content_ids(self, chunk: pd.DataFrame) -> List[str]:
+        """Stable id of each row: a 128-bit hash of its cleaned Context and Response."""
+        return [
+            hashlib.blake2b(f"{context}\x1f{response}".encode('utf-8'), digest_size=16).hexdigest()
+            for context, response in zip(chunk['Context'], chunk['Response'])
+        ]
+    
+    def raw_row_hashes(self, chunk: pd.DataFrame) -> List[str]:
+        """Hash of each raw row's values; the key of the incremental manifest."""
+        return [
+            hashlib.blake2b('\x1f'.join(map(str, values)).encode('utf-8'), digest_size=16).hexdigest()
+            for values in chunk.itertuples(index=False, name=None)
+        ]
+    
+    def clean_chunk(self, chunk: pd.DataFrame) -> pd.DataFrame:
+        """Clean text, compute lengths, drop rows with empty content and assign content ids."""
+        chunk = chunk.copy()
+        chunk['Context'] = self.clean_text_series(chunk['Context'])
+        chunk['Response'] = self.clean_text_series(chunk['Response'])
         
-        category_scores = {}
-        for category, keywords in categories.items():
-            score = sum(1 for keyword in keywords if keyword in context_lower)
-            if score > 0:
-                category_scores[category] = score
+        # Compute lengths once; reused for filtering, scoring and metadata
+        chunk['context_length'] = chunk['Context'].str.len()
+        chunk['response_length'] = chunk['Response'].str.len()
         
-        if category_scores:
-            return max(category_scores, key=category_scores.get)
-        return 'general'
+        # Remove rows with empty content
+        chunk = chunk[
+            (chunk['context_length'] > 20) &
+            (chunk['response_length'] > 10)
+        ]
+        return chunk.assign(id=self.content_ids(chunk))
+    
+    def drop_seen_duplicates(self, chunk: pd.DataFrame) -> pd.DataFrame:
+        """Drop exact duplicates (same content id) of rows already kept, in this or earlier chunks."""
+        return chunk[np.array(self._unseen_mask(chunk['id'], chunk.index), dtype=bool)]
+    
+    def _unseen_mask(self, ids: Iterable[str], positions: Iterable[int]) -> List[bool]:
+        keep = []
+        for content_id, position in zip(ids, positions):
+            if content_id in self._seen_ids:
+                keep.append(False)
+                # A new row matching a previous run's output keeps that row
+                if content_id in self._previous_ids:
+                    self._retain(content_id, position)
+            else:
+                keep.append(True)
+                self._seen_ids.add(content_id)
+        return keep
+    
+    def near_duplicate_texts(self, chunk: pd.DataFrame) -> pd.Series:
+        return chunk['Context'] + ' ' + chunk['Response']
+    
+    def drop_near_duplicates(self, chunk: pd.DataFrame, signatures: Optional[np.ndarray] = None) -> pd.DataFrame:
+        """Drop rows whose MinHash signature matches a row already kept."""
+        if self._near_duplicates is None:
+            return chunk
+        if signatures is None:
+            signatures = self.minhasher.signatures(self.near_duplicate_texts(chunk))
+        chunk = chunk[np.array(self._near_duplicates.filter(signatures), dtype=bool)]
+        self._near_duplicate_ids.extend(chunk['id'])
+        return chunk
+    
+    def score_chunk(self, chunk: pd.DataFrame) -> pd.DataFrame:
+        """Score cleaned rows and filter by quality."""
+        chunk = chunk.copy()
+        chunk['quality_score'] = self.calculate_quality_scores(
+            chunk['context_length'], chunk['response_length']
+        )
+        
+        # Filter by quality (keep scores >= 40)
+        return chunk[chunk['quality_score'] >= 40]
+    
+    def categorize_chunk(self, chunk: pd.DataFrame) -> pd.DataFrame:
+        return chunk.assign(category=self.detect_categories_batch(chunk['Context']))
+    
+    @property
+    def delta_path(self) -> str:
+        return sidecar_path(self.processed_data_path, '_delta' + Path(self.processed_data_path).suffix)
+    
+    @property
+    def manifest_path(self) -> str:
+        return sidecar_path(self.processed_data_path, '_manifest.csv')
+    
+    @property
+    def staging_path(self) -> str:
+        return sidecar_path(self.processed_data_path, '_unordered.partial.arrow')
     
     def process_data(self) -> pd.DataFrame:
-        """Main processing pipeline."""
+        """Main processing pipeline.
+        
+        With chunk_size set, the raw CSV is streamed and each processed chunk
+        is appended to processed_data_path, so memory stays bounded by the
+        chunk size plus the id set used for deduplication.
+        
+        With incremental set, raw rows listed in the manifest of the previous
+        run are not processed again: their output rows are carried over from
+        the previous output, and only new or changed rows are cleaned, scored
+        and written to the delta file. New and carried-over rows are staged
+        first (in an Arrow file when streaming) and emitted in source order at
+        the end, each carried-over row at the position of the first raw row
+        producing it, as a full run would. Near-duplicate detection, if
+        enabled, runs over those staged rows in that order, and raw rows
+        that produced no output are processed again, since a row dropped as
+        a near-duplicate may come back once its cluster changes.
+        """
         logger.info("Starting data processing...")
+        self._reset_stats()
+        if self.incremental:
+            self.profiler.run('load_previous', self._load_previous_run)
         
-        # Load data
-        self.load_data()
-        initial_count = len(self.df)
+        streaming = bool(self.chunk_size)
+        if streaming:
+            chunks = self.profiler.iterate('load', self.load_chunks())
+            # Write next to the output and swap it in at the end, so the
+            # previous output stays readable for retained rows until then
+            partial_path = sidecar_path(self.processed_data_path, '.partial' + Path(self.processed_data_path).suffix)
+            self._writer = ProcessedDataWriter(partial_path, OUTPUT_CATEGORIES)
+            if self.incremental:
+                self._staging_writer = ProcessedDataWriter(self.staging_path, OUTPUT_CATEGORIES)
+                self._delta_writer = ProcessedDataWriter(self.delta_path, OUTPUT_CATEGORIES)
+        else:
+            df = self.profiler.run('load', self.load_data)
+            chunk_size = PARALLEL_CHUNK_SIZE if self.workers > 1 else max(len(df), 1)
+            chunks = [df.iloc[start:start + chunk_size] for start in range(0, max(len(df), 1), chunk_size)]
         
-        # Clean text columns
-        logger.info("Cleaning text data...")
-        self.df['Context'] = self.df['Context'].apply(self.clean_text)
-        self.df['Response'] = self.df['Response'].apply(self.clean_text)
+        for raw_index, chunk, cleaned_ids in self._iter_processed_chunks(self._new_raw_chunks(chunks)):
+            if self.incremental:
+                self._record_manifest_entries(raw_index, cleaned_ids)
+                self._stage(chunk[OUTPUT_COLUMNS], is_new=True)
+            else:
+                self._emit(chunk[OUTPUT_COLUMNS])
         
-        # Remove rows with empty content
-        self.df = self.df[
-            (self.df['Context'].str.len() > 20) & 
-            (self.df['Response'].str.len() > 10)
-        ]
+        if self.incremental:
+            for chunk in self.profiler.iterate('load_retained', self._retained_chunks()):
+                self._stage(chunk, is_new=False)
+            for chunk, new_mask in self.profiler.iterate('reorder', self._staged_in_source_order()):
+                if self._near_duplicates is not None:
+                    kept = self.profiler.run('near_dedup', self.drop_near_duplicates, chunk)
+                    chunk, new_mask = kept, new_mask[chunk.index.isin(kept.index)]
+                self._emit(chunk, new_mask)
         
-        # Remove exact duplicates
-        self.df = self.df.drop_duplicates()
+        if streaming:
+            self.profiler.run('write', self._writer.close)
+            os.replace(partial_path, self.processed_data_path)
+            if self._delta_writer is not None:
+                self._delta_writer.close()
+            self.df = None
+        else:
+            self.df = pd.concat(self._frames) if self._frames else pd.DataFrame(columns=OUTPUT_COLUMNS)
+            self.delta_df = pd.concat(self._delta_frames) if self._delta_frames else self.df.iloc[:0]
+        self.stats = self._finalize_stats()
         
-        # Calculate quality scores
-        logger.info("Calculating quality scores...")
-        self.df['quality_score'] = self.df.apply(
-            lambda row: self.calculate_quality_score(row['Context'], row['Response']), 
-            axis=1
-        )
+        logger.info(f"Processing complete: {self.stats['initial_count']} → {self.stats['final_count']} conversations")
+        logger.info(f"Categories found: {list(self.stats['categories'].keys())}")
         
-        # Filter by quality (keep scores >= 40)
-        self.df = self.df[self.df['quality_score'] >= 40]
-        
-        # Add categories
-        logger.info("Adding categories...")
-        self.df['category'] = self.df['Context'].apply(self.detect_categories)
-        
-        # Add metadata
-        self.df['context_length'] = self.df['Context'].str.len()
-        self.df['response_length'] = self.df['Response'].str.len()
-        self.df['id'] = range(1, len(self.df) + 1)
-        
-        # Reorder columns
-        self.df = self.df[[
-            'id', 'Context', 'Response', 'category', 
-            'quality_score', 'context_length', 'response_length'
-        ]]
-        
-        # Store processing stats
-        final_count = len(self.df)
-        self.stats = {
+        return self.df
+    
+    def _emit(self, chunk: pd.DataFrame, new_mask: Optional[np.ndarray] = None):
+        """Add one output chunk to the stats and to the output (and delta) data.
+        
+        In incremental mode, new_mask flags the rows that are new in this run.
+        """
+        self._update_stats(chunk)
+        if self.incremental:
+            self._output_ids.update(chunk['id'])
+            self._counts['new_count'] += int(new_mask.sum())
+            self._counts['retained_count'] += int((~new_mask).sum())
+        
+        if self._writer is not None:
+            self.profiler.run('write', self._writer.write, chunk)
+            if self._delta_writer is not None:
+                self.profiler.run('write_delta', self._delta_writer.write, chunk[new_mask])
+            logger.info(f"Wrote {self._writer.rows_written} conversations")
+        else:
+            self._frames.append(chunk)
+            if self.incremental:
+                self._delta_frames.append(chunk[new_mask])
+    
+    def _stage(self, chunk: pd.DataFrame, is_new: bool):
+        """Hold an incremental output chunk, indexed by raw position, until all rows are known."""
+        self._positions.append(chunk.index.to_numpy())
+        self._staged_new.append(np.full(len(chunk), is_new))
+        if self._staging_writer is not None:
+            self.profiler.run('stage', self._staging_writer.write, chunk)
+        else:
+            self._staged.append(chunk)
+    
+    def _new_raw_chunks(self, chunks):
+        """Count raw rows and, in incremental mode, skip rows the manifest already covers."""
+        for chunk in chunks:
+            self._counts['initial_count'] += len(chunk)
+            if not self.incremental:
+                yield chunk
+                continue
+            
+            hashes = self.raw_row_hashes(chunk)
+            # With near-dup detection on, rows without output may be a cluster's
+            # dropped member and must be compared again
+            unchanged = np.array([
+                raw_hash in self._previous_manifest
+                and (self._near_duplicates is None or self._previous_manifest[raw_hash] != '')
+                for raw_hash in hashes
+            ], dtype=bool)
+            for position, raw_hash, is_unchanged in zip(chunk.index, hashes, unchanged):
+                if is_unchanged:
+                    previous_id = self._previous_manifest[raw_hash]
+                    self._manifest_entries.append((raw_hash, previous_id))
+                    if previous_id:
+                        self._retain(previous_id, position)
+            
+            self._pending_hashes.append([h for h, is_unchanged in zip(hashes, unchanged) if not is_unchanged])
+            yield chunk[~unchanged]
+    
+    def _retain(self, content_id: str, position: int):
+        """Carry a previous output row over, placed at its first raw position."""
+        self._retained_positions[content_id] = min(position, self._retained_positions.get(content_id, position))
+    
+    def _record_manifest_entries(self, raw_index: pd.Index, cleaned_ids: pd.Series):
+        # Chunks come back in submission order, so pending hashes line up
+        hashes = self._pending_hashes.popleft()
+        for index, raw_hash in zip(raw_index, hashes):
+            self._manifest_entries.append((raw_hash, cleaned_ids.get(index, '')))
+    
+    def _load_previous_run(self):
+        """Load the manifest and output ids of the previous run, if both exist."""
+        if not (os.path.exists(self.manifest_path) and os.path.exists(self.processed_data_path)):
+            logger.info("No previous run found; processing everything")
+            return
+        
+        manifest = pd.read_csv(self.manifest_path, dtype=str, keep_default_na=False)
+        self._previous_manifest = dict(zip(manifest['raw_hash'], manifest['id']))
+        for rows in iter_processed_batches(self.processed_data_path, 50_000):
+            self._previous_ids.update(row['id'] for row in rows)
+        
+        # Previous output rows count as seen, so new copies are not emitted twice
+        self._seen_ids.update(self._previous_ids)
+        logger.info(f"Loaded manifest with {len(self._previous_manifest)} raw rows and {len(self._previous_ids)} output rows")
+    
+    def _retained_chunks(self):
+        """Yield previous output rows that the current raw data still produces.
+        
+        Each chunk is indexed by the raw positions the rows are retained at.
+        """
+        if not self._retained_positions:
+            return
+        for rows in iter_processed_batches(self.processed_data_path, 50_000):
+            chunk = pd.DataFrame(rows, columns=OUTPUT_COLUMNS)
+            chunk = chunk[chunk['id'].isin(self._retained_positions.keys())]
+            if not chunk.empty:
+                chunk.index = chunk['id'].map(self._retained_positions).to_numpy()
+                yield chunk.astype({'category': str, 'quality_score': float})
+    
+    def _staged_in_source_order(self):
+        """Yield (chunk, new-row mask) over the staged rows, sorted by raw position."""
+        if not self._positions:
+            return
+        positions = np.concatenate(self._positions)
+        is_new = np.concatenate(self._staged_new)
+        order = np.argsort(positions, kind='stable')
+        if self._staging_writer is None:
+            chunk = pd.concat(self._staged).iloc[order]
+            yield chunk, is_new[order]
+            return
+        
+        self._staging_writer.close()
+        with pa.memory_map(self.staging_path) as source:
+            table = pa.ipc.open_file(source).read_all()
+            for start in range(0, len(order), self.chunk_size):
+                rows = order[start:start + self.chunk_size]
+                chunk = table.take(pa.array(rows)).to_pandas()
+                chunk.index = positions[rows]
+                yield chunk.astype({'category': str, 'quality_score': float}), is_new[rows]
+        os.remove(self.staging_path)
+    
+    def _iter_processed_chunks(self, chunks):
+        """Yield (raw index, processed chunk, cleaned ids) for each raw chunk, in input order.
+        
+        cleaned_ids maps the raw index of every row that survived cleaning
+        to its content id, including rows later dropped as duplicates.
+        With workers > 1 the per-row stages run in a process pool with a
+        bounded number of chunks in flight; deduplication stays in this
+        process so its result does not depend on scheduling.
+        """
+        # Incremental runs compare near-duplicates once all rows are staged
+        near_dedup = not self.incremental
+        minhasher = self.minhasher if near_dedup else None
+        if self.workers <= 1:
+            for chunk in chunks:
+                cleaned = self.profiler.run('clean', self.clean_chunk, chunk)
+                unique = self.profiler.run('dedup', self.drop_seen_duplicates, cleaned)
+                scored = self.profiler.run('score', self.score_chunk, unique)
+                categorized = self.profiler.run('categorize', self.categorize_chunk, scored)
+                if near_dedup:
+                    categorized = self.profiler.run('near_dedup', self.drop_near_duplicates, categorized)
+                yield chunk.index, categorized, cleaned['id']
+            return
+        
+        with ProcessPoolExecutor(max_workers=self.workers) as executor:
+            pending = deque()
+            for chunk in chunks:
+                pending.append((chunk.index, executor.submit(_clean_and_score_chunk, chunk, minhasher)))
+                if len(pending) >= self.workers * 2:
+                    yield self._merge_worker_result(*pending.popleft())
+            while pending:
+                yield self._merge_worker_result(*pending.popleft())
+    
+    def _merge_worker_result(self, raw_index: pd.Index, future):
+        chunk, cleaned_ids, signatures, stages = future.result()
+        self.profiler.merge(stages)
+        keep = np.array(self._unseen_mask(chunk['id'], chunk.index), dtype=bool)
+        chunk = self.profiler.run('dedup', lambda chunk: chunk[keep], chunk)
+        if signatures is not None:
+            chunk = self.profiler.run('near_dedup', self.drop_near_duplicates, chunk, signatures[keep])
+        return raw_index, chunk, cleaned_ids
+    
+    def _reset_stats(self):
+        self.profiler = self._shared_profiler or StageProfiler()
+        self._seen_ids = set()
+        self._near_duplicates = NearDuplicateIndex(self.near_duplicate_threshold) if self.near_duplicate_threshold else None
+        self._near_duplicate_ids = []
+        self._counts = Counter()
+        self._category_counts = Counter()
+        self._running_means = {'quality_score': 0.0, 'context_length': 0.0, 'response_length': 0.0}
+        
+        self._writer = None
+        self._delta_writer = None
+        self._staging_writer = None
+        self._frames = []
+        self._delta_frames = []
+        self.delta_df = None
+        
+        self._previous_manifest = {}
+        self._previous_ids = set()
+        self._retained_positions = {}
+        self._positions = []
+        self._staged = []
+        self._staged_new = []
+        self._output_ids = set()
+        self._pending_hashes = deque()
+        self._manifest_entries = []
+    
+    def _update_stats(self, chunk: pd.DataFrame):
+        """Fold one processed chunk into the running counts and means."""
+        if chunk.empty:
+            return
+        
+        self._counts['final_count'] += len(chunk)
+        self._category_counts.update(chunk['category'].tolist())
+        
+        weight = len(chunk) / self._counts['final_count']
+        for column, mean in self._running_means.items():
+            self._running_means[column] = mean + (chunk[column].mean() - mean) * weight
+    
+    def _finalize_stats(self) -> Dict:
+        initial_count = self._counts['initial_count']
+        final_count = self._counts['final_count']
+        empty = final_count == 0
+        stats = {
             'initial_count': initial_count,
             'final_count': final_count,
             'removed_count': initial_count - final_count,
-            'removal_percentage': (initial_count - final_count) / initial_count * 100,
-            'categories': self.df['category'].value_counts().to_dict(),
-            'avg_quality_score': self.df['quality_score'].mean(),
-            'avg_context_length': self.df['context_length'].mean(),
-            'avg_response_length': self.df['response_length'].mean()
+            'removal_percentage': (initial_count - final_count) / initial_count * 100 if initial_count else 0.0,
+            'categories': dict(self._category_counts.most_common()),
+            'avg_quality_score': float('nan') if empty else self._running_means['quality_score'],
+            'avg_context_length': float('nan') if empty else self._running_means['context_length'],
+            'avg_response_length': float('nan') if empty else self._running_means['response_length'],
+            'stages': self.profiler.as_dict()
         }
         
-        logger.info(f"Processing complete: {initial_count} → {final_count} conversations")
-        logger.info(f"Categories found: {list(self.stats['categories'].keys())}")
+        if self.incremental:
+            stats['new_count'] = self._counts['new_count']
+            stats['retained_count'] = self._counts['retained_count']
+            stats['deleted_count'] = len(self._previous_ids - self._output_ids)
         
-        return self.df
+        if self._near_duplicates is not None:
+            # Kept rows occupy consecutive LSH slots in output order
+            clusters = self._near_duplicates.cluster_sizes
+            stats['near_duplicate_threshold'] = self.near_duplicate_threshold
+            stats['near_duplicates_removed'] = self._near_duplicates.removed_count
+            stats['near_duplicate_clusters'] = len(clusters)
+            stats['largest_near_duplicate_clusters'] = {
+                self._near_duplicate_ids[slot]: removed + 1 for slot, removed in clusters.most_common(10)
+            }
+        
+        return stats
     
     def save_processed_data(self):
-        """Save processed data to CSV."""
+        """Save processed data as CSV, Parquet or Arrow IPC, chosen by file suffix."""
         logger.info(f"Saving processed data to {self.processed_data_path}")
-        
-        # Create directory if it doesn't exist
-        os.makedirs(os.path.dirname(self.processed_data_path), exist_ok=True)
-        
-        # Save main data
-        self.df.to_csv(self.processed_data_path, index=False)
+        self.profiler.run('save', self._save_outputs)
+        self.stats['stages'] = self.profiler.as_dict()
         
         # Save stats
-        stats_path = self.processed_data_path.replace('.csv', '_stats.txt')
+        stats_path = sidecar_path(self.processed_data_path, '_stats.txt')
+        os.makedirs(os.path.dirname(stats_path) or '.', exist_ok=True)
         with open(stats_path, 'w') as f:
             f.write("Data Processing Statistics\n")
             f.write("=" * 30 + "\n\n")
             for key, value in self.stats.items():
-                f.write(f"{key}: {value}\n")
+                if key != 'stages':
+                    f.write(f"{key}: {value}\n")
+            f.write("\nStage Timings\n")
+            f.write("=" * 30 + "\n\n")
+            f.write(self.profiler.format_table() + "\n")
+        
+        with open(sidecar_path(self.processed_data_path, '_stats.json'), 'w') as f:
+            json.dump(self.stats, f, indent=2, default=float)
         
         logger.info("Data saved successfully!")
+    
+    def _save_outputs(self):
+        # Save main data (streaming mode has already appended it chunk by chunk)
+        if self.df is not None:
+            with ProcessedDataWriter(self.processed_data_path, OUTPUT_CATEGORIES) as writer:
+                writer.write(self.df)
+            if self.incremental:
+                with ProcessedDataWriter(self.delta_path, OUTPUT_CATEGORIES) as writer:
+                    writer.write(self.delta_df)
+        
+        # Save the manifest and the ids that disappeared since the previous run
+        if self.incremental:
+            manifest = pd.DataFrame(self._manifest_entries, columns=['raw_hash', 'id'])
+            manifest['id'] = manifest['id'].where(manifest['id'].isin(self._output_ids), '')
+            manifest.to_csv(self.manifest_path, index=False)
+            
+            deleted_ids = sorted(self._previous_ids - self._output_ids)
+            with open(sidecar_path(self.processed_data_path, '_deleted_ids.txt'), 'w') as f:
+                f.writelines(f"{content_id}\n" for content_id in deleted_ids)
+
+def _clean_and_score_chunk(chunk: pd.DataFrame, minhasher: Optional[MinHasher] = None):
+    """Process-pool task: the per-row stages, before deduplication.
+    
+    Duplicates share their content and therefore their quality score, so
+    deduplicating after the quality filter keeps exactly the same rows.
+    """
+    processor = TherapyDataProcessor('', '')
+    profiler = StageProfiler()
+    cleaned = profiler.run('clean', processor.clean_chunk, chunk)
+    scored = profiler.run('score', processor.score_chunk, cleaned)
+    chunk = profiler.run('categorize', processor.categorize_chunk, scored)
+    signatures = None
+    if minhasher is not None:
+        signatures = profiler.run('minhash', minhasher.signatures, processor.near_duplicate_texts(chunk))
+    return chunk, cleaned['id'], signatures, profiler.as_dict()
 
 def main():
     base_dir = Path(__file__).parent.parent
-    raw_data_path = base_dir / "data" / "raw" / "train-base.csv"
-    processed_data_path = base_dir / "data" / "processed" / "cleaned_conversations.csv"
     
-    processor = TherapyDataProcessor(str(raw_data_path), str(processed_data_path))
+    parser = argparse.ArgumentParser(description="Clean and score raw therapy conversations")
+    parser.add_argument("--input", default=str(base_dir / "data" / "raw" / "train-base.csv"))
+    parser.add_argument("--output", default=str(base_dir / "data" / "processed" / "cleaned_conversations.csv"))
+    parser.add_argument(
+        "--format", choices=["csv", "parquet", "arrow"], default=None,
+        help="Output format; defaults to the suffix of --output"
+    )
+    parser.add_argument("--chunk-size", type=int, default=None, help="Stream the raw CSV in chunks of this many rows")
+    parser.add_argument("--workers", type=int, default=1, help="Worker processes for cleaning, scoring and categorizing")
+    parser.add_argument(
+        "--near-dup-threshold", type=float, default=None,
+        help="Drop near-duplicates whose estimated Jaccard similarity reaches this threshold"
+    )
+    parser.add_argument(
+        "--incremental", action="store_true",
+        help="Only process raw rows that are new or changed since the previous run"
+    )
+    parser.add_argument("--profile", metavar="PATH", help="Write cProfile stats of the run to PATH")
+    args = parser.parse_args()
+    
+    output = args.output
+    if args.format:
+        output = str(Path(output).with_suffix(f".{args.format}"))
+    
+    processor = TherapyDataProcessor(
+        args.input, output,
+        chunk_size=args.chunk_size,
+        workers=args.workers,
+        near_duplicate_threshold=args.near_dup_threshold,
+        incremental=args.incremental
+    )
+    profile = cProfile.Profile() if args.profile else None
+    if profile is not None:
+        profile.enable()
     processor.process_data()
     processor.save_processed_data()
+    if profile is not None:
+        profile.disable()
+        profile.dump_stats(args.profile)
+        logger.info(f"Profile written to {args.profile}; inspect it with python -m pstats {args.profile}")
     
+    logger.info("Stage timings:\n" + processor.profiler.format_table())
     logger.info("DATA PROCESSING COMPLETE")
     logger.info(f"Processed {processor.stats['final_count']} conversations")
     logger.info(f"Average quality score: {processor.stats['avg_quality_score']:.1f}")
@@ -0,0 +1,149 @@
+import os
+from abc import ABC, abstractmethod
+from typing import Dict, List, Optional
+
+import numpy as np
+from openai import OpenAI
+
+from .retry import RetryPolicy
+
+LOCAL_MODEL_PREFIX = "local"
+
+# Output width of the OpenAI models; text-embedding-3 models can return
+# fewer dimensions on request, ada-002 cannot
+NATIVE_DIMENSIONS = {
+    "text-embedding-3-small": 1536,
+    "text-embedding-3-large": 3072,
+    "text-embedding-ada-002": 1536,
+}
+
+
+def dimension_options(model: str, dimension: int) -> Dict:
+    """Extra embeddings.create arguments that shorten vectors to dimension."""
+    native = NATIVE_DIMENSIONS.get(model)
+    if native is None or dimension == native:
+        return {}
+    if not model.startswith("text-embedding-3") or dimension > native:
+        raise ValueError(f"{model} cannot return {dimension}-dimensional embeddings")
+    # The pinned client predates the dimensions argument, so send it raw
+    return {"extra_body": {"dimensions": dimension}}
+
+
+class EmbeddingBackend(ABC):
+    """Turns texts into fixed-size embedding vectors.
+
+    remote backends call a provider over the network, so ingestion batches
+    and rate-limits their requests; local ones are only CPU bound.
+    """
+
+    model: str
+    dimension: int
+    remote = True
+
+    @abstractmethod
+    def embed(
+        self, texts: List[str], retry: Optional[RetryPolicy] = None
+    ) -> List[List[float]]:
+        """One embedding per text, in order.
+
+        retry overrides the backend's retry policy for this call, e.g. a
+        shorter one for requests someone is waiting on.
+        """
+
+
+class OpenAIEmbeddingBackend(EmbeddingBackend):
+    """Embeddings from the OpenAI API, with retries for transient errors."""
+
+    def __init__(
+        self,
+        model: str,
+        dimension: int,
+        client: Optional[OpenAI] = None,
+        retry: Optional[RetryPolicy] = None,
+    ):
+        self.model = model
+        self.dimension = dimension
+        # Retries go through self.retry, with jittered exponential backoff
+        self.client = client or OpenAI(
+            api_key=os.getenv("OPENAI_API_KEY"), max_retries=0
+        )
+        self.retry = retry or RetryPolicy()
+        self.options = dimension_options(model, dimension)
+
+    def embed(
+        self, texts: List[str], retry: Optional[RetryPolicy] = None
+    ) -> List[List[float]]:
+        response = (retry or self.retry).call(
+            self.client.embeddings.create,
+            input=texts,
+            model=self.model,
+            **self.options,
+        )
+        return [data.embedding for data in response.data]
+
+
+class LocalHashingEmbeddingBackend(EmbeddingBackend):
+    """Offline embeddings: hashed word n-grams, randomly projected.
+
+    Texts are hashed into n_features term counts and projected to
+    dimension with a sparse random projection: each hashed term adds
+    +-1 to nonzeros_per_term output dimensions chosen with seed. Vectors
+    are scaled to unit length. Nothing is fitted on the corpus, so
+    ingestion and search produce comparable vectors in any process
+    without a saved model. Quality is lexical, well below a neural model,
+    but good enough for offline tests and load benchmarks.
+    """
+
+    remote = False
+
+    def __init__(
+        self,
+        model: str = "local-hashing",
+        dimension: int = 1536,
+        n_features: int = 2**17,
+        nonzeros_per_term: int = 16,
+        seed: int = 0,
+    ):
+        from scipy import sparse
+        from sklearn.feature_extraction.text import HashingVectorizer
+
+        self.model = model
+        self.dimension = dimension
+        self.vectorizer = HashingVectorizer(
+            n_features=n_features,
+            ngram_range=(1, 2),
+            alternate_sign=False,
+            norm="l2",
+        )
+        # One row per hashed term; building it directly takes milliseconds,
+        # where sklearn's SparseRandomProjection takes seconds to sample
+        rng = np.random.default_rng(seed)
+        columns = rng.integers(0, dimension, n_features * nonzeros_per_term)
+        signs = rng.choice([-1.0, 1.0], n_features * nonzeros_per_term)
+        self.projection = sparse.csr_matrix(
+            (
+                signs,
+                columns,
+                np.arange(0, n_features * nonzeros_per_term + 1, nonzeros_per_term),
+            ),
+            shape=(n_features, dimension),
+        )
+
+    def embed(
+        self, texts: List[str], retry: Optional[RetryPolicy] = None
+    ) -> List[List[float]]:
+        vectors = (self.vectorizer.transform(texts) @ self.projection).toarray()
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        vectors = vectors / np.where(norms == 0, 1, norms)
+        return vectors.astype(np.float32).tolist()
+
+
+def backend_from_env(
+    model: Optional[str] = None, dimension: Optional[int] = None
+) -> EmbeddingBackend:
+    """Pick the backend for EMBEDDING_MODEL; names starting with "local" run offline."""
+    model = model or os.getenv("EMBEDDING_MODEL", "text-embedding-3-small")
+    dimension = dimension or int(os.getenv("EMBEDDING_DIMENSION", "1536"))
+    if model.startswith(LOCAL_MODEL_PREFIX):
+        return LocalHashingEmbeddingBackend(model, dimension)
+    return OpenAIEmbeddingBackend(model, dimension)
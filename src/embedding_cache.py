@@ -0,0 +1,171 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+
+def cache_key(model: str, dimension: int, text: str) -> str:
+    """Content address of one embedding: model, dimension and text hash."""
+    digest = hashlib.sha256(text.encode("utf-8")).hexdigest()
+    return f"{model}:{dimension}:{digest}"
+
+
+class EmbeddingCache:
+    """On-disk embedding cache backed by SQLite.
+
+    Vectors are stored as float32 blobs, the precision pgvector keeps
+    anyway. When the stored vectors exceed max_bytes, the least recently
+    used entries are evicted down to 90% of the limit. The stored size is
+    summed once on open and kept as a running total after that. Pipeline
+    threads share one connection, so every use of it holds a lock.
+    """
+
+    def __init__(self, path: str, max_bytes: int = 1024 * 1024 * 1024):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS embeddings (
+                key TEXT PRIMARY KEY,
+                embedding BLOB NOT NULL,
+                size INTEGER NOT NULL,
+                last_access REAL NOT NULL
+            )
+            """)
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS ix_embeddings_last_access ON embeddings (last_access)"
+        )
+        self._conn.commit()
+        self._lock = threading.Lock()
+        self._size_bytes = self._conn.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM embeddings"
+        ).fetchone()[0]
+
+    def _select(self, columns: str, keys: Sequence[str]) -> Dict:
+        found = {}
+        # Stay below SQLite's default limit of 999 bound parameters
+        for start in range(0, len(keys), 900):
+            batch = keys[start : start + 900]
+            placeholders = ",".join("?" * len(batch))
+            found.update(
+                self._conn.execute(
+                    f"SELECT key, {columns} FROM embeddings WHERE key IN ({placeholders})",
+                    batch,
+                )
+            )
+        return found
+
+    def get_many(
+        self, model: str, dimension: int, texts: Sequence[str]
+    ) -> List[Optional[List[float]]]:
+        """Return the cached embedding of each text, or None for misses."""
+        keys = [cache_key(model, dimension, text) for text in texts]
+        with self._lock:
+            found = self._select("embedding", keys)
+            if found:
+                now = time.time()
+                self._conn.executemany(
+                    "UPDATE embeddings SET last_access = ? WHERE key = ?",
+                    [(now, key) for key in found],
+                )
+                self._conn.commit()
+            self.hits += sum(key in found for key in keys)
+            self.misses += sum(key not in found for key in keys)
+
+        return [
+            (
+                np.frombuffer(found[key], dtype=np.float32).tolist()
+                if key in found
+                else None
+            )
+            for key in keys
+        ]
+
+    def put_many(
+        self,
+        model: str,
+        dimension: int,
+        texts: Sequence[str],
+        embeddings: Sequence[Sequence[float]],
+    ):
+        now = time.time()
+        rows = {}
+        for text, embedding in zip(texts, embeddings):
+            blob = np.asarray(embedding, dtype=np.float32).tobytes()
+            key = cache_key(model, dimension, text)
+            rows[key] = (key, blob, len(blob), now)
+
+        with self._lock:
+            replaced = self._select("size", list(rows))
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, embedding, size, last_access) VALUES (?, ?, ?, ?)",
+                rows.values(),
+            )
+            self._conn.commit()
+            self._size_bytes += sum(
+                size - replaced.get(key, 0) for key, _, size, _ in rows.values()
+            )
+            self._evict()
+
+    def _evict(self):
+        if self._size_bytes <= self.max_bytes:
+            return
+
+        target = self.max_bytes * 0.9
+        evicted = []
+        for key, size in self._conn.execute(
+            "SELECT key, size FROM embeddings ORDER BY last_access"
+        ):
+            if self._size_bytes <= target:
+                break
+            evicted.append((key,))
+            self._size_bytes -= size
+
+        self._conn.executemany("DELETE FROM embeddings WHERE key = ?", evicted)
+        self._conn.commit()
+        self.evictions += len(evicted)
+
+    @property
+    def size_bytes(self) -> int:
+        return self._size_bytes
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+    def stats(self) -> Dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self),
+            "size_bytes": self.size_bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+        }
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def cache_from_env() -> Optional[EmbeddingCache]:
+    """Build the cache configured by EMBEDDING_CACHE_PATH; empty disables it."""
+    default_path = Path(__file__).parent.parent / "data" / "cache" / "embeddings.sqlite"
+    path = os.getenv("EMBEDDING_CACHE_PATH", str(default_path))
+    if not path:
+        return None
+    max_mb = float(os.getenv("EMBEDDING_CACHE_MAX_MB", "1024"))
+    return EmbeddingCache(path, max_bytes=int(max_mb * 1024 * 1024))
@@ -1,33 +1,145 @@
-import pandas as pd
-from openai import OpenAI
-from typing import List, Dict, Optional
+import argparse
+import asyncio
+from functools import partial
+from datetime import datetime
+from typing import Dict, Iterator, List, Optional, Set, Tuple
 import os
+import shutil
 from pathlib import Path
 import logging
+import numpy as np
 from dotenv import load_dotenv
-from .database import SessionLocal, Conversation, init_db
-from sqlalchemy import func, distinct
+from .database import (
+    EMBEDDING_STORAGE,
+    SEARCH_MODE,
+    VECTOR_INDEX,
+    SessionLocal,
+    Conversation,
+    IngestionCheckpoint,
+    create_vector_index,
+    drop_vector_index,
+    init_db,
+)
+from .async_embeddings import AsyncEmbeddingGenerator
+from .batch_packer import BatchPacker
+from .bulk_writer import BulkConversationWriter
+from .embedding_backends import (
+    LOCAL_MODEL_PREFIX,
+    EmbeddingBackend,
+    backend_from_env,
+)
+from .embedding_cache import EmbeddingCache, cache_from_env
+from .pipeline import Pipeline
+from .processed_data import iter_processed_batches
+from .ivfpq import INDEX_FILES, IVFPQIndex
+from .query_cache import QueryEmbeddingCache, query_cache_from_env
+from .retry import RetryPolicy
+from .vector_index import (
+    EMBEDDINGS_FILE,
+    METADATA_FILE,
+    METADATA_SCHEMA,
+    NumpyVectorIndex,
+    file_signature,
+    write_index,
+)
+from sqlalchemy import cast, distinct, func, select, text
+from sqlalchemy.dialects.postgresql import BIT
 
 load_dotenv()
 logger = logging.getLogger(__name__)
 
+# numpy and ivfpq search an exported copy, so only these need the pgvector index
+PGVECTOR_SEARCH_MODES = ("ann", "binary")
 
-class OpenAIEmbeddingManager:
-    def __init__(self):
-        self.client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-        self.model = os.getenv("EMBEDDING_MODEL", "text-embedding-3-small")
-        self.dimension = int(os.getenv("EMBEDDING_DIMENSION", "1536"))
 
-    def generate_embeddings(self, texts: List[str]) -> List[List[float]]:
+class OpenAIEmbeddingManager:
+    def __init__(
+        self,
+        cache: Optional[EmbeddingCache] = None,
+        bulk: bool = True,
+        query_cache: Optional[QueryEmbeddingCache] = None,
+        backend: Optional[EmbeddingBackend] = None,
+    ):
+        # EMBEDDING_MODEL picks the backend; "local-*" models run offline
+        self.backend = backend if backend is not None else backend_from_env()
+        self.model = self.backend.model
+        self.dimension = self.backend.dimension
+        # Local embeddings are cheaper to recompute than to look up on disk
+        if self.backend.remote:
+            self.cache = cache if cache is not None else cache_from_env()
+        else:
+            self.cache = None
+        # Search queries repeat often; keep their embeddings in memory
+        self.query_cache = (
+            query_cache if query_cache is not None else query_cache_from_env()
+        )
+        self.query_retry = RetryPolicy(
+            max_retries=int(os.getenv("QUERY_MAX_RETRIES", "2")),
+            base_delay=0.25,
+            max_delay=float(os.getenv("QUERY_RETRY_MAX_DELAY", "1.0")),
+        )
+        self.packer = BatchPacker.from_env(self.model)
+        # Binary COPY by default; bulk=False inserts through ORM objects
+        self.bulk_writer = BulkConversationWriter(EMBEDDING_STORAGE) if bulk else None
+        self.search_mode = SEARCH_MODE
+        # Hamming-distance candidates reranked by cosine in binary search mode
+        self.binary_candidates = int(os.getenv("BINARY_SEARCH_CANDIDATES", "200"))
+        # HNSW candidate list size per query; higher is slower with better recall
+        self.ef_search = int(os.getenv("HNSW_EF_SEARCH", "40"))
+        # Exported embeddings searched in process when SEARCH_MODE is numpy
+        default_index_dir = Path(__file__).parent.parent / "data" / "index"
+        self.index_dir = os.getenv("SEARCH_INDEX_DIR", str(default_index_dir))
+        self._vector_index: Optional[NumpyVectorIndex] = None
+        self._vector_index_signature: Tuple = ()
+        # IVF-PQ lists scanned per query, and candidates reranked exactly
+        self.ivfpq_nprobe = int(os.getenv("IVFPQ_NPROBE", "16"))
+        self.ivfpq_candidates = int(os.getenv("IVFPQ_CANDIDATES", "100"))
+        self._ivfpq_index: Optional[IVFPQIndex] = None
+        self._ivfpq_index_signature: Tuple = ()
+        self.pipeline_stats: Optional[Dict] = None
+        self.upsert_report: Optional[Dict] = None
+        self._existing: Dict = {}
+
+    @property
+    def client(self):
+        """OpenAI client of the remote backend, or None for a local one."""
+        return getattr(self.backend, "client", None)
+
+    @client.setter
+    def client(self, client):
+        if not self.backend.remote:
+            raise ValueError(f"The {self.model} backend runs locally and has no client")
+        self.backend.client = client
+
+    def generate_embeddings(
+        self, texts: List[str], retry: Optional[RetryPolicy] = None
+    ) -> List[List[float]]:
         logger.info(f"Generating embeddings for {len(texts)} texts using {self.model}")
 
         try:
-            response = self.client.embeddings.create(input=texts, model=self.model)
+            texts = [self.packer.fit(text) for text in texts]
+            embeddings = (
+                self.cache.get_many(self.model, self.dimension, texts)
+                if self.cache is not None
+                else [None] * len(texts)
+            )
+            misses = [i for i, embedding in enumerate(embeddings) if embedding is None]
+            if len(misses) < len(texts):
+                logger.info(f"Embedding cache hits: {len(texts) - len(misses)}")
+
+            # Split misses into requests that fit the token budget
+            for indices, miss_texts in self.packer.pack((i, texts[i]) for i in misses):
+                generated = self.backend.embed(miss_texts, retry=retry)
+                for i, embedding in zip(indices, generated):
+                    embeddings[i] = embedding
+                if self.cache is not None:
+                    self.cache.put_many(
+                        self.model, self.dimension, miss_texts, generated
+                    )
 
-            embeddings = [data.embedding for data in response.data]
             actual_dimension = len(embeddings[0]) if embeddings else 0
             logger.info(
-                f"Generated {len(embeddings)} embeddings with dimension {actual_dimension}"
+                f"Generated {len(misses)} embeddings with dimension {actual_dimension}"
             )
             return embeddings
 
@@ -35,59 +147,275 @@ class OpenAIEmbeddingManager:
             logger.error(f"Error generating embeddings: {e}")
             raise
 
-    def load_data_and_store_embeddings(self, data_path: str):
+    @staticmethod
+    def _combined_text(row: Dict) -> str:
+        return f"Context: {row['Context']} Response: {row['Response']}"
+
+    def _packed_batches(
+        self,
+        data_path: str,
+        skip_ids: Set[str] = frozenset(),
+        source_ids: Optional[Set[str]] = None,
+    ) -> Iterator[Tuple[List[Dict], List[str]]]:
+        """Yield (rows, texts to embed) batches that fill the request token budget.
+
+        Rows in skip_ids are left out; the ids of all rows read, skipped or
+        not, are added to source_ids if given.
+        """
+
+        def rows():
+            for batch in iter_processed_batches(data_path, 1000):
+                for row in batch:
+                    if source_ids is not None:
+                        source_ids.add(row["id"])
+                    if row["id"] not in skip_ids:
+                        yield row
+
+        return self.packer.pack((row, self._combined_text(row)) for row in rows())
+
+    def _conversation_values(
+        self, rows: List[Dict], embedded_texts: List[str], embeddings: List[List[float]]
+    ) -> List[Dict]:
+        """Column values of the conversations table for one batch."""
+        combined_texts = [self._combined_text(row) for row in rows]
+        return [
+            dict(
+                context=row["Context"],
+                response=row["Response"],
+                context_length=row["context_length"],
+                response_length=row["response_length"],
+                category=row["category"],
+                quality_score=row["quality_score"],
+                embedding=embedding,
+                content_hash=row["id"],
+                extra_data={
+                    "original_id": row["id"],
+                    "combined_text": combined_text,
+                    "embedding_truncated": embedded_text != combined_text,
+                },
+            )
+            for row, combined_text, embedded_text, embedding in zip(
+                rows, combined_texts, embedded_texts, embeddings
+            )
+        ]
+
+    def _start_ingestion(self, db, resume: bool, upsert: bool = False) -> Set[str]:
+        """Return ids that need no embedding; a plain run clears the table first."""
+        if upsert:
+            self._existing = dict(
+                db.query(Conversation.content_hash, Conversation.deleted_at).filter(
+                    Conversation.content_hash.isnot(None)
+                )
+            )
+            logger.info(f"Upserting: {len(self._existing)} rows already stored")
+            return set(self._existing)
+
+        if not resume:
+            db.query(Conversation).delete()
+            db.query(IngestionCheckpoint).delete()
+            db.commit()
+            # Rebuilt over all rows once the load finishes
+            drop_vector_index()
+            return set()
+
+        done = {row_id for (row_id,) in db.query(IngestionCheckpoint.row_id)}
+        logger.info(f"Resuming: {len(done)} rows already have embeddings")
+        return done
+
+    def _finish_upsert(self, db, source_ids: Set[str], hard_delete: bool) -> Dict:
+        """Restore rows back in the source and retire rows that left it."""
+        restored = [
+            content_hash
+            for content_hash, deleted_at in self._existing.items()
+            if deleted_at is not None and content_hash in source_ids
+        ]
+        retired = [
+            content_hash
+            for content_hash, deleted_at in self._existing.items()
+            if content_hash not in source_ids and (deleted_at is None or hard_delete)
+        ]
+
+        now = datetime.utcnow()
+        for start in range(0, max(len(restored), len(retired)), 1000):
+            restored_chunk = restored[start : start + 1000]
+            retired_chunk = retired[start : start + 1000]
+            db.query(Conversation).filter(
+                Conversation.content_hash.in_(restored_chunk)
+            ).update({Conversation.deleted_at: None}, synchronize_session=False)
+
+            retired_rows = db.query(Conversation).filter(
+                Conversation.content_hash.in_(retired_chunk)
+            )
+            if hard_delete:
+                retired_rows.delete(synchronize_session=False)
+                db.query(IngestionCheckpoint).filter(
+                    IngestionCheckpoint.row_id.in_(retired_chunk)
+                ).delete(synchronize_session=False)
+            else:
+                retired_rows.update(
+                    {Conversation.deleted_at: now}, synchronize_session=False
+                )
+        db.commit()
+
+        report = {
+            "unchanged": len(source_ids & set(self._existing)) - len(restored),
+            "restored": len(restored),
+            "deleted" if hard_delete else "soft_deleted": len(retired),
+        }
+        logger.info(f"Upsert: {report}")
+        return report
+
+    def _store_batch(
+        self,
+        db,
+        rows: List[Dict],
+        texts: List[str],
+        embeddings: List[List[float]],
+        batch_number: int,
+    ):
+        """Add one batch and its checkpoints; they are committed together."""
+        conversations = self._conversation_values(rows, texts, embeddings)
+        if self.bulk_writer is not None:
+            self.bulk_writer.write(
+                db, conversations, [row["id"] for row in rows], batch_number
+            )
+            return
+
+        db.add_all(Conversation(**values) for values in conversations)
+        db.add_all(
+            IngestionCheckpoint(row_id=row["id"], batch_number=batch_number)
+            for row in rows
+        )
+
+    def _embed_batch(self, batch: Tuple) -> Tuple:
+        batch_number, rows, texts = batch
+        return batch_number, rows, texts, self.generate_embeddings(texts)
+
+    def _write_batch(self, db, batch: Tuple):
+        batch_number, rows, texts, embeddings = batch
+        self._store_batch(db, rows, texts, embeddings, batch_number)
+        db.commit()
+        logger.info(f"Processed batch {batch_number} ({len(rows)} rows)")
+
+    def load_data_and_store_embeddings(
+        self,
+        data_path: str,
+        resume: bool = False,
+        upsert: bool = False,
+        hard_delete: bool = False,
+    ):
+        """Embed and store processed rows.
+
+        By default the table is cleared first. resume skips rows that have a
+        checkpoint. upsert keys on content_hash: new rows are embedded and
+        inserted, stored rows are left alone, and rows no longer in the
+        source are soft-deleted (or deleted, with hard_delete).
+        """
         logger.info(f"Loading data from {data_path}")
-        df = pd.read_csv(data_path)
 
         init_db()
 
         db = SessionLocal()
         try:
-            db.query(Conversation).delete()
-            db.commit()
+            done = self._start_ingestion(db, resume, upsert)
+            source_ids = set()
+
+            # Reading, embedding and writing overlap in separate threads
+            batches = (
+                (batch_number, rows, texts)
+                for batch_number, (rows, texts) in enumerate(
+                    self._packed_batches(data_path, done, source_ids), start=1
+                )
+            )
+            pipeline = Pipeline(
+                ("read", batches),
+                [("embed", self._embed_batch)],
+                ("write", partial(self._write_batch, db)),
+                queue_size=int(os.getenv("EMBEDDING_PIPELINE_QUEUE_SIZE", "4")),
+                rows=lambda batch: len(batch[1]),
+            )
+            self.pipeline_stats = pipeline.run()
+            if upsert:
+                self.upsert_report = self._finish_upsert(db, source_ids, hard_delete)
+            if self.search_mode in PGVECTOR_SEARCH_MODES:
+                create_vector_index()
 
-            batch_size = 100
-            total_rows = len(df)
+            total_stored = db.query(Conversation).count()
+            logger.info(
+                f"Successfully stored {total_stored} conversations with embeddings "
+                f"({self.packer.truncated_count} truncated to the model limit)"
+            )
 
-            for i in range(0, total_rows, batch_size):
-                batch_df = df.iloc[i : i + batch_size]
+        except Exception as e:
+            db.rollback()
+            logger.error(f"Error storing embeddings: {e}")
+            raise
+        finally:
+            db.close()
 
-                combined_texts = []
-                for _, row in batch_df.iterrows():
-                    combined_text = (
-                        f"Context: {row['Context']} Response: {row['Response']}"
-                    )
-                    combined_texts.append(combined_text)
-
-                embeddings = self.generate_embeddings(combined_texts)
-
-                conversations = []
-                for j, (_, row) in enumerate(batch_df.iterrows()):
-                    conversation = Conversation(
-                        context=row["Context"],
-                        response=row["Response"],
-                        context_length=row["context_length"],
-                        response_length=row["response_length"],
-                        category=row["category"],
-                        quality_score=row["quality_score"],
-                        embedding=embeddings[j],
-                        extra_data={
-                            "original_id": int(row["id"]),
-                            "combined_text": combined_texts[j],
-                        },
-                    )
-                    conversations.append(conversation)
+    def load_data_and_store_embeddings_async(
+        self,
+        data_path: str,
+        resume: bool = False,
+        upsert: bool = False,
+        hard_delete: bool = False,
+    ):
+        """Like load_data_and_store_embeddings, with many batches in flight at once."""
+        if not self.backend.remote:
+            logger.info(f"{self.model} runs locally; ingesting without concurrency")
+            self.load_data_and_store_embeddings(data_path, resume, upsert, hard_delete)
+            return
+        asyncio.run(
+            self._load_data_and_store_embeddings_async(
+                data_path, resume, upsert, hard_delete
+            )
+        )
 
-                db.add_all(conversations)
-                db.commit()
+    async def _load_data_and_store_embeddings_async(
+        self, data_path: str, resume: bool, upsert: bool, hard_delete: bool
+    ):
+        logger.info(f"Loading data from {data_path}")
+
+        init_db()
+
+        generator = AsyncEmbeddingGenerator.from_env(
+            self.model, self.dimension, cache=self.cache, packer=self.packer
+        )
+        db = SessionLocal()
+        try:
+            done = self._start_ingestion(db, resume, upsert)
+            source_ids = set()
+            batches = (
+                ((batch_number, rows, texts), texts)
+                for batch_number, (rows, texts) in enumerate(
+                    self._packed_batches(data_path, done, source_ids), start=1
+                )
+            )
 
+            stored = 0
+            async for (
+                batch_number,
+                rows,
+                texts,
+            ), embeddings in generator.embed_batches(batches):
+                self._store_batch(db, rows, texts, embeddings, batch_number)
+                # Commit off the event loop so in-flight requests keep flowing
+                await asyncio.to_thread(db.commit)
+                stored += len(rows)
                 logger.info(
-                    f"Processed batch {i//batch_size + 1}/{(total_rows-1)//batch_size + 1}"
+                    f"Stored {stored} conversations "
+                    f"(concurrency {int(generator.limiter.limit)}, "
+                    f"{generator.rate_limited} rate limited)"
                 )
+            if upsert:
+                self.upsert_report = self._finish_upsert(db, source_ids, hard_delete)
+            if self.search_mode in PGVECTOR_SEARCH_MODES:
+                create_vector_index()
 
             total_stored = db.query(Conversation).count()
             logger.info(
-                f"Successfully stored {total_stored} conversations with embeddings"
+                f"Successfully stored {total_stored} conversations with embeddings "
+                f"({self.packer.truncated_count} truncated to the model limit)"
             )
 
         except Exception as e:
@@ -97,18 +425,226 @@ class OpenAIEmbeddingManager:
         finally:
             db.close()
 
+    def reconcile(self, data_path: str) -> Dict:
+        """Check that every processed row has a stored embedding."""
+        source_ids = {
+            row["id"]
+            for batch in iter_processed_batches(data_path, 10_000)
+            for row in batch
+        }
+
+        db = SessionLocal()
+        try:
+            stored_ids = {
+                row_id
+                for (row_id,) in db.query(
+                    Conversation.extra_data["original_id"].astext
+                ).filter(
+                    Conversation.embedding.isnot(None),
+                    Conversation.deleted_at.is_(None),
+                )
+            }
+        finally:
+            db.close()
+
+        missing = sorted(source_ids - stored_ids)
+        report = {
+            "source_rows": len(source_ids),
+            "stored_rows": len(stored_ids),
+            "missing_count": len(missing),
+            "missing_ids": missing[:20],
+            "unexpected_count": len(stored_ids - source_ids),
+        }
+        if missing:
+            logger.error(
+                f"{len(missing)} of {len(source_ids)} rows have no embedding; "
+                f"rerun with --resume to fill them in"
+            )
+        else:
+            logger.info(f"All {len(source_ids)} rows have embeddings")
+        return report
+
+    def embed_query(self, query: str) -> List[float]:
+        """Embed a search query, served from the query cache when possible.
+
+        Uses query_retry, so a provider outage fails a search in seconds
+        rather than holding the request through the ingestion backoff.
+        """
+        if self.query_cache is None:
+            return self.generate_embeddings([query], retry=self.query_retry)[0]
+        embedding = self.query_cache.get(self.model, query)
+        if embedding is None:
+            embedding = self.generate_embeddings([query], retry=self.query_retry)[0]
+            self.query_cache.put(self.model, query, embedding)
+        return embedding
+
+    @property
+    def vector_index(self) -> NumpyVectorIndex:
+        """The exported index, memory-mapped on first use.
+
+        Mapped again when another process (python -m src.vector_index)
+        has re-exported it since.
+        """
+        signature = file_signature(
+            Path(self.index_dir) / name for name in (EMBEDDINGS_FILE, METADATA_FILE)
+        )
+        if self._vector_index is None or signature != self._vector_index_signature:
+            self._vector_index = NumpyVectorIndex(self.index_dir)
+            self._vector_index_signature = signature
+            logger.info(
+                f"Loaded {len(self._vector_index)} embeddings from {self.index_dir}"
+            )
+        return self._vector_index
+
+    @property
+    def ivfpq_index(self) -> IVFPQIndex:
+        directory = Path(self.index_dir) / "ivfpq"
+        signature = file_signature(directory / f"{name}.npy" for name in INDEX_FILES)
+        if self._ivfpq_index is None or signature != self._ivfpq_index_signature:
+            self._ivfpq_index = IVFPQIndex.load(str(directory))
+            self._ivfpq_index_signature = signature
+        return self._ivfpq_index
+
+    def export_index(self, directory: Optional[str] = None) -> int:
+        """Copy live embeddings and metadata from the database for numpy search.
+
+        With SEARCH_MODE=ivfpq an IVF-PQ index over the copy is built too,
+        unless there are no live rows to train it on.
+        """
+        directory = directory or self.index_dir
+        db = SessionLocal()
+        try:
+            # One snapshot for the row count and the rows themselves
+            db.connection(execution_options={"isolation_level": "REPEATABLE READ"})
+            live = (
+                Conversation.embedding.isnot(None),
+                Conversation.deleted_at.is_(None),
+            )
+            rows = db.query(func.count(Conversation.id)).filter(*live).scalar()
+            query = (
+                db.query(
+                    Conversation.id,
+                    Conversation.context,
+                    Conversation.response,
+                    Conversation.category,
+                    Conversation.quality_score,
+                    Conversation.context_length,
+                    Conversation.response_length,
+                    Conversation.extra_data,
+                    Conversation.embedding,
+                )
+                .filter(*live)
+                .order_by(Conversation.id)
+                .execution_options(yield_per=5000)
+            )
+
+            def batches():
+                for partition in query.partitions():
+                    yield (
+                        [
+                            {
+                                name: (
+                                    str(row.id) if name == "id" else getattr(row, name)
+                                )
+                                for name in METADATA_SCHEMA.names
+                            }
+                            for row in partition
+                        ],
+                        np.array([row.embedding for row in partition]),
+                    )
+
+            written = write_index(directory, rows, self.dimension, batches())
+        finally:
+            db.close()
+
+        self._vector_index = None
+        self._ivfpq_index = None
+        if self.search_mode == "ivfpq" and not written:
+            # Nothing to train on; drop any index left over from older rows
+            shutil.rmtree(Path(directory) / "ivfpq", ignore_errors=True)
+        elif self.search_mode == "ivfpq":
+            IVFPQIndex.build(
+                NumpyVectorIndex(directory).embeddings,
+                str(Path(directory) / "ivfpq"),
+                nlist=int(os.getenv("IVFPQ_NLIST", "0")) or None,
+                m=int(os.getenv("IVFPQ_M", "0")) or None,
+            )
+        return written
+
+    def _binary_candidates(
+        self, query_embedding: List[float], category_filter: Optional[str]
+    ):
+        """Nearest rows by Hamming distance between sign-bit embeddings.
+
+        Materialized so the cosine rerank runs over exactly these rows
+        rather than being planned through the ivfflat index.
+        """
+        bits = BIT(self.dimension)
+        distance = cast(func.binary_quantize(Conversation.embedding), bits).op("<~>")(
+            cast(
+                func.binary_quantize(
+                    cast(query_embedding, Conversation.embedding.type)
+                ),
+                bits,
+            )
+        )
+        candidates = select(Conversation.id).where(Conversation.deleted_at.is_(None))
+        if category_filter:
+            candidates = candidates.where(Conversation.category == category_filter)
+        return (
+            candidates.order_by(distance)
+            .limit(self.binary_candidates)
+            .cte("binary_candidates")
+            .prefix_with("MATERIALIZED")
+        )
+
     def search_similar(
         self,
         query: str,
         top_k: int = 5,
         min_similarity: float = 0.7,
         category_filter: Optional[str] = None,
+        mode: Optional[str] = None,
+        min_quality: Optional[float] = None,
+        nprobe: Optional[int] = None,
+        ef_search: Optional[int] = None,
     ) -> List[Dict]:
+        """Return the top_k live conversations most similar to query.
+
+        mode overrides SEARCH_MODE: "ann" orders by cosine distance through
+        the vector index (ef_search overrides HNSW_EF_SEARCH), "binary"
+        reranks binary-quantized candidates, "numpy" scans the exported
+        index in process and "ivfpq" reranks IVF-PQ candidates from it
+        (nprobe overrides IVFPQ_NPROBE).
+        """
         try:
-            query_embedding = self.generate_embeddings([query])[0]
+            query_embedding = self.embed_query(query)
+            mode = mode or self.search_mode
+            if mode == "numpy":
+                return self.vector_index.search(
+                    query_embedding, top_k, min_similarity, category_filter, min_quality
+                )
+            if mode == "ivfpq":
+                index = self.vector_index
+                if not len(index):
+                    return []
+                rows, _ = self.ivfpq_index.search(
+                    index.normalized(query_embedding),
+                    max(top_k, self.ivfpq_candidates),
+                    nprobe or self.ivfpq_nprobe,
+                    mask=index.filter_mask(category_filter, min_quality),
+                )
+                return index.search(query_embedding, top_k, min_similarity, rows=rows)
 
             db = SessionLocal()
             try:
+                ef_search = ef_search or self.ef_search
+                if mode == "binary":
+                    # An HNSW scan returns at most ef_search rows
+                    ef_search = max(ef_search, self.binary_candidates)
+                if mode == "binary" or VECTOR_INDEX == "hnsw":
+                    db.execute(text(f"SET LOCAL hnsw.ef_search = {int(ef_search)}"))
+
                 query_obj = db.query(
                     Conversation.id,
                     Conversation.context,
@@ -123,7 +659,8 @@ class OpenAIEmbeddingManager:
                     ),
                 ).filter(
                     (1 - Conversation.embedding.cosine_distance(query_embedding))
-                    > min_similarity
+                    > min_similarity,
+                    Conversation.deleted_at.is_(None),
                 )
 
                 if category_filter:
@@ -131,6 +668,19 @@ class OpenAIEmbeddingManager:
                         Conversation.category == category_filter
                     )
 
+                if min_quality is not None:
+                    query_obj = query_obj.filter(
+                        Conversation.quality_score >= min_quality
+                    )
+
+                if mode == "binary":
+                    candidates = self._binary_candidates(
+                        query_embedding, category_filter
+                    )
+                    query_obj = query_obj.join(
+                        candidates, candidates.c.id == Conversation.id
+                    )
+
                 query_obj = query_obj.order_by(
                     Conversation.embedding.cosine_distance(query_embedding)
                 ).limit(top_k)
@@ -168,25 +718,37 @@ class OpenAIEmbeddingManager:
         db = SessionLocal()
         try:
 
-            total_conversations = db.query(func.count(Conversation.id)).scalar()
-            categories = db.query(distinct(Conversation.category)).all()
-            avg_context_length = db.query(
-                func.avg(Conversation.context_length)
-            ).scalar()
-            avg_response_length = db.query(
-                func.avg(Conversation.response_length)
-            ).scalar()
-            avg_quality_score = db.query(func.avg(Conversation.quality_score)).scalar()
+            live = Conversation.deleted_at.is_(None)
+            total_conversations = (
+                db.query(func.count(Conversation.id)).filter(live).scalar()
+            )
+            categories = db.query(distinct(Conversation.category)).filter(live).all()
+            avg_context_length = (
+                db.query(func.avg(Conversation.context_length)).filter(live).scalar()
+            )
+            avg_response_length = (
+                db.query(func.avg(Conversation.response_length)).filter(live).scalar()
+            )
+            avg_quality_score = (
+                db.query(func.avg(Conversation.quality_score)).filter(live).scalar()
+            )
 
             return {
                 "status": "loaded",
                 "total_conversations": total_conversations or 0,
-                "embedding_dimension": 1536,
+                "embedding_dimension": self.dimension,
+                "embedding_storage": EMBEDDING_STORAGE,
                 "embedding_model": self.model,
                 "categories": [cat[0] for cat in categories if cat[0]],
                 "avg_context_length": float(avg_context_length or 0),
                 "avg_response_length": float(avg_response_length or 0),
                 "avg_quality_score": float(avg_quality_score or 0),
+                "embedding_cache": (
+                    self.cache.stats() if self.cache is not None else None
+                ),
+                "query_cache": (
+                    self.query_cache.stats() if self.query_cache is not None else None
+                ),
             }
 
         except Exception as e:
@@ -197,23 +759,81 @@ class OpenAIEmbeddingManager:
 
 
 def main():
-    base_dir = Path(__file__).parent.parent
-    data_path = base_dir / "data" / "processed" / "cleaned_conversations.csv"
+    parser = argparse.ArgumentParser(description="Embed processed conversations")
+    parser.add_argument(
+        "--concurrent",
+        action="store_true",
+        help="Keep several embedding requests in flight (see EMBEDDING_MAX_* in .env)",
+    )
+    parser.add_argument(
+        "--orm",
+        action="store_true",
+        help="Insert rows through ORM objects instead of binary COPY",
+    )
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="Keep stored embeddings and only embed rows not yet checkpointed",
+    )
+    parser.add_argument(
+        "--upsert",
+        action="store_true",
+        help="Embed only rows whose content hash is new and soft-delete rows gone from the source",
+    )
+    parser.add_argument(
+        "--hard-delete",
+        action="store_true",
+        help="With --upsert, delete rows gone from the source instead of soft-deleting them",
+    )
+    parser.add_argument(
+        "--reindex",
+        action="store_true",
+        help="Only rebuild the vector index if it is missing, outdated or has drifted (see INDEX_REBUILD_DRIFT)",
+    )
+    parser.add_argument(
+        "--force",
+        action="store_true",
+        help="With --reindex, rebuild the vector index even if it is up to date",
+    )
+    args = parser.parse_args()
+
+    if args.reindex:
+        report = create_vector_index(force=args.force)
+        logger.info(f"Vector index: {report}")
+        return
 
-    if not data_path.exists():
-        logger.error(f"Processed data not found at {data_path}")
+    base_dir = Path(__file__).parent.parent
+    processed_dir = base_dir / "data" / "processed"
+    candidates = [
+        processed_dir / f"cleaned_conversations.{suffix}"
+        for suffix in ("arrow", "parquet", "csv")
+    ]
+    data_path = next((path for path in candidates if path.exists()), None)
+
+    if data_path is None:
+        logger.error(f"Processed data not found in {processed_dir}")
         logger.error("Please run data_processor.py first")
         return
 
-    if (
+    local = os.getenv("EMBEDDING_MODEL", "").startswith(LOCAL_MODEL_PREFIX)
+    if not local and (
         not os.getenv("OPENAI_API_KEY")
         or os.getenv("OPENAI_API_KEY") == "your_openai_api_key_here"
     ):
         logger.error("Please set your OPENAI_API_KEY in the .env file")
         return
 
-    embedding_manager = OpenAIEmbeddingManager()
-    embedding_manager.load_data_and_store_embeddings(str(data_path))
+    embedding_manager = OpenAIEmbeddingManager(bulk=not args.orm)
+    options = dict(resume=args.resume, upsert=args.upsert, hard_delete=args.hard_delete)
+    if args.concurrent:
+        embedding_manager.load_data_and_store_embeddings_async(
+            str(data_path), **options
+        )
+    else:
+        embedding_manager.load_data_and_store_embeddings(str(data_path), **options)
+    report = embedding_manager.reconcile(str(data_path))
+    if embedding_manager.search_mode in ("numpy", "ivfpq"):
+        embedding_manager.export_index()
 
     stats = embedding_manager.get_stats()
     logger.info("EMBEDDINGS GENERATION COMPLETE")
@@ -221,6 +841,10 @@ def main():
     logger.info(f"Embedding dimension: {stats['embedding_dimension']}")
     logger.info(f"Model used: {stats['embedding_model']}")
     logger.info(f"Categories: {', '.join(stats['categories'])}")
+    if stats["embedding_cache"]:
+        logger.info(f"Embedding cache: {stats['embedding_cache']}")
+    if report["missing_count"]:
+        raise SystemExit(1)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,271 @@
+import logging
+import math
+import os
+from pathlib import Path
+from typing import Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Codewords per subquantizer; codes are one uint8 per subspace
+PQ_CENTROIDS = 256
+
+INDEX_FILES = ("centroids", "codebooks", "list_offsets", "list_rows", "codes")
+
+
+def default_subquantizers(dimension: int) -> int:
+    """Largest divisor of dimension that is at most one per 16 dimensions."""
+    limit = max(1, dimension // 16)
+    return next(m for m in range(limit, 0, -1) if dimension % m == 0)
+
+
+def nearest_centroids(
+    vectors: np.ndarray, centroids: np.ndarray, chunk_size: int = 8192
+) -> np.ndarray:
+    """Index of the nearest centroid (squared L2) for each vector."""
+    squared_norms = np.einsum("ij,ij->i", centroids, centroids)
+    assignments = np.empty(len(vectors), dtype=np.int32)
+    for start in range(0, len(vectors), chunk_size):
+        chunk = vectors[start : start + chunk_size]
+        # ||x - c||^2 = ||x||^2 - 2 x.c + ||c||^2, and ||x||^2 is constant per row
+        distances = squared_norms - 2 * (chunk @ centroids.T)
+        assignments[start : start + chunk_size] = distances.argmin(axis=1)
+    return assignments
+
+
+def minibatch_kmeans(
+    data: np.ndarray,
+    k: int,
+    iterations: int = 50,
+    batch_size: int = 4096,
+    seed: int = 0,
+) -> np.ndarray:
+    """Mini-batch k-means: each centroid moves toward the mean of its batch
+    members at a rate of (batch members / all members seen so far).
+    """
+    rng = np.random.default_rng(seed)
+    if len(data) < k:
+        raise ValueError(f"Need at least {k} training vectors, got {len(data)}")
+    centroids = np.array(
+        data[np.sort(rng.choice(len(data), k, replace=False))], dtype=np.float32
+    )
+    counts = np.zeros(k)
+    for _ in range(iterations):
+        sample = np.sort(
+            rng.choice(len(data), min(batch_size, len(data)), replace=False)
+        )
+        batch = np.asarray(data[sample], dtype=np.float32)
+        assignments = nearest_centroids(batch, centroids)
+
+        order = np.argsort(assignments, kind="stable")
+        touched, starts, sizes = np.unique(
+            assignments[order], return_index=True, return_counts=True
+        )
+        means = np.add.reduceat(batch[order], starts) / sizes[:, None]
+        counts[touched] += sizes
+        rate = (sizes / counts[touched])[:, None].astype(np.float32)
+        centroids[touched] += rate * (means - centroids[touched])
+    return centroids
+
+
+class IVFPQIndex:
+    """Inverted file with product quantization, for inner-product search.
+
+    Vectors are assigned to the nearest of nlist coarse centroids; the
+    residual is split into m subvectors, each replaced by the nearest of
+    256 codewords, so a row costs m bytes. Codes are stored grouped by
+    list, with list_rows mapping them back to row numbers of the source
+    matrix. A query scans the nprobe closest lists and scores each code
+    with a per-query lookup table (asymmetric distance computation):
+    q.x ~ q.centroid + sum over subspaces of q_j.codeword_j.
+    """
+
+    def __init__(
+        self,
+        centroids: np.ndarray,
+        codebooks: np.ndarray,
+        list_offsets: np.ndarray,
+        list_rows: np.ndarray,
+        codes: np.ndarray,
+    ):
+        self.centroids = centroids
+        self.codebooks = codebooks
+        self.list_offsets = list_offsets
+        self.list_rows = list_rows
+        self.codes = codes
+
+    @property
+    def nlist(self) -> int:
+        return len(self.centroids)
+
+    @property
+    def m(self) -> int:
+        return len(self.codebooks)
+
+    def __len__(self) -> int:
+        return len(self.codes)
+
+    @classmethod
+    def build(
+        cls,
+        vectors: np.ndarray,
+        directory: str,
+        nlist: Optional[int] = None,
+        m: Optional[int] = None,
+        train_size: int = 100_000,
+        chunk_size: int = 50_000,
+        seed: int = 0,
+    ) -> "IVFPQIndex":
+        """Train on a sample of vectors, encode all of them and save to directory.
+
+        vectors may be a memory-mapped matrix; it is read in chunks and the
+        codes are written through memory-mapped files. nlist defaults to
+        4 * sqrt(rows) and m to about one byte per 16 dimensions, rounded
+        down to a divisor of the dimension.
+        """
+        rows, dimension = vectors.shape
+        nlist = nlist or max(1, min(rows // 39, int(4 * math.sqrt(rows))))
+        m = m or default_subquantizers(dimension)
+        if dimension % m:
+            raise ValueError(f"m={m} must divide the dimension {dimension}")
+        subdimension = dimension // m
+
+        rng = np.random.default_rng(seed)
+        sample = np.sort(rng.choice(rows, min(train_size, rows), replace=False))
+        training = np.asarray(vectors[sample], dtype=np.float32)
+        logger.info(
+            f"Training {nlist} lists and {m} subquantizers on {len(training)} vectors"
+        )
+        centroids = minibatch_kmeans(training, nlist, seed=seed)
+        residuals = training - centroids[nearest_centroids(training, centroids)]
+        codebooks = np.stack(
+            [
+                minibatch_kmeans(
+                    residuals[:, j * subdimension : (j + 1) * subdimension],
+                    min(PQ_CENTROIDS, len(residuals)),
+                    seed=seed + j,
+                )
+                for j in range(m)
+            ]
+        )
+
+        os.makedirs(directory, exist_ok=True)
+        partial = {
+            name: str(Path(directory) / f"{name}.npy.partial") for name in INDEX_FILES
+        }
+        assignments = np.empty(rows, dtype=np.int32)
+        unsorted_codes = np.lib.format.open_memmap(
+            str(Path(directory) / "unsorted_codes.npy.partial"),
+            mode="w+",
+            dtype=np.uint8,
+            shape=(rows, m),
+        )
+        for start in range(0, rows, chunk_size):
+            chunk = np.asarray(vectors[start : start + chunk_size], dtype=np.float32)
+            lists = nearest_centroids(chunk, centroids)
+            assignments[start : start + len(chunk)] = lists
+            unsorted_codes[start : start + len(chunk)] = cls._encode(
+                chunk - centroids[lists], codebooks
+            )
+
+        list_rows = np.argsort(assignments, kind="stable").astype(np.int64)
+        list_offsets = np.concatenate(
+            [[0], np.cumsum(np.bincount(assignments, minlength=nlist))]
+        ).astype(np.int64)
+        codes = np.lib.format.open_memmap(
+            partial["codes"], mode="w+", dtype=np.uint8, shape=(rows, m)
+        )
+        for start in range(0, rows, chunk_size):
+            codes[start : start + chunk_size] = unsorted_codes[
+                list_rows[start : start + chunk_size]
+            ]
+        codes.flush()
+        del codes, unsorted_codes
+        os.remove(str(Path(directory) / "unsorted_codes.npy.partial"))
+
+        for name, array in (
+            ("centroids", centroids),
+            ("codebooks", codebooks),
+            ("list_offsets", list_offsets),
+            ("list_rows", list_rows),
+        ):
+            with open(partial[name], "wb") as f:
+                np.save(f, array)
+        for name in INDEX_FILES:
+            os.replace(partial[name], Path(directory) / f"{name}.npy")
+        logger.info(
+            f"Wrote IVF-PQ index of {rows} rows ({m} bytes each) to {directory}"
+        )
+        return cls.load(directory)
+
+    @classmethod
+    def load(cls, directory: str) -> "IVFPQIndex":
+        """Open a saved index; codes and row maps stay memory-mapped."""
+        arrays = {
+            name: np.load(Path(directory) / f"{name}.npy", mmap_mode="r")
+            for name in INDEX_FILES
+        }
+        # The small arrays are read on every query, so keep them in memory
+        for name in ("centroids", "codebooks", "list_offsets"):
+            arrays[name] = np.array(arrays[name])
+        return cls(**arrays)
+
+    @staticmethod
+    def _encode(residuals: np.ndarray, codebooks: np.ndarray) -> np.ndarray:
+        m, _, subdimension = codebooks.shape
+        return np.stack(
+            [
+                nearest_centroids(
+                    residuals[:, j * subdimension : (j + 1) * subdimension],
+                    codebooks[j],
+                )
+                for j in range(m)
+            ],
+            axis=1,
+        ).astype(np.uint8)
+
+    def search(
+        self,
+        query: np.ndarray,
+        k: int = 10,
+        nprobe: int = 16,
+        mask: Optional[np.ndarray] = None,
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """Approximate top-k rows by inner product, best first.
+
+        mask, if given, is a boolean array over source rows; rows where it
+        is False are skipped. Returns (row numbers, approximate scores).
+        """
+        query = np.asarray(query, dtype=np.float32)
+        coarse = self.centroids @ query
+        probes = np.argpartition(-coarse, min(nprobe, self.nlist) - 1)[:nprobe]
+
+        spans = [
+            (self.list_offsets[i], self.list_offsets[i + 1], coarse[i]) for i in probes
+        ]
+        positions = np.concatenate(
+            [np.arange(start, end) for start, end, _ in spans] or [np.empty(0, int)]
+        )
+        base = np.concatenate(
+            [np.full(end - start, score, np.float32) for start, end, score in spans]
+            or [np.empty(0, np.float32)]
+        )
+        rows = np.asarray(self.list_rows[positions])
+        if mask is not None:
+            keep = mask[rows]
+            positions, base, rows = positions[keep], base[keep], rows[keep]
+        if not len(rows):
+            return rows, base
+
+        # Lookup table of q_j . codeword for every subspace j and codeword
+        table = np.einsum("jd,jkd->jk", query.reshape(self.m, -1), self.codebooks)
+        codes = np.asarray(self.codes[positions])
+        scores = base + table[np.arange(self.m), codes].sum(axis=1)
+
+        if len(scores) > k:
+            top = np.argpartition(-scores, k)[:k]
+        else:
+            top = np.arange(len(scores))
+        top = top[np.argsort(-scores[top], kind="stable")]
+        return rows[top], scores[top]
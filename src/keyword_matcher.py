@@ -0,0 +1,114 @@
+import re
+from typing import Dict, FrozenSet, List
+
+import pandas as pd
+
+
+def _trie_pattern(keywords: List[str]) -> str:
+    """Build a regex whose alternation is factored into a prefix trie.
+
+    Branches of a trie start with distinct literals, so the regex engine
+    can skip positions that cannot start any keyword, and a greedy optional
+    tail makes the longest keyword win at each position.
+    """
+    trie = {}
+    for keyword in keywords:
+        node = trie
+        for char in keyword:
+            node = node.setdefault(char, {})
+        node[''] = {}
+
+    def build(node: Dict) -> str:
+        branches = [re.escape(char) + build(child) for char, child in sorted(node.items()) if char]
+        if not branches:
+            return ''
+        body = branches[0] if len(branches) == 1 else '(?:' + '|'.join(branches) + ')'
+        return f'(?:{body})?' if '' in node else body
+
+    return build(trie)
+
+
+class KeywordMatcher:
+    """Finds every keyword of every group in a single regex scan.
+
+    Matching has the same semantics as ``keyword in text.lower()`` for each
+    keyword, so it can replace per-keyword substring loops unchanged.
+    """
+
+    def __init__(self, groups: Dict[str, List[str]]):
+        self.groups = {
+            group: [keyword.lower() for keyword in keywords]
+            for group, keywords in groups.items()
+        }
+        keywords = sorted({keyword for keywords in self.groups.values() for keyword in keywords})
+        self.pattern = re.compile(_trie_pattern(keywords))
+
+        # The scan reports the longest keyword starting at each position;
+        # every keyword contained in it is present too, which recovers
+        # nested hits such as worth inside worthless.
+        self._implied = {
+            keyword: frozenset(other for other in keywords if other in keyword)
+            for keyword in keywords
+        }
+        self._best_cache = {}
+
+    def _scan(self, text_lower: str) -> FrozenSet[str]:
+        found = set()
+        search = self.pattern.search
+        match = search(text_lower)
+        while match is not None:
+            found.add(match.group())
+            match = search(text_lower, match.start() + 1)
+        return frozenset(found)
+
+    def _expand(self, found: FrozenSet[str]) -> FrozenSet[str]:
+        if not found:
+            return frozenset()
+        return frozenset().union(*(self._implied[keyword] for keyword in found))
+
+    def find(self, text: str) -> FrozenSet[str]:
+        """Return the set of keywords occurring in text."""
+        return self._expand(self._scan(text.lower()))
+
+    def find_batch(self, texts: pd.Series) -> pd.Series:
+        """Return the set of keywords occurring in each text of a column."""
+        lowered = texts.fillna('').astype(str).str.lower()
+        return pd.Series(
+            [self._expand(self._scan(text)) for text in lowered],
+            index=texts.index, dtype=object
+        )
+
+    def group_counts(self, hits: FrozenSet[str]) -> Dict[str, int]:
+        """Count distinct keyword hits per group, keeping group order."""
+        counts = {}
+        for group, keywords in self.groups.items():
+            count = sum(1 for keyword in keywords if keyword in hits)
+            if count > 0:
+                counts[group] = count
+        return counts
+
+    def matched_groups(self, text: str) -> List[str]:
+        """Return groups with at least one keyword in text, in group order."""
+        return list(self.group_counts(self.find(text)))
+
+    def best_group(self, text: str, default: str) -> str:
+        """Return the group with the most distinct hits; ties go to the first group."""
+        return self._best(self._scan(text.lower()), default)
+
+    def best_group_batch(self, texts: pd.Series, default: str) -> pd.Series:
+        """Vectorized best_group over a whole column."""
+        lowered = texts.fillna('').astype(str).str.lower()
+        return pd.Series(
+            [self._best(self._scan(text), default) for text in lowered],
+            index=texts.index, dtype=object
+        )
+
+    def _best(self, found: FrozenSet[str], default: str) -> str:
+        # Real corpora produce few distinct hit sets, so memoize per set.
+        key = (found, default)
+        best = self._best_cache.get(key)
+        if best is None:
+            counts = self.group_counts(self._expand(found))
+            best = max(counts, key=counts.get) if counts else default
+            self._best_cache[key] = best
+        return best
@@ -1,11 +1,12 @@
 from pydantic import BaseModel, Field
-from typing import List, Optional
+from typing import Dict, List, Optional
 
 class SearchRequest(BaseModel):
     query: str = Field(..., min_length=10)
     top_k: int = Field(default=5, ge=1, le=20)
     min_similarity: float = Field(default=0.3, ge=0.0, le=1.0)
     category_filter: Optional[str] = Field(default=None)
+    ef_search: Optional[int] = Field(default=None, ge=1, le=1000)
 
 class CaseResult(BaseModel):
     similarity: float
@@ -38,13 +39,24 @@ class SystemStats(BaseModel):
     total_conversations: int
     embedding_dimension: int
     embedding_model: str
+    embedding_storage: str = "vector"
     categories: List[str]
     avg_context_length: float
     avg_response_length: float
     avg_quality_score: float
+    embedding_cache: Optional[Dict[str, float]] = None
+    query_cache: Optional[Dict[str, float]] = None
 
 class HealthCheck(BaseModel):
     status: str
     embeddings_loaded: bool
     total_cases: int
-    timestamp: str
\ No newline at end of file
+    timestamp: str
+
+class IndexMaintenanceReport(BaseModel):
+    index: str
+    rebuilt: bool
+    reason: Optional[str] = None
+    rows: int
+    built_rows: Optional[int] = None
+    options: Dict[str, int]
@@ -0,0 +1,139 @@
+import re
+import zlib
+from collections import Counter
+from typing import Iterable, List, Optional, Tuple
+
+import numpy as np
+
+MERSENNE_PRIME = np.uint64((1 << 61) - 1)
+MAX_HASH = np.uint64((1 << 32) - 1)
+SHINGLE_BASE = np.uint64(1_000_003)
+
+NORMALIZE_PATTERN = re.compile(r'[\W_]+')
+
+
+def optimal_bands(threshold: float, num_perm: int) -> Tuple[int, int]:
+    """Pick (bands, rows) minimizing false positive + false negative mass.
+
+    A pair with Jaccard similarity s becomes a candidate with probability
+    1 - (1 - s**rows)**bands; the S-curve should switch around threshold.
+    """
+    grid = np.linspace(0.0, 1.0, 201)
+    best, best_error = (1, num_perm), float('inf')
+    for bands in range(1, num_perm + 1):
+        rows = num_perm // bands
+        probability = 1 - (1 - grid ** rows) ** bands
+        false_positive = np.where(grid < threshold, probability, 0.0).mean()
+        false_negative = np.where(grid >= threshold, 1 - probability, 0.0).mean()
+        if false_positive + false_negative < best_error:
+            best, best_error = (bands, rows), false_positive + false_negative
+    return best
+
+
+class MinHasher:
+    """Stateless MinHash signatures over normalized word shingles.
+
+    Case, punctuation and whitespace are normalized away before shingling,
+    so texts differing only in those have identical signatures. Instances
+    are cheap to pickle and can run in worker processes.
+    """
+
+    def __init__(self, num_perm: int = 128, shingle_size: int = 3, seed: int = 1):
+        self.num_perm = num_perm
+        self.shingle_size = shingle_size
+        rng = np.random.RandomState(seed)
+        self._a = rng.randint(1, 2 ** 61 - 1, size=num_perm, dtype=np.int64).astype(np.uint64)
+        self._b = rng.randint(0, 2 ** 61 - 1, size=num_perm, dtype=np.int64).astype(np.uint64)
+
+    def shingles(self, text: str) -> np.ndarray:
+        words = NORMALIZE_PATTERN.sub(' ', text.lower()).split()
+        if not words:
+            return np.zeros(0, dtype=np.uint64)
+
+        hashes = np.array([zlib.crc32(word.encode('utf-8')) for word in words], dtype=np.uint64)
+        size = min(self.shingle_size, len(hashes))
+        shingles = np.zeros(len(hashes) - size + 1, dtype=np.uint64)
+        for offset in range(size):
+            # uint64 arithmetic wraps, which is fine for hashing
+            shingles = shingles * SHINGLE_BASE + hashes[offset:len(hashes) - size + 1 + offset]
+        return np.unique(shingles)
+
+    def signature(self, text: str) -> np.ndarray:
+        shingles = self.shingles(text)
+        if len(shingles) == 0:
+            return np.full(self.num_perm, MAX_HASH, dtype=np.uint32)
+        permuted = (np.outer(shingles, self._a) + self._b) % MERSENNE_PRIME & MAX_HASH
+        return permuted.min(axis=0).astype(np.uint32)
+
+    def signatures(self, texts: Iterable[str]) -> np.ndarray:
+        """Return a (len(texts), num_perm) uint32 signature matrix."""
+        rows = [self.signature(text) for text in texts]
+        if not rows:
+            return np.zeros((0, self.num_perm), dtype=np.uint32)
+        return np.vstack(rows)
+
+
+class NearDuplicateIndex:
+    """Incremental LSH index that keeps the first row of each near-duplicate cluster.
+
+    Rows are banded into hash buckets so each query only compares against
+    rows sharing a band, which keeps the whole pass sub-quadratic. A
+    candidate counts as a duplicate when the estimated Jaccard similarity
+    of the two signatures reaches threshold.
+    """
+
+    def __init__(self, threshold: float = 0.9, num_perm: int = 128):
+        self.threshold = threshold
+        self.num_perm = num_perm
+        self.bands, self.rows = optimal_bands(threshold, num_perm)
+        self._buckets = [dict() for _ in range(self.bands)]
+        self._signatures = np.zeros((1024, num_perm), dtype=np.uint32)
+        self.kept_count = 0
+        self.cluster_sizes = Counter()
+
+    def _band_keys(self, signature: np.ndarray) -> List[bytes]:
+        return [
+            signature[band * self.rows:(band + 1) * self.rows].tobytes()
+            for band in range(self.bands)
+        ]
+
+    def _find_duplicate(self, signature: np.ndarray, keys: List[bytes]) -> Optional[int]:
+        checked = set()
+        for bucket, key in zip(self._buckets, keys):
+            for slot in bucket.get(key, ()):
+                if slot in checked:
+                    continue
+                checked.add(slot)
+                if np.mean(self._signatures[slot] == signature) >= self.threshold:
+                    return slot
+        return None
+
+    def _add(self, signature: np.ndarray, keys: List[bytes]):
+        if self.kept_count == len(self._signatures):
+            self._signatures = np.resize(self._signatures, (2 * len(self._signatures), self.num_perm))
+        self._signatures[self.kept_count] = signature
+        for bucket, key in zip(self._buckets, keys):
+            bucket.setdefault(key, []).append(self.kept_count)
+        self.kept_count += 1
+
+    def filter(self, signatures: np.ndarray) -> List[bool]:
+        """Return a keep mask; kept rows are added to the index in order.
+
+        Kept rows get consecutive slots starting at 0, so a slot is the
+        row's position among all rows kept so far.
+        """
+        keep = []
+        for signature in signatures:
+            keys = self._band_keys(signature)
+            duplicate_of = self._find_duplicate(signature, keys)
+            if duplicate_of is None:
+                self._add(signature, keys)
+                keep.append(True)
+            else:
+                self.cluster_sizes[duplicate_of] += 1
+                keep.append(False)
+        return keep
+
+    @property
+    def removed_count(self) -> int:
+        return sum(self.cluster_sizes.values())
@@ -0,0 +1,184 @@
+import logging
+import queue
+import threading
+import time
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+_DONE = object()
+
+
+class StageStats:
+    """Throughput counters for one pipeline stage.
+
+    busy_seconds is time spent doing the stage's work; waiting_seconds is
+    time blocked on an empty input queue or a full output queue.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.items = 0
+        self.rows = 0
+        self.busy_seconds = 0.0
+        self.waiting_seconds = 0.0
+
+    def as_dict(self) -> Dict:
+        return {
+            "items": self.items,
+            "rows": self.rows,
+            "busy_seconds": self.busy_seconds,
+            "waiting_seconds": self.waiting_seconds,
+            "rows_per_second": (
+                self.rows / self.busy_seconds if self.busy_seconds else 0.0
+            ),
+        }
+
+
+class Pipeline:
+    """Runs source -> transforms -> sink concurrently with bounded queues.
+
+    The source and each transform run in their own thread and the sink
+    runs in the calling thread, so stages overlap and total time tends
+    to the slowest stage. A full queue blocks its producer, which bounds
+    memory to queue_size items per stage. The first error in any stage
+    stops the pipeline and is re-raised from run.
+    """
+
+    def __init__(
+        self,
+        source: Tuple[str, Iterable],
+        transforms: List[Tuple[str, Callable]],
+        sink: Tuple[str, Callable],
+        queue_size: int = 4,
+        rows: Callable = lambda item: 1,
+    ):
+        self.source = source
+        self.transforms = transforms
+        self.sink = sink
+        self.queue_size = queue_size
+        self.rows = rows
+        self.stats = {
+            name: StageStats(name) for name, _ in [source] + transforms + [sink]
+        }
+        self._stop = threading.Event()
+        self._error: Optional[BaseException] = None
+
+    def _put(self, out: queue.Queue, item, stats: StageStats) -> bool:
+        start = time.perf_counter()
+        try:
+            while not self._stop.is_set():
+                try:
+                    out.put(item, timeout=0.1)
+                    return True
+                except queue.Full:
+                    continue
+            return False
+        finally:
+            stats.waiting_seconds += time.perf_counter() - start
+
+    def _get(self, inbox: queue.Queue, stats: StageStats):
+        start = time.perf_counter()
+        try:
+            while not self._stop.is_set():
+                try:
+                    return inbox.get(timeout=0.1)
+                except queue.Empty:
+                    continue
+            return _DONE
+        finally:
+            stats.waiting_seconds += time.perf_counter() - start
+
+    def _fail(self, error: BaseException):
+        if self._error is None:
+            self._error = error
+        self._stop.set()
+
+    def _run_source(self, items: Iterable, out: queue.Queue, stats: StageStats):
+        try:
+            iterator = iter(items)
+            while True:
+                start = time.perf_counter()
+                item = next(iterator, _DONE)
+                stats.busy_seconds += time.perf_counter() - start
+                if item is _DONE:
+                    break
+                stats.items += 1
+                stats.rows += self.rows(item)
+                if not self._put(out, item, stats):
+                    return
+        except BaseException as e:
+            self._fail(e)
+        self._put(out, _DONE, stats)
+
+    def _run_transform(
+        self, func: Callable, inbox: queue.Queue, out: queue.Queue, stats: StageStats
+    ):
+        try:
+            while True:
+                item = self._get(inbox, stats)
+                if item is _DONE:
+                    break
+                start = time.perf_counter()
+                result = func(item)
+                stats.busy_seconds += time.perf_counter() - start
+                stats.items += 1
+                stats.rows += self.rows(result)
+                if not self._put(out, result, stats):
+                    return
+        except BaseException as e:
+            self._fail(e)
+        self._put(out, _DONE, stats)
+
+    def run(self) -> Dict[str, Dict]:
+        """Run to completion and return per-stage stats."""
+        queues = [queue.Queue(self.queue_size) for _ in range(len(self.transforms) + 1)]
+        source_name, items = self.source
+        threads = [
+            threading.Thread(
+                target=self._run_source,
+                args=(items, queues[0], self.stats[source_name]),
+                name=f"pipeline-{source_name}",
+                daemon=True,
+            )
+        ]
+        for i, (name, func) in enumerate(self.transforms):
+            threads.append(
+                threading.Thread(
+                    target=self._run_transform,
+                    args=(func, queues[i], queues[i + 1], self.stats[name]),
+                    name=f"pipeline-{name}",
+                    daemon=True,
+                )
+            )
+        for thread in threads:
+            thread.start()
+
+        sink_name, sink = self.sink
+        stats = self.stats[sink_name]
+        try:
+            while True:
+                item = self._get(queues[-1], stats)
+                if item is _DONE:
+                    break
+                start = time.perf_counter()
+                sink(item)
+                stats.busy_seconds += time.perf_counter() - start
+                stats.items += 1
+                stats.rows += self.rows(item)
+        except BaseException as e:
+            self._fail(e)
+        finally:
+            self._stop.set()
+            for thread in threads:
+                thread.join()
+
+        if self._error is not None:
+            raise self._error
+
+        for name, stage in self.stats.items():
+            logger.info(
+                f"Stage {name}: {stage.rows} rows in {stage.busy_seconds:.1f}s busy, "
+                f"{stage.waiting_seconds:.1f}s waiting"
+            )
+        return {name: stage.as_dict() for name, stage in self.stats.items()}
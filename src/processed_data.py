@@ -0,0 +1,107 @@
+import os
+from pathlib import Path
+from typing import Dict, Iterator, List
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+CSV_SUFFIXES = ('.csv',)
+PARQUET_SUFFIXES = ('.parquet',)
+ARROW_SUFFIXES = ('.arrow', '.feather')
+
+PROCESSED_SCHEMA = pa.schema([
+    ('id', pa.string()),
+    ('Context', pa.string()),
+    ('Response', pa.string()),
+    ('category', pa.dictionary(pa.int32(), pa.string())),
+    ('quality_score', pa.float32()),
+    ('context_length', pa.int32()),
+    ('response_length', pa.int32()),
+])
+
+
+def output_format(path: str) -> str:
+    suffix = Path(path).suffix.lower()
+    if suffix in CSV_SUFFIXES:
+        return 'csv'
+    if suffix in PARQUET_SUFFIXES:
+        return 'parquet'
+    if suffix in ARROW_SUFFIXES:
+        return 'arrow'
+    raise ValueError(f"Unsupported processed data format: {path}")
+
+
+def sidecar_path(path: str, suffix: str) -> str:
+    """Path next to the processed file, e.g. cleaned_conversations_stats.txt."""
+    path = Path(path)
+    return str(path.with_name(path.stem + suffix))
+
+
+class ProcessedDataWriter:
+    """Appends processed chunks to CSV, Parquet or Arrow IPC files.
+
+    Columnar formats use PROCESSED_SCHEMA; categories are written with a
+    fixed dictionary so every record batch shares it, which the Arrow IPC
+    file format requires.
+    """
+
+    def __init__(self, path: str, categories: List[str]):
+        self.path = path
+        self.format = output_format(path)
+        self.categories = categories
+        self.rows_written = 0
+        self._writer = None
+
+    def write(self, chunk: pd.DataFrame):
+        first = self._writer is None
+        if first:
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+
+        if self.format == 'csv':
+            chunk.to_csv(self.path, index=False, mode='w' if first else 'a', header=first)
+            self._writer = self.path
+        else:
+            chunk = chunk.assign(category=pd.Categorical(chunk['category'], categories=self.categories))
+            table = pa.Table.from_pandas(chunk, schema=PROCESSED_SCHEMA, preserve_index=False)
+            table = table.replace_schema_metadata(None)
+            if first and self.format == 'parquet':
+                self._writer = pq.ParquetWriter(self.path, table.schema)
+            elif first:
+                self._writer = pa.ipc.new_file(self.path, table.schema)
+            self._writer.write_table(table)
+
+        self.rows_written += len(chunk)
+
+    def close(self):
+        if self._writer is not None and self.format != 'csv':
+            self._writer.close()
+        self._writer = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def iter_processed_batches(path: str, batch_size: int) -> Iterator[List[Dict]]:
+    """Yield processed rows as lists of dicts, batch_size rows at a time.
+
+    Arrow and Parquet files are memory-mapped and sliced into record
+    batches, so only the current batch is turned into Python objects.
+    """
+    fmt = output_format(path)
+
+    if fmt == 'arrow':
+        with pa.memory_map(path) as source:
+            table = pa.ipc.open_file(source).read_all()
+            for batch in table.to_batches(max_chunksize=batch_size):
+                yield batch.to_pylist()
+    elif fmt == 'parquet':
+        parquet_file = pq.ParquetFile(path, memory_map=True)
+        for batch in parquet_file.iter_batches(batch_size=batch_size):
+            yield batch.to_pylist()
+    else:
+        for chunk in pd.read_csv(path, chunksize=batch_size, dtype={'id': str}):
+            yield chunk.to_dict('records')
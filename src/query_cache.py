@@ -0,0 +1,91 @@
+import os
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional, Tuple
+
+
+def normalize_query(text: str) -> str:
+    """Fold case, Unicode forms and whitespace so trivial variants share a key."""
+    return " ".join(unicodedata.normalize("NFKC", text).casefold().split())
+
+
+class QueryEmbeddingCache:
+    """In-process LRU cache of query embeddings with a time to live.
+
+    Keys are (model, normalized query). Entries older than ttl_seconds are
+    dropped on lookup; beyond max_entries the least recently used entry is
+    evicted. Safe to share between request threads.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 1024,
+        ttl_seconds: float = 3600.0,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.clock = clock
+        self.hits = 0
+        self.misses = 0
+        self.expirations = 0
+        self.evictions = 0
+        self._entries: "OrderedDict[Tuple[str, str], Tuple[float, List[float]]]" = (
+            OrderedDict()
+        )
+        self._lock = threading.Lock()
+
+    def get(self, model: str, query: str) -> Optional[List[float]]:
+        key = (model, normalize_query(query))
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and self.clock() - entry[0] > self.ttl_seconds:
+                del self._entries[key]
+                self.expirations += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, model: str, query: str, embedding: List[float]):
+        key = (model, normalize_query(query))
+        with self._lock:
+            self._entries[key] = (self.clock(), embedding)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> Dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self),
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl_seconds,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "expirations": self.expirations,
+            "evictions": self.evictions,
+        }
+
+
+def query_cache_from_env() -> Optional[QueryEmbeddingCache]:
+    """Build the cache configured by QUERY_CACHE_MAX_ENTRIES; 0 disables it."""
+    max_entries = int(os.getenv("QUERY_CACHE_MAX_ENTRIES", "1024"))
+    if max_entries <= 0:
+        return None
+    ttl_seconds = float(os.getenv("QUERY_CACHE_TTL_SECONDS", "3600"))
+    return QueryEmbeddingCache(max_entries, ttl_seconds)
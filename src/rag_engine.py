@@ -3,10 +3,19 @@ from typing import List, Dict, Optional
 import logging
 from dotenv import load_dotenv
 from .embeddings import OpenAIEmbeddingManager
+from .keyword_matcher import KeywordMatcher
 
 load_dotenv()
 logger = logging.getLogger(__name__)
 
+RISK_WARNINGS = {
+    'suicide': 'Suicide risk indicators detected - immediate assessment needed',
+    'self-harm': 'Self-harm indicators present - safety assessment required',
+    'abuse': 'Abuse indicators mentioned - consider safety and reporting requirements',
+    'crisis': 'Crisis situation indicated - immediate intervention may be needed'
+}
+RISK_MATCHER = KeywordMatcher({keyword: [keyword] for keyword in RISK_WARNINGS})
+
 class TherapistRAGEngine:
     def __init__(self):
         self.embedding_manager = OpenAIEmbeddingManager()
@@ -17,13 +26,15 @@ class TherapistRAGEngine:
         query: str, 
         top_k: int = 5, 
         min_similarity: float = 0.7,
-        category_filter: Optional[str] = None
+        category_filter: Optional[str] = None,
+        ef_search: Optional[int] = None
     ) -> List[Dict]:
         return self.embedding_manager.search_similar(
             query=query,
             top_k=top_k,
             min_similarity=min_similarity,
-            category_filter=category_filter
+            category_filter=category_filter,
+            ef_search=ef_search
         )
     
     def generate_guidance(
@@ -114,19 +125,10 @@ class TherapistRAGEngine:
         return '\n'.join(guidance_parts)
     
     def _extract_warnings(self, patient_context: str) -> List[str]:
-        warnings = []
-        context_lower = patient_context.lower()
-        
-        risk_keywords = {
-            'suicide': 'Suicide risk indicators detected - immediate assessment needed',
-            'self-harm': 'Self-harm indicators present - safety assessment required',
-            'abuse': 'Abuse indicators mentioned - consider safety and reporting requirements',
-            'crisis': 'Crisis situation indicated - immediate intervention may be needed'
-        }
-        
-        for keyword, warning in risk_keywords.items():
-            if keyword in context_lower:
-                warnings.append(f"WARNING: {warning}")
+        warnings = [
+            f"WARNING: {RISK_WARNINGS[keyword]}"
+            for keyword in RISK_MATCHER.matched_groups(patient_context)
+        ]
         
         if not warnings:
             warnings.append("OK: No immediate risk indicators detected in provided context")
@@ -0,0 +1,71 @@
+import logging
+import random
+import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Callable, Mapping, Optional, TypeVar
+
+from openai import APIConnectionError, InternalServerError, RateLimitError
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# Provider errors worth retrying; timeouts are a kind of connection error
+TRANSIENT_ERRORS = (APIConnectionError, InternalServerError, RateLimitError)
+
+
+def retry_after_seconds(headers: Mapping[str, str]) -> Optional[float]:
+    """Wait requested by a 429 response, or None if it gives no usable one.
+
+    Reads retry-after-ms, then retry-after as seconds or an HTTP date.
+    """
+    try:
+        return max(0.0, float(headers["retry-after-ms"]) / 1000)
+    except (KeyError, TypeError, ValueError):
+        pass
+    retry_after = headers.get("retry-after")
+    if not retry_after:
+        return None
+    try:
+        return max(0.0, float(retry_after))
+    except ValueError:
+        pass
+    try:
+        when = parsedate_to_datetime(retry_after)
+    except (TypeError, ValueError):
+        return None
+    if when.tzinfo is None:
+        when = when.replace(tzinfo=timezone.utc)
+    return max(0.0, (when - datetime.now(timezone.utc)).total_seconds())
+
+
+class RetryPolicy:
+    """Exponential backoff with full jitter for transient provider errors.
+
+    Attempt n waits a uniform random time in [0, min(max_delay,
+    base_delay * 2**n)], which spreads out retries from many clients.
+    """
+
+    def __init__(
+        self, max_retries: int = 6, base_delay: float = 1.0, max_delay: float = 60.0
+    ):
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def delay(self, attempt: int) -> float:
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2**attempt))
+
+    def call(self, func: Callable[..., T], *args, **kwargs) -> T:
+        for attempt in range(self.max_retries + 1):
+            try:
+                return func(*args, **kwargs)
+            except TRANSIENT_ERRORS as e:
+                if attempt == self.max_retries:
+                    raise
+                delay = self.delay(attempt)
+                logger.warning(
+                    f"Transient error ({type(e).__name__}); retry {attempt + 1} in {delay:.1f}s"
+                )
+                time.sleep(delay)
@@ -0,0 +1,97 @@
+import os
+import resource
+import sys
+import time
+from typing import Callable, Dict, Iterable, Iterator, Optional
+
+import numpy as np
+import pandas as pd
+
+STAGE_FIELDS = ('calls', 'wall_seconds', 'cpu_seconds', 'rows_in', 'rows_out', 'rss_delta_mb')
+
+
+def current_rss_mb() -> float:
+    """Resident set size of this process in MB.
+
+    Reads /proc on Linux; elsewhere falls back to the peak RSS, which
+    still shows growth but never shrinks.
+    """
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / (1024 * 1024)
+    except (OSError, ValueError, IndexError):
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+def _row_count(value) -> Optional[int]:
+    return len(value) if isinstance(value, (pd.DataFrame, pd.Series, np.ndarray)) else None
+
+
+class StageProfiler:
+    """Accumulates wall time, CPU time, row counts and RSS change per stage.
+
+    A stage can run many times (once per chunk); its totals are summed.
+    Totals from worker processes are folded in with merge, so wall and
+    CPU time of parallel stages are summed over workers.
+    """
+
+    def __init__(self):
+        self.stages: Dict[str, Dict[str, float]] = {}
+
+    def _record(self, name: str, wall: float, cpu: float, rows_in, rows_out, rss_delta: float):
+        stage = self.stages.setdefault(name, dict.fromkeys(STAGE_FIELDS, 0))
+        stage['calls'] += 1
+        stage['wall_seconds'] += wall
+        stage['cpu_seconds'] += cpu
+        stage['rows_in'] += rows_in or 0
+        stage['rows_out'] += rows_out or 0
+        stage['rss_delta_mb'] += rss_delta
+
+    def run(self, name: str, func: Callable, *args, **kwargs):
+        """Call func(*args, **kwargs) as one run of stage name.
+
+        Rows in are counted from the first argument and rows out from the
+        result; a stage returning None passes its rows through.
+        """
+        wall, cpu, rss = time.perf_counter(), time.process_time(), current_rss_mb()
+        result = func(*args, **kwargs)
+        rows_in = _row_count(args[0]) if args else None
+        rows_out = rows_in if result is None else _row_count(result)
+        self._record(
+            name, time.perf_counter() - wall, time.process_time() - cpu,
+            rows_in, rows_out, current_rss_mb() - rss
+        )
+        return result
+
+    def iterate(self, name: str, items: Iterable) -> Iterator:
+        """Yield from items, timing each step of the iterator as stage name."""
+        iterator = iter(items)
+        while True:
+            wall, cpu, rss = time.perf_counter(), time.process_time(), current_rss_mb()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+            rows = _row_count(item)
+            self._record(name, time.perf_counter() - wall, time.process_time() - cpu, rows, rows, current_rss_mb() - rss)
+            yield item
+
+    def merge(self, stages: Dict[str, Dict[str, float]]):
+        """Add stage totals collected by another profiler, e.g. in a worker."""
+        for name, totals in stages.items():
+            stage = self.stages.setdefault(name, dict.fromkeys(STAGE_FIELDS, 0))
+            for field in STAGE_FIELDS:
+                stage[field] += totals[field]
+
+    def as_dict(self) -> Dict[str, Dict[str, float]]:
+        return {name: dict(stage) for name, stage in self.stages.items()}
+
+    def format_table(self) -> str:
+        lines = [f"{'stage':<14}" + ''.join(f"{field:>14}" for field in STAGE_FIELDS)]
+        for name, stage in self.stages.items():
+            lines.append(
+                f"{name:<14}{stage['calls']:>14}{stage['wall_seconds']:>14.3f}{stage['cpu_seconds']:>14.3f}"
+                f"{stage['rows_in']:>14}{stage['rows_out']:>14}{stage['rss_delta_mb']:>14.1f}"
+            )
+        return '\n'.join(lines)
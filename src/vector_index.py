@@ -0,0 +1,220 @@
+import argparse
+import json
+import logging
+import os
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+
+logger = logging.getLogger(__name__)
+
+EMBEDDINGS_FILE = "embeddings.npy"
+METADATA_FILE = "metadata.arrow"
+
+METADATA_SCHEMA = pa.schema(
+    [
+        ("id", pa.string()),
+        ("context", pa.string()),
+        ("response", pa.string()),
+        ("category", pa.string()),
+        ("quality_score", pa.float64()),
+        ("context_length", pa.int32()),
+        ("response_length", pa.int32()),
+        ("extra_data", pa.string()),
+    ]
+)
+
+
+def file_signature(paths: Iterable[Path]) -> Tuple:
+    """Identity of files as they are on disk now; None for missing ones.
+
+    Exports swap files in with os.replace, which always gives a new inode,
+    so a changed signature means the files have to be mapped again.
+    """
+    signature = []
+    for path in paths:
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            signature.append(None)
+        else:
+            signature.append((stat.st_ino, stat.st_mtime_ns, stat.st_size))
+    return tuple(signature)
+
+
+def write_index(
+    directory: str,
+    rows: int,
+    dimension: int,
+    batches: Iterable[Tuple[List[Dict], np.ndarray]],
+) -> int:
+    """Write an index from (metadata rows, embeddings) batches totalling rows.
+
+    Embeddings are scaled to unit length so a dot product is the cosine
+    similarity. Both files are written under temporary names and moved
+    into place at the end, so readers never see half an index.
+    """
+    os.makedirs(directory, exist_ok=True)
+    embeddings_path = Path(directory) / EMBEDDINGS_FILE
+    metadata_path = Path(directory) / METADATA_FILE
+    partial_embeddings = str(embeddings_path) + ".partial"
+    partial_metadata = str(metadata_path) + ".partial"
+
+    matrix = np.lib.format.open_memmap(
+        partial_embeddings, mode="w+", dtype=np.float32, shape=(rows, dimension)
+    )
+    written = 0
+    with pa.ipc.new_file(partial_metadata, METADATA_SCHEMA) as writer:
+        for metadata, embeddings in batches:
+            embeddings = np.asarray(embeddings, dtype=np.float32)
+            norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+            matrix[written : written + len(embeddings)] = embeddings / np.where(
+                norms == 0, 1, norms
+            )
+            writer.write_table(
+                pa.Table.from_pylist(
+                    [
+                        dict(row, extra_data=json.dumps(row.get("extra_data")))
+                        for row in metadata
+                    ],
+                    schema=METADATA_SCHEMA,
+                )
+            )
+            written += len(embeddings)
+    matrix.flush()
+    del matrix
+
+    if written != rows:
+        raise ValueError(f"Expected {rows} rows for the index, got {written}")
+    os.replace(partial_embeddings, embeddings_path)
+    os.replace(partial_metadata, metadata_path)
+    logger.info(f"Wrote {rows} x {dimension} search index to {directory}")
+    return written
+
+
+class NumpyVectorIndex:
+    """Exact cosine search over a memory-mapped embedding matrix.
+
+    Vectors live in embeddings.npy (unit length, float32, one row per
+    conversation) and everything else in metadata.arrow, row-aligned.
+    Category and quality score are held as arrays so filters are boolean
+    masks; a search is one matrix-vector product plus argpartition.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.embeddings = np.load(Path(directory) / EMBEDDINGS_FILE, mmap_mode="r")
+        self.metadata = pa.ipc.open_file(
+            pa.memory_map(str(Path(directory) / METADATA_FILE))
+        ).read_all()
+        if self.metadata.num_rows != len(self.embeddings):
+            raise ValueError(
+                f"{directory}: {len(self.embeddings)} embeddings but "
+                f"{self.metadata.num_rows} metadata rows"
+            )
+
+        categories = pc.dictionary_encode(
+            self.metadata.column("category").combine_chunks()
+        )
+        self.category_names = categories.dictionary.to_pylist()
+        self.category_codes = categories.indices.to_numpy(zero_copy_only=False)
+        self.quality_scores = self.metadata.column("quality_score").to_numpy()
+
+    def __len__(self) -> int:
+        return len(self.embeddings)
+
+    @property
+    def dimension(self) -> int:
+        return self.embeddings.shape[1]
+
+    @staticmethod
+    def normalized(query_embedding: List[float]) -> np.ndarray:
+        query = np.asarray(query_embedding, dtype=np.float32)
+        return query / (np.linalg.norm(query) or 1.0)
+
+    def filter_mask(
+        self, category_filter: Optional[str] = None, min_quality: Optional[float] = None
+    ) -> Optional[np.ndarray]:
+        """Boolean mask of rows passing the filters, or None if there are none."""
+        if not category_filter and min_quality is None:
+            return None
+        mask = np.ones(len(self), dtype=bool)
+        if category_filter:
+            if category_filter not in self.category_names:
+                return np.zeros(len(self), dtype=bool)
+            mask &= self.category_codes == self.category_names.index(category_filter)
+        if min_quality is not None:
+            mask &= self.quality_scores >= min_quality
+        return mask
+
+    def search(
+        self,
+        query_embedding: List[float],
+        top_k: int = 5,
+        min_similarity: float = 0.7,
+        category_filter: Optional[str] = None,
+        min_quality: Optional[float] = None,
+        rows: Optional[np.ndarray] = None,
+    ) -> List[Dict]:
+        """Return results shaped like OpenAIEmbeddingManager.search_similar.
+
+        rows limits the search to those row numbers, e.g. candidates from
+        an approximate index; only their vectors are read.
+        """
+        query = self.normalized(query_embedding)
+        if rows is None:
+            rows = np.arange(len(self))
+            similarities = self.embeddings @ query
+        else:
+            rows = np.sort(np.asarray(rows, dtype=np.int64))
+            similarities = self.embeddings[rows] @ query
+
+        mask = similarities > min_similarity
+        filters = self.filter_mask(category_filter, min_quality)
+        if filters is not None:
+            mask &= filters[rows]
+
+        candidates = np.flatnonzero(mask)
+        if len(candidates) > top_k:
+            nearest = np.argpartition(-similarities[candidates], top_k)[:top_k]
+            candidates = candidates[nearest]
+        candidates = candidates[np.argsort(-similarities[candidates], kind="stable")]
+
+        metadata = self.metadata.take(
+            pa.array(rows[candidates], type=pa.int64())
+        ).to_pylist()
+        return [
+            {
+                "similarity": float(similarities[i]),
+                "metadata": {
+                    "id": row["id"],
+                    "Context": row["context"],
+                    "Response": row["response"],
+                    "category": row["category"],
+                    "quality_score": float(row["quality_score"]),
+                    "context_length": row["context_length"],
+                    "response_length": row["response_length"],
+                    "extra_data": json.loads(row["extra_data"]),
+                },
+            }
+            for i, row in zip(candidates, metadata)
+        ]
+
+
+def main():
+    from .embeddings import OpenAIEmbeddingManager
+
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(
+        description="Export stored embeddings for SEARCH_MODE=numpy"
+    )
+    parser.add_argument("--dir", help="Index directory (default: SEARCH_INDEX_DIR)")
+    args = parser.parse_args()
+    OpenAIEmbeddingManager().export_index(args.dir)
+
+
+if __name__ == "__main__":
+    main()
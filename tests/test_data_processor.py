@@ -0,0 +1,468 @@
+"""
+Data processing pipeline tests for Therapist RAG System
+"""
+import unittest
+import sys
+import tempfile
+from pathlib import Path
+from unittest.mock import patch
+
+import pandas as pd
+
+# Add src to path
+sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
+
+RAW_DATA_PATH = Path(__file__).parent.parent / "data" / "raw" / "train-base.csv"
+
+
+class TestVectorizedCleaning(unittest.TestCase):
+    """Vectorized cleaning must match clean_text exactly."""
+
+    def setUp(self):
+        from src.data_processor import TherapyDataProcessor
+
+        self.processor = TherapyDataProcessor("dummy", "dummy")
+
+    def assert_parity(self, texts: pd.Series):
+        expected = texts.apply(self.processor.clean_text)
+        actual = self.processor.clean_text_series(texts)
+        self.assertEqual(actual.tolist(), expected.tolist())
+        self.assertTrue(actual.index.equals(texts.index))
+
+    def test_edge_cases(self):
+        """Test missing values, whitespace and symbol runs."""
+        self.assert_parity(pd.Series([
+            None, float("nan"), "", "   ", "\n\n\t",
+            "  This   has\n\nextra   spaces  and\nnewlines  ",
+            "Symbols @#$ and ~emoji~ \U0001F600 stay out!",
+            "Keep (these): quotes \"like\" 'this', dashes - and ; colons?",
+            "Non-breaking space and café naïve 你好",
+            "Control\x1cchars\x1f and under_scores",
+        ], dtype=object))
+
+    def test_non_string_values(self):
+        """Test numbers are stringified like clean_text does."""
+        self.assert_parity(pd.Series([42, 3.5, "text"], dtype=object))
+        self.assert_parity(pd.Series([1.0, 2.5, float("nan")]))
+
+    def test_raw_dataset(self):
+        """Test parity on the bundled raw dataset."""
+        df = pd.read_csv(RAW_DATA_PATH)
+        self.assert_parity(df["Context"])
+        self.assert_parity(df["Response"])
+
+
+class TestVectorizedQualityScoring(unittest.TestCase):
+    """Batch quality scores must match calculate_quality_score."""
+
+    def test_parity_across_thresholds(self):
+        """Test every length boundary used by the scalar scorer."""
+        from src.data_processor import TherapyDataProcessor
+
+        processor = TherapyDataProcessor("dummy", "dummy")
+        boundaries = [0, 29, 30, 49, 50, 99, 100, 1500, 1501, 2000, 2001, 3000, 3001, 5000]
+        pairs = [(c, r) for c in boundaries for r in boundaries]
+        context_length = pd.Series([c for c, _ in pairs], index=range(10, 10 + len(pairs)))
+        response_length = pd.Series([r for _, r in pairs], index=context_length.index)
+
+        expected = [processor.calculate_quality_score("x" * c, "x" * r) for c, r in pairs]
+        actual = processor.calculate_quality_scores(context_length, response_length)
+
+        self.assertEqual(actual.tolist(), expected)
+        self.assertTrue(actual.index.equals(context_length.index))
+
+
+def reference_category(context: str) -> str:
+    """Per-keyword substring scan that KeywordMatcher replaces."""
+    from src.data_processor import CATEGORY_KEYWORDS
+
+    context_lower = context.lower()
+    category_scores = {}
+    for category, keywords in CATEGORY_KEYWORDS.items():
+        score = sum(1 for keyword in keywords if keyword in context_lower)
+        if score > 0:
+            category_scores[category] = score
+    if category_scores:
+        return max(category_scores, key=category_scores.get)
+    return 'general'
+
+
+class TestKeywordMatcher(unittest.TestCase):
+    """Single-pass keyword matching tests."""
+
+    def test_overlapping_keywords(self):
+        """Test keywords nested inside longer keywords are all found."""
+        from src.keyword_matcher import KeywordMatcher
+
+        matcher = KeywordMatcher({'a': ['worth', 'worthless'], 'b': ['less', 'WORTHLESSNESS']})
+        self.assertEqual(
+            matcher.find("Feeling Worthlessness"),
+            frozenset({'worth', 'worthless', 'less', 'worthlessness'})
+        )
+        self.assertEqual(matcher.group_counts(matcher.find("worthless")), {'a': 2, 'b': 1})
+        self.assertEqual(matcher.find("hopelessness"), frozenset({'less'}))
+        self.assertEqual(matcher.find(""), frozenset())
+        self.assertEqual(
+            matcher.find_batch(pd.Series(["worth it", None])).tolist(),
+            [frozenset({'worth'}), frozenset()]
+        )
+
+    def test_category_parity(self):
+        """Test scalar and batch categories match the substring scan."""
+        from src.data_processor import TherapyDataProcessor
+
+        processor = TherapyDataProcessor("dummy", "dummy")
+        contexts = pd.read_csv(RAW_DATA_PATH)["Context"].fillna('').astype(str)
+        contexts = pd.concat([contexts, pd.Series([
+            "", "SAD and anxious", "self-esteem worth value", "no keywords here"
+        ])], ignore_index=True)
+
+        expected = [reference_category(context) for context in contexts]
+        self.assertEqual([processor.detect_categories(c) for c in contexts], expected)
+        self.assertEqual(processor.detect_categories_batch(contexts).tolist(), expected)
+
+    def test_risk_warnings(self):
+        """Test warnings keep their order and the no-risk message."""
+        from src.rag_engine import TherapistRAGEngine
+
+        engine = TherapistRAGEngine.__new__(TherapistRAGEngine)
+        warnings = engine._extract_warnings("Crisis after ABUSE, thoughts of suicide")
+        self.assertEqual(len(warnings), 3)
+        self.assertTrue(warnings[0].startswith("WARNING: Suicide"))
+        self.assertTrue(warnings[1].startswith("WARNING: Abuse"))
+        self.assertTrue(warnings[2].startswith("WARNING: Crisis"))
+        self.assertEqual(
+            engine._extract_warnings("Feeling fine today"),
+            ["OK: No immediate risk indicators detected in provided context"]
+        )
+
+
+class TestStreamingProcessing(unittest.TestCase):
+    """Chunked streaming mode must match in-memory processing."""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.tmp_dir = Path(self.tmp.name)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def run_processor(self, raw_path, chunk_size=None, name="out.csv", workers=1):
+        from src.data_processor import TherapyDataProcessor
+
+        processor = TherapyDataProcessor(
+            str(raw_path), str(self.tmp_dir / name), chunk_size=chunk_size, workers=workers
+        )
+        processor.process_data()
+        processor.save_processed_data()
+        return processor, pd.read_csv(self.tmp_dir / name, dtype={"id": str})
+
+    def assert_same_stats(self, expected, actual):
+        for key, value in expected.items():
+            if key == "stages":
+                continue
+            if isinstance(value, float):
+                self.assertAlmostEqual(actual[key], value, places=9, msg=key)
+            else:
+                self.assertEqual(actual[key], value, msg=key)
+
+    def test_streaming_matches_in_memory(self):
+        """Test output and stats are the same whatever the chunk size."""
+        full, expected = self.run_processor(RAW_DATA_PATH, name="full.csv")
+        for chunk_size in (7, 64, 10_000):
+            streamed, actual = self.run_processor(RAW_DATA_PATH, chunk_size, f"chunked_{chunk_size}.csv")
+            pd.testing.assert_frame_equal(actual, expected)
+            self.assert_same_stats(full.stats, streamed.stats)
+            self.assertIsNone(streamed.df)
+
+    def test_cross_chunk_duplicates(self):
+        """Test duplicates split across chunks are removed once."""
+        context = "I have been feeling very anxious about my family and my job lately."
+        response = "It sounds like a lot is going on; let us look at what helps you cope."
+        raw = pd.DataFrame({
+            "Context": [context, "Another  context about   my relationship and trust issues.", context + "  "],
+            "Response": [response, response, response],
+        })
+        raw_path = self.tmp_dir / "raw.csv"
+        raw.to_csv(raw_path, index=False)
+
+        processor, output = self.run_processor(raw_path, chunk_size=1)
+        self.assertEqual(len(output), 2)
+        self.assertEqual(output["id"].tolist(), processor.content_ids(output))
+        self.assertEqual(output["id"].str.len().tolist(), [32, 32])
+        self.assertEqual(processor.stats["initial_count"], 3)
+        self.assertEqual(processor.stats["removed_count"], 1)
+        self.assertTrue((self.tmp_dir / "out_stats.txt").exists())
+
+    def test_parallel_matches_serial(self):
+        """Test a process pool gives the same rows, ids and stats."""
+        from src import data_processor
+
+        serial, expected = self.run_processor(RAW_DATA_PATH, name="serial.csv")
+
+        parallel, actual = self.run_processor(RAW_DATA_PATH, 50, "parallel_streamed.csv", workers=2)
+        pd.testing.assert_frame_equal(actual, expected)
+        self.assert_same_stats(serial.stats, parallel.stats)
+
+        with patch.object(data_processor, "PARALLEL_CHUNK_SIZE", 40):
+            parallel, actual = self.run_processor(RAW_DATA_PATH, name="parallel.csv", workers=3)
+        pd.testing.assert_frame_equal(actual, expected)
+        pd.testing.assert_frame_equal(parallel.df, serial.df)
+        self.assert_same_stats(serial.stats, parallel.stats)
+
+
+class TestStageInstrumentation(unittest.TestCase):
+    """Per-stage timing and memory instrumentation tests."""
+
+    def test_stages_are_recorded_and_saved(self):
+        """Test every stage reports its rows and timings in stats, txt and json."""
+        import json
+        from src.data_processor import TherapyDataProcessor
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            for workers in (1, 2):
+                path = Path(tmp_dir) / f"out_{workers}.csv"
+                processor = TherapyDataProcessor(str(RAW_DATA_PATH), str(path), chunk_size=50, workers=workers)
+                processor.process_data()
+                processor.save_processed_data()
+
+                stages = processor.stats["stages"]
+                for stage in ("load", "clean", "dedup", "score", "categorize", "write", "save"):
+                    self.assertIn(stage, stages)
+                    self.assertGreaterEqual(stages[stage]["wall_seconds"], 0)
+                    self.assertGreaterEqual(stages[stage]["cpu_seconds"], 0)
+                self.assertEqual(stages["load"]["rows_out"], processor.stats["initial_count"])
+                self.assertEqual(stages["clean"]["rows_in"], processor.stats["initial_count"])
+                self.assertEqual(stages["categorize"]["rows_out"], stages["score"]["rows_out"])
+                self.assertEqual(stages["write"]["rows_in"], processor.stats["final_count"])
+
+                saved = json.loads((Path(tmp_dir) / f"out_{workers}_stats.json").read_text())
+                self.assertEqual(saved["final_count"], processor.stats["final_count"])
+                self.assertEqual(saved["stages"]["save"]["calls"], 1)
+                self.assertIn("Stage Timings", (Path(tmp_dir) / f"out_{workers}_stats.txt").read_text())
+
+    def test_supplied_profiler_collects_the_run(self):
+        """Test a caller's StageProfiler records process_data and save, as the benchmark uses it."""
+        from src.data_processor import TherapyDataProcessor
+        from src.stage_profiler import StageProfiler
+
+        profiler = StageProfiler()
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            processor = TherapyDataProcessor(str(RAW_DATA_PATH), str(Path(tmp_dir) / "out.csv"), profiler=profiler)
+            processor.process_data()
+            processor.save_processed_data()
+
+        self.assertIs(processor.profiler, profiler)
+        self.assertEqual(profiler.as_dict(), processor.stats["stages"])
+        self.assertEqual(profiler.stages["load"]["rows_out"], processor.stats["initial_count"])
+        self.assertEqual(profiler.stages["save"]["calls"], 1)
+
+
+class TestNearDuplicates(unittest.TestCase):
+    """MinHash/LSH near-duplicate removal tests."""
+
+    def test_normalized_variants_collide(self):
+        """Test whitespace and punctuation variants share a signature."""
+        from src.near_duplicates import MinHasher
+
+        hasher = MinHasher()
+        a = hasher.signature("I feel anxious, all the time... What can I do?")
+        b = hasher.signature("i feel   anxious all the time what can I do")
+        c = hasher.signature("My partner and I keep arguing about money and chores")
+        self.assertTrue((a == b).all())
+        self.assertLess((a == c).mean(), 0.5)
+
+    def test_index_keeps_first_of_each_cluster(self):
+        """Test only later near-duplicates are dropped and clusters counted."""
+        from src.near_duplicates import MinHasher, NearDuplicateIndex
+
+        base = " ".join(f"word{i}" for i in range(60))
+        texts = [
+            base,
+            "completely different text about sleep problems and stress at work",
+            base + " extra",
+            base.upper() + "!!!",
+        ]
+        index = NearDuplicateIndex(threshold=0.8)
+        keep = index.filter(MinHasher().signatures(texts))
+        self.assertEqual(keep, [True, True, False, False])
+        self.assertEqual(index.cluster_sizes, {0: 2})
+        self.assertEqual(index.removed_count, 2)
+
+    def test_processor_stage(self):
+        """Test the optional stage reports clusters and agrees across workers."""
+        from src.data_processor import TherapyDataProcessor
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            raw = pd.read_csv(RAW_DATA_PATH).head(60)
+            variant = raw.iloc[[5]].copy()
+            variant["Context"] = variant["Context"].str.upper() + " ?!"
+            raw_path = Path(tmp_dir) / "raw.csv"
+            pd.concat([raw, variant]).to_csv(raw_path, index=False)
+
+            results = []
+            for workers, chunk_size in ((1, None), (2, 13)):
+                processor = TherapyDataProcessor(
+                    str(raw_path), str(Path(tmp_dir) / f"out_{workers}.csv"),
+                    chunk_size=chunk_size, workers=workers, near_duplicate_threshold=0.9
+                )
+                processor.process_data()
+                processor.save_processed_data()
+                results.append(pd.read_csv(processor.processed_data_path))
+                self.assertGreaterEqual(processor.stats["near_duplicates_removed"], 1)
+
+            pd.testing.assert_frame_equal(results[0], results[1])
+            stats_text = (Path(tmp_dir) / "out_1_stats.txt").read_text()
+            self.assertIn("near_duplicate_clusters", stats_text)
+
+
+class TestIncrementalProcessing(unittest.TestCase):
+    """Content-hash ids and manifest-based incremental reprocessing tests."""
+
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.tmp_dir = Path(self._tmp.name)
+        self.raw_path = self.tmp_dir / "raw.csv"
+
+    def tearDown(self):
+        self._tmp.cleanup()
+
+    def run_processor(self, raw, name="out.csv", **kwargs):
+        from src.data_processor import TherapyDataProcessor
+
+        raw.to_csv(self.raw_path, index=False)
+        processor = TherapyDataProcessor(
+            str(self.raw_path), str(self.tmp_dir / name), incremental=True, **kwargs
+        )
+        processor.process_data()
+        processor.save_processed_data()
+        return processor, pd.read_csv(self.tmp_dir / name, dtype={"id": str})
+
+    def test_ids_do_not_depend_on_row_order(self):
+        """Test a row keeps its id when the raw file is reordered."""
+        raw = pd.read_csv(RAW_DATA_PATH).head(80)
+        _, first = self.run_processor(raw, name="first.csv")
+        _, shuffled = self.run_processor(raw.iloc[::-1], name="shuffled.csv")
+        self.assertEqual(set(first["id"]), set(shuffled["id"]))
+
+    def test_incremental_run_matches_full_run(self):
+        """Test an incremental run after edits gives the same rows, in the same order, as a fresh run."""
+        from src.data_processor import TherapyDataProcessor
+
+        raw = pd.read_csv(RAW_DATA_PATH)
+        for chunk_size in (None, 25):
+            with self.subTest(chunk_size=chunk_size):
+                self.run_processor(raw.head(120), chunk_size=chunk_size)
+
+                # Drop some rows, edit one, insert new ones in the middle and append more
+                edited = pd.concat([raw.iloc[10:60], raw.iloc[170:180], raw.iloc[60:120], raw.iloc[150:170]])
+                edited.loc[edited.index[0], "Response"] += " Take care."
+                processor, output = self.run_processor(edited, chunk_size=chunk_size)
+
+                fresh = TherapyDataProcessor(str(self.raw_path), str(self.tmp_dir / "fresh.csv"))
+                fresh.process_data()
+                # Same rows in the same (source) order
+                pd.testing.assert_frame_equal(
+                    output.reset_index(drop=True),
+                    fresh.df.astype({"quality_score": float}).reset_index(drop=True),
+                    check_dtype=False
+                )
+
+                delta = pd.read_csv(self.tmp_dir / "out_delta.csv", dtype={"id": str})
+                deleted = (self.tmp_dir / "out_deleted_ids.txt").read_text().split()
+                self.assertEqual(len(delta), processor.stats["new_count"])
+                self.assertEqual(len(deleted), processor.stats["deleted_count"])
+                self.assertGreater(processor.stats["retained_count"], 0)
+                self.assertTrue(set(delta["id"]).isdisjoint(deleted))
+                self.assertEqual(
+                    processor.stats["retained_count"] + processor.stats["new_count"], len(output)
+                )
+
+                # A second run over unchanged data carries every row over
+                processor, again = self.run_processor(edited, chunk_size=chunk_size)
+                self.assertEqual(processor.stats["new_count"], 0)
+                self.assertEqual(processor.stats["deleted_count"], 0)
+                self.assertEqual(set(again["id"]), set(output["id"]))
+
+                for path in self.tmp_dir.glob("out*"):
+                    path.unlink()
+
+    def test_near_duplicate_clusters_are_compared_again(self):
+        """Test dropping a cluster head brings its near-duplicate back, as a full run would."""
+        from src.data_processor import TherapyDataProcessor
+
+        raw = pd.read_csv(RAW_DATA_PATH).head(60)
+        variants = raw.iloc[[5, 10]].copy()
+        variants["Context"] = variants["Context"].str.upper() + " ?!"
+        for chunk_size in (None, 25):
+            with self.subTest(chunk_size=chunk_size):
+                first, output = self.run_processor(
+                    pd.concat([raw, variants.iloc[:1]]), chunk_size=chunk_size, near_duplicate_threshold=0.9
+                )
+                self.assertGreaterEqual(first.stats["near_duplicates_removed"], 1)
+
+                # Delete the head of the first cluster and add a variant of a retained row
+                edited = pd.concat([raw.drop(raw.index[5]), variants])
+                processor, output = self.run_processor(
+                    edited, chunk_size=chunk_size, near_duplicate_threshold=0.9
+                )
+
+                fresh = TherapyDataProcessor(
+                    str(self.raw_path), str(self.tmp_dir / "fresh.csv"), near_duplicate_threshold=0.9
+                )
+                fresh.process_data()
+                pd.testing.assert_frame_equal(
+                    output.reset_index(drop=True),
+                    fresh.df.astype({"quality_score": float}).reset_index(drop=True),
+                    check_dtype=False
+                )
+                self.assertEqual(
+                    processor.stats["retained_count"] + processor.stats["new_count"], len(output)
+                )
+
+                for path in self.tmp_dir.glob("out*"):
+                    path.unlink()
+
+
+class TestColumnarOutput(unittest.TestCase):
+    """Parquet/Arrow output and batched reading tests."""
+
+    def test_round_trip_all_formats(self):
+        """Test every format yields the same rows with typed columns."""
+        import pyarrow as pa
+        from src.data_processor import TherapyDataProcessor
+        from src.processed_data import iter_processed_batches
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            rows_by_format = {}
+            for suffix, chunk_size in (("csv", None), ("parquet", 50), ("arrow", 50), ("feather", None)):
+                path = str(Path(tmp_dir) / f"out.{suffix}")
+                processor = TherapyDataProcessor(str(RAW_DATA_PATH), path, chunk_size=chunk_size)
+                processor.process_data()
+                processor.save_processed_data()
+                self.assertTrue((Path(tmp_dir) / "out_stats.txt").exists())
+
+                batches = list(iter_processed_batches(path, 64))
+                self.assertTrue(all(len(batch) <= 64 for batch in batches))
+                rows_by_format[suffix] = [row for batch in batches for row in batch]
+
+            expected = rows_by_format["csv"]
+            for suffix in ("parquet", "arrow", "feather"):
+                actual = rows_by_format[suffix]
+                self.assertEqual(len(actual), len(expected))
+                for got, want in zip(actual, expected):
+                    self.assertEqual(got["id"], want["id"])
+                    self.assertEqual(got["Context"], want["Context"])
+                    self.assertEqual(got["category"], want["category"])
+                    self.assertEqual(got["context_length"], want["context_length"])
+                    self.assertAlmostEqual(got["quality_score"], want["quality_score"], places=4)
+
+            with pa.memory_map(str(Path(tmp_dir) / "out.arrow")) as source:
+                schema = pa.ipc.open_file(source).schema
+            self.assertEqual(schema.field("category").type, pa.dictionary(pa.int32(), pa.string()))
+            self.assertEqual(schema.field("context_length").type, pa.int32())
+            self.assertEqual(schema.field("quality_score").type, pa.float32())
+
+
+if __name__ == "__main__":
+    unittest.main()
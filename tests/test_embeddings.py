@@ -0,0 +1,1014 @@
+"""
+Embedding generation tests for Therapist RAG System
+"""
+import asyncio
+import base64
+import json
+import os
+import tempfile
+import threading
+import time
+import unittest
+import sys
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from types import SimpleNamespace
+from unittest.mock import MagicMock, patch
+
+import numpy as np
+
+# Add src to path
+sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
+
+
+def fake_response(texts):
+    """Embeddings API response whose vectors encode each text's length."""
+    return SimpleNamespace(
+        data=[SimpleNamespace(embedding=[float(len(text)), 0.5, -1.0]) for text in texts]
+    )
+
+
+class TestEmbeddingCache(unittest.TestCase):
+    """On-disk embedding cache tests."""
+
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.path = str(Path(self._tmp.name) / "cache.sqlite")
+
+    def tearDown(self):
+        self._tmp.cleanup()
+
+    def test_round_trip_and_counters(self):
+        """Test hits and misses are counted and keys include model and dimension."""
+        from src.embedding_cache import EmbeddingCache
+
+        cache = EmbeddingCache(self.path)
+        cache.put_many("model-a", 3, ["hello"], [[0.25, 0.5, -1.0]])
+
+        self.assertEqual(cache.get_many("model-a", 3, ["hello", "other"]), [[0.25, 0.5, -1.0], None])
+        self.assertEqual(cache.get_many("model-b", 3, ["hello"]), [None])
+        self.assertEqual(cache.get_many("model-a", 1536, ["hello"]), [None])
+        self.assertEqual(cache.stats()["hits"], 1)
+        self.assertEqual(cache.stats()["misses"], 3)
+        cache.close()
+
+        # Entries survive reopening the file
+        reopened = EmbeddingCache(self.path)
+        self.assertEqual(reopened.get_many("model-a", 3, ["hello"]), [[0.25, 0.5, -1.0]])
+        reopened.close()
+
+    def test_evicts_least_recently_used(self):
+        """Test the cache stays under max_bytes by dropping the oldest entries."""
+        from src.embedding_cache import EmbeddingCache
+
+        cache = EmbeddingCache(self.path, max_bytes=4 * 12)
+        for i in range(4):
+            cache.put_many("m", 3, [f"text {i}"], [[float(i)] * 3])
+        cache.get_many("m", 3, ["text 0"])
+        cache.put_many("m", 3, ["text 4"], [[4.0] * 3])
+
+        self.assertLessEqual(cache.size_bytes, cache.max_bytes)
+        self.assertGreater(cache.evictions, 0)
+        self.assertIsNotNone(cache.get_many("m", 3, ["text 0"])[0])
+        self.assertIsNone(cache.get_many("m", 3, ["text 1"])[0])
+        cache.close()
+
+    def test_running_size_matches_stored_rows_across_threads(self):
+        """Test the byte total tracks replaced keys and concurrent writers without rescanning."""
+        from concurrent.futures import ThreadPoolExecutor
+        from src.embedding_cache import EmbeddingCache
+
+        cache = EmbeddingCache(self.path)
+        cache.put_many("m", 3, ["a", "a", "b"], [[1.0] * 3, [1.0] * 3, [2.0] * 3])
+        cache.put_many("m", 3, ["a"], [[3.0] * 3])
+        self.assertEqual(cache.size_bytes, 2 * 12)
+
+        def write(worker):
+            texts = [f"worker {worker} text {i}" for i in range(50)]
+            cache.put_many("m", 3, texts, [[float(i)] * 3 for i in range(50)])
+            return cache.get_many("m", 3, texts)
+
+        with ThreadPoolExecutor(max_workers=4) as pool:
+            results = list(pool.map(write, range(8)))
+        self.assertTrue(all(None not in found for found in results))
+        self.assertEqual((len(cache), cache.size_bytes), (402, 402 * 12))
+        cache.close()
+
+        self.assertEqual(EmbeddingCache(self.path).size_bytes, 402 * 12)
+
+    def test_generate_embeddings_only_requests_misses(self):
+        """Test the provider is only called for texts missing from the cache."""
+        from src.embedding_cache import EmbeddingCache
+        from src.embeddings import OpenAIEmbeddingManager
+
+        with patch.dict(os.environ, {"OPENAI_API_KEY": "test"}):
+            manager = OpenAIEmbeddingManager(cache=EmbeddingCache(self.path))
+        manager.client = MagicMock()
+        manager.client.embeddings.create.side_effect = lambda input, model: fake_response(input)
+
+        first = manager.generate_embeddings(["a", "bb"])
+        second = manager.generate_embeddings(["bb", "ccc", "a"])
+
+        self.assertEqual(first, [[1.0, 0.5, -1.0], [2.0, 0.5, -1.0]])
+        self.assertEqual(second, [[2.0, 0.5, -1.0], [3.0, 0.5, -1.0], [1.0, 0.5, -1.0]])
+        requested = [call.kwargs["input"] for call in manager.client.embeddings.create.call_args_list]
+        self.assertEqual(requested, [["a", "bb"], ["ccc"]])
+        self.assertEqual(manager.cache.stats()["hits"], 2)
+
+
+class TestQueryEmbeddingCache(unittest.TestCase):
+    """In-process query embedding cache tests."""
+
+    def test_lru_eviction_ttl_and_hit_rate(self):
+        """Test normalized keys, LRU eviction, expiry and counters."""
+        from src.query_cache import QueryEmbeddingCache
+
+        now = [0.0]
+        cache = QueryEmbeddingCache(max_entries=2, ttl_seconds=10, clock=lambda: now[0])
+        cache.put("model", "Feeling anxious", [1.0])
+        cache.put("model", "Trouble sleeping", [2.0])
+
+        self.assertEqual(cache.get("model", "  feeling   ANXIOUS "), [1.0])
+        self.assertIsNone(cache.get("other-model", "feeling anxious"))
+        cache.put("model", "grief", [3.0])
+        self.assertIsNone(cache.get("model", "trouble sleeping"))
+
+        now[0] = 11.0
+        self.assertIsNone(cache.get("model", "grief"))
+        stats = cache.stats()
+        self.assertEqual((stats["hits"], stats["misses"]), (1, 3))
+        self.assertEqual((stats["evictions"], stats["expirations"]), (1, 1))
+        self.assertEqual(stats["hit_rate"], 0.25)
+
+    def test_repeated_queries_skip_the_api(self):
+        """Test the manager only calls the API for the first of repeated queries."""
+        from src.embeddings import OpenAIEmbeddingManager
+
+        with patch.dict(os.environ, {"OPENAI_API_KEY": "test", "EMBEDDING_CACHE_PATH": ""}):
+            manager = OpenAIEmbeddingManager()
+        manager.generate_embeddings = MagicMock(return_value=[[0.5, 0.5]])
+
+        for query in ["How do I help a grieving client?", "how do i help a grieving client?"]:
+            self.assertEqual(manager.embed_query(query), [0.5, 0.5])
+        manager.generate_embeddings.assert_called_once()
+        self.assertEqual(manager.query_cache.stats()["hits"], 1)
+
+
+class TestLocalEmbeddingBackend(unittest.TestCase):
+    """Offline embedding backend tests."""
+
+    def test_local_vectors_are_deterministic_and_lexical(self):
+        """Test vectors are unit length, reproducible and closer for similar texts."""
+        import numpy as np
+        from src.embedding_backends import LocalHashingEmbeddingBackend
+
+        texts = ["I feel anxious about work", "I feel anxious about my job", "The garden is sunny"]
+        vectors = np.array(LocalHashingEmbeddingBackend(dimension=64).embed(texts))
+        again = np.array(LocalHashingEmbeddingBackend(dimension=64).embed(texts[:1]))
+
+        self.assertEqual(vectors.shape, (3, 64))
+        np.testing.assert_allclose(np.linalg.norm(vectors, axis=1), 1.0, rtol=1e-5)
+        np.testing.assert_allclose(again[0], vectors[0])
+        self.assertGreater(vectors[0] @ vectors[1], vectors[0] @ vectors[2])
+
+    def test_embedding_model_selects_backend(self):
+        """Test a local EMBEDDING_MODEL needs no API key and skips the disk cache."""
+        from src.embedding_backends import OpenAIEmbeddingBackend
+        from src.embeddings import OpenAIEmbeddingManager
+
+        env = {"OPENAI_API_KEY": "", "EMBEDDING_MODEL": "local-hashing", "EMBEDDING_DIMENSION": "32"}
+        with patch.dict(os.environ, env):
+            manager = OpenAIEmbeddingManager()
+        self.assertFalse(manager.backend.remote)
+        self.assertIsNone(manager.cache)
+        self.assertIsNone(manager.client)
+        self.assertEqual(len(manager.embed_query("How do I help a grieving client?")), 32)
+
+        with patch.dict(os.environ, {"OPENAI_API_KEY": "test", "EMBEDDING_CACHE_PATH": ""}):
+            manager = OpenAIEmbeddingManager()
+        self.assertIsInstance(manager.backend, OpenAIEmbeddingBackend)
+
+
+class TestBatchPacker(unittest.TestCase):
+    """Token-budget request packing tests."""
+
+    def test_requests_respect_token_budget_and_item_cap(self):
+        """Test every request stays within both limits and order is kept."""
+        from src.batch_packer import BatchPacker, estimate_tokens
+
+        texts = ["x" * length for length in (30, 3000, 90, 600, 10, 10, 10, 10, 2400)]
+        packer = BatchPacker(max_tokens=1100, max_items=3)
+        requests = list(packer.pack(enumerate(texts)))
+
+        self.assertEqual([i for indices, _ in requests for i in indices], list(range(len(texts))))
+        for indices, batch in requests:
+            self.assertLessEqual(len(batch), 3)
+            self.assertTrue(len(batch) == 1 or sum(map(estimate_tokens, batch)) <= 1100)
+        self.assertEqual(packer.truncated_count, 0)
+
+    def test_oversized_texts_are_truncated_and_counted(self):
+        """Test texts over the model limit are cut to fit it."""
+        from src.batch_packer import BatchPacker, estimate_tokens
+
+        packer = BatchPacker(max_input_tokens=100)
+        [(_, texts)] = list(packer.pack([("a", "short"), ("b", "y" * 1000)]))
+
+        self.assertEqual(texts[0], "short")
+        self.assertLessEqual(estimate_tokens(texts[1]), 100)
+        self.assertTrue(("y" * 1000).startswith(texts[1]))
+        self.assertEqual(packer.truncated_count, 1)
+
+    def test_generate_embeddings_splits_requests(self):
+        """Test one call is split into several requests when over budget."""
+        from src.batch_packer import BatchPacker
+        from src.embedding_cache import EmbeddingCache
+        from src.embeddings import OpenAIEmbeddingManager
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            with patch.dict(os.environ, {"OPENAI_API_KEY": "test"}):
+                manager = OpenAIEmbeddingManager(cache=EmbeddingCache(str(Path(tmp_dir) / "c.sqlite")))
+            manager.packer = BatchPacker(max_tokens=1000, max_items=100)
+            manager.client = MagicMock()
+            manager.client.embeddings.create.side_effect = lambda input, model: fake_response(input)
+
+            texts = [str(i) * 1800 for i in range(5)]
+            embeddings = manager.generate_embeddings(texts)
+
+            self.assertEqual([vector[0] for vector in embeddings], [1800.0] * 5)
+            self.assertEqual(manager.client.embeddings.create.call_count, 5)
+
+
+class TestResumableIngestion(unittest.TestCase):
+    """Retry and resume tests for ingestion."""
+
+    def test_transient_errors_are_retried_with_jittered_backoff(self):
+        """Test connection errors are retried and other errors are not."""
+        import httpx
+        from openai import APIConnectionError
+        from src.retry import RetryPolicy
+
+        policy = RetryPolicy(max_retries=3, base_delay=1.0, max_delay=5.0)
+        error = APIConnectionError(request=httpx.Request("POST", "http://test/v1/embeddings"))
+        func = MagicMock(side_effect=[error, error, "ok"])
+
+        with patch("src.retry.time.sleep") as sleep:
+            self.assertEqual(policy.call(func, 1, key="value"), "ok")
+        self.assertEqual(func.call_count, 3)
+        delays = [call.args[0] for call in sleep.call_args_list]
+        self.assertTrue(0 <= delays[0] <= 1.0 and 0 <= delays[1] <= 2.0)
+        self.assertTrue(all(policy.delay(attempt) <= 5.0 for attempt in range(10)))
+
+        with patch("src.retry.time.sleep"), self.assertRaises(ValueError):
+            policy.call(MagicMock(side_effect=ValueError("bad input")))
+        with patch("src.retry.time.sleep"), self.assertRaises(APIConnectionError):
+            policy.call(MagicMock(side_effect=error))
+
+    def test_retry_after_headers_are_parsed_defensively(self):
+        """Test Retry-After in milliseconds, seconds or as an HTTP date, and bad values."""
+        from email.utils import format_datetime
+        from datetime import datetime, timedelta, timezone
+        from src.retry import retry_after_seconds
+
+        soon = format_datetime(datetime.now(timezone.utc) + timedelta(seconds=30), usegmt=True)
+        self.assertEqual(retry_after_seconds({"retry-after-ms": "1500", "retry-after": "9"}), 1.5)
+        self.assertEqual(retry_after_seconds({"retry-after": "2"}), 2.0)
+        self.assertTrue(25 <= retry_after_seconds({"retry-after": soon}) <= 30)
+        self.assertEqual(retry_after_seconds({"retry-after": "Wed, 21 Oct 2015 07:28:00 GMT"}), 0.0)
+        self.assertIsNone(retry_after_seconds({"retry-after": "soon"}))
+        self.assertEqual(retry_after_seconds({"retry-after-ms": "n/a", "retry-after": "3"}), 3.0)
+        self.assertIsNone(retry_after_seconds({}))
+
+    def test_search_queries_use_a_short_retry_policy(self):
+        """Test embed_query gives up after a few short retries instead of the ingestion backoff."""
+        import httpx
+        from openai import APIConnectionError
+        from src.embeddings import OpenAIEmbeddingManager
+
+        with patch.dict(os.environ, {"OPENAI_API_KEY": "test", "EMBEDDING_CACHE_PATH": ""}):
+            manager = OpenAIEmbeddingManager()
+        manager.client = MagicMock()
+        manager.client.embeddings.create.side_effect = APIConnectionError(
+            request=httpx.Request("POST", "http://test/v1/embeddings")
+        )
+
+        with patch("src.retry.time.sleep") as sleep, self.assertRaises(APIConnectionError):
+            manager.embed_query("Patient feeling anxious before exams")
+        self.assertEqual(manager.client.embeddings.create.call_count, 3)
+        self.assertTrue(all(call.args[0] <= 1.0 for call in sleep.call_args_list))
+        self.assertEqual(manager.backend.retry.max_retries, 6)
+
+    def test_resume_skips_checkpointed_rows(self):
+        """Test packed batches leave out rows that already have embeddings."""
+        import pandas as pd
+        from src.embeddings import OpenAIEmbeddingManager
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = str(Path(tmp_dir) / "processed.csv")
+            pd.DataFrame({
+                "id": [f"id{i}" for i in range(6)],
+                "Context": [f"context {i}" for i in range(6)],
+                "Response": [f"response {i}" for i in range(6)],
+                "category": "general",
+                "quality_score": 80.0,
+                "context_length": 9,
+                "response_length": 10,
+            }).to_csv(path, index=False)
+
+            with patch.dict(os.environ, {"OPENAI_API_KEY": "test", "EMBEDDING_CACHE_PATH": ""}):
+                manager = OpenAIEmbeddingManager()
+            batches = list(manager._packed_batches(path, skip_ids={"id1", "id4"}))
+
+        ids = [row["id"] for rows, _ in batches for row in rows]
+        self.assertEqual(ids, ["id0", "id2", "id3", "id5"])
+        self.assertEqual(batches[0][1][0], "Context: context 0 Response: response 0")
+
+
+class TestBulkWriter(unittest.TestCase):
+    """Binary COPY encoding and bulk write tests."""
+
+    def test_binary_copy_encoding(self):
+        """Test the COPY stream layout, including vectors, jsonb and NULLs."""
+        import struct
+        import uuid
+        from datetime import datetime
+        from src.bulk_writer import COPY_HEADER, encode_copy_binary
+
+        row_id = uuid.uuid4()
+        columns = [("id", "uuid"), ("embedding", "vector"), ("extra_data", "jsonb"),
+                   ("category", "text"), ("created_at", "timestamp")]
+        data = encode_copy_binary(columns, [{
+            "id": row_id, "embedding": [1.0, -0.5], "extra_data": {"a": 1},
+            "category": None, "created_at": datetime(2000, 1, 2),
+        }])
+
+        self.assertTrue(data.startswith(COPY_HEADER))
+        self.assertTrue(data.endswith(struct.pack(">h", -1)))
+        body = data[len(COPY_HEADER):-2]
+        self.assertEqual(struct.unpack(">h", body[:2])[0], 5)
+
+        fields, offset = [], 2
+        for _ in range(5):
+            (length,) = struct.unpack(">i", body[offset:offset + 4])
+            offset += 4
+            fields.append(None if length == -1 else body[offset:offset + length])
+            offset += max(length, 0)
+        self.assertEqual(offset, len(body))
+
+        self.assertEqual(fields[0], row_id.bytes)
+        self.assertEqual(struct.unpack(">hh", fields[1][:4]), (2, 0))
+        self.assertEqual(np.frombuffer(fields[1][4:], dtype=">f4").tolist(), [1.0, -0.5])
+        self.assertEqual(fields[2], b'\x01{"a": 1}')
+        self.assertIsNone(fields[3])
+        self.assertEqual(struct.unpack(">q", fields[4])[0], 86400 * 1_000_000)
+
+    def test_store_batch_copies_through_staging_table(self):
+        """Test the default path copies rows and checkpoints instead of ORM inserts."""
+        from src.embeddings import OpenAIEmbeddingManager
+
+        with patch.dict(os.environ, {"OPENAI_API_KEY": "test", "EMBEDDING_CACHE_PATH": ""}):
+            manager = OpenAIEmbeddingManager()
+        db = MagicMock()
+        cursor = db.connection.return_value.connection.cursor.return_value
+        rows = [{
+            "id": "abc", "Context": "c", "Response": "r", "category": "general",
+            "quality_score": 80.0, "context_length": 1, "response_length": 1,
+        }]
+
+        manager._store_batch(db, rows, ["Context: c Response: r"], [[0.1, 0.2]], 1)
+
+        db.add_all.assert_not_called()
+        copies = [call.args[0] for call in cursor.copy_expert.call_args_list]
+        self.assertEqual(len(copies), 2)
+        self.assertTrue(copies[0].startswith("COPY conversations_staging"))
+        self.assertTrue(copies[1].startswith("COPY ingestion_checkpoints_staging"))
+        self.assertTrue(all("FORMAT binary" in sql for sql in copies))
+        statements = [call.args[0] for call in cursor.execute.call_args_list]
+        self.assertTrue(any(sql.startswith("INSERT INTO conversations") for sql in statements))
+        self.assertTrue(any("ON CONFLICT (content_hash) DO NOTHING" in sql for sql in statements))
+        # A retried batch must not trip over its checkpoints either
+        self.assertTrue(any(
+            sql.startswith("INSERT INTO ingestion_checkpoints") and "ON CONFLICT (row_id) DO NOTHING" in sql
+            for sql in statements
+        ))
+
+
+class TestVectorStorage(unittest.TestCase):
+    """Configurable embedding dimension and halfvec storage tests."""
+
+    def test_dimension_reduction_request_options(self):
+        """Test shortened text-embedding-3 vectors are requested through extra_body."""
+        from src.embedding_backends import dimension_options
+
+        self.assertEqual(dimension_options("text-embedding-3-small", 1536), {})
+        self.assertEqual(
+            dimension_options("text-embedding-3-large", 256), {"extra_body": {"dimensions": 256}}
+        )
+        self.assertEqual(dimension_options("local-hashing", 64), {})
+        with self.assertRaises(ValueError):
+            dimension_options("text-embedding-ada-002", 512)
+
+    def test_halfvec_column_and_copy_encoding(self):
+        """Test halfvec columns are declared and copied as float16."""
+        import struct
+        from src.bulk_writer import BulkConversationWriter, encode_copy_binary
+        from src.database import HalfVector
+
+        self.assertEqual(HalfVector(256).get_col_spec(), "HALFVEC(256)")
+        writer = BulkConversationWriter("halfvec")
+        self.assertIn(("embedding", "halfvec"), writer.columns)
+
+        stream = encode_copy_binary([("embedding", "halfvec")], [{"embedding": [1.0, -2.0]}])
+        field = stream[19 + 2 + 4:-2]
+        self.assertEqual(struct.unpack(">hh", field[:4]), (2, 0))
+        self.assertEqual(struct.unpack(">2e", field[4:]), (1.0, -2.0))
+
+    def test_binary_mode_reranks_hamming_candidates(self):
+        """Test binary search prefilters on sign bits and reranks by cosine."""
+        from sqlalchemy import select
+        from sqlalchemy.dialects import postgresql
+        from src.database import Conversation
+        from src.embeddings import OpenAIEmbeddingManager
+
+        with patch.dict(os.environ, {"OPENAI_API_KEY": "test", "EMBEDDING_CACHE_PATH": ""}):
+            manager = OpenAIEmbeddingManager()
+        manager.binary_candidates = 50
+        candidates = manager._binary_candidates([0.1] * manager.dimension, "anxiety")
+        sql = str(
+            select(Conversation.id)
+            .join(candidates, candidates.c.id == Conversation.id)
+            .compile(dialect=postgresql.dialect())
+        )
+
+        self.assertIn("WITH binary_candidates AS MATERIALIZED", sql)
+        bits = f"BIT({manager.dimension})"
+        self.assertIn(
+            f"CAST(binary_quantize(conversations.embedding) AS {bits}) <~> "
+            f"CAST(binary_quantize(CAST(%(param_1)s AS VECTOR({manager.dimension}))) AS {bits})",
+            sql,
+        )
+        self.assertIn("conversations.category = ", sql)
+
+
+class TestVectorIndexBuild(unittest.TestCase):
+    """Vector index maintenance and per-request ef_search tests."""
+
+    def maintain(self, rows, existing=None, **kwargs):
+        from src.database import create_vector_index
+
+        with patch("src.database.engine") as engine:
+            conn = engine.connect.return_value.__enter__.return_value
+            conn.execute.return_value.scalar.return_value = rows
+            conn.execute.return_value.first.return_value = existing
+            report = create_vector_index(**kwargs)
+        return report, [str(call.args[0]) for call in conn.execute.call_args_list]
+
+    def test_index_is_built_once_with_configured_options(self):
+        """Test the index is built concurrently with parallel workers and kept when it matches."""
+        from src.database import vector_index_sql
+
+        report, statements = self.maintain(1000)
+        self.assertEqual(report["reason"], "missing")
+        self.assertIn(
+            f"CREATE INDEX CONCURRENTLY ix_conversations_embedding_new ON conversations {vector_index_sql()}",
+            statements,
+        )
+        self.assertIn("WITH (m='16', ef_construction='64')", vector_index_sql())
+        self.assertIn("SET max_parallel_maintenance_workers = 4", statements)
+        self.assertIn("COMMENT ON INDEX ix_conversations_embedding IS 'rows=1000'", statements)
+        self.assertEqual(statements[-2:], ["RESET maintenance_work_mem", "RESET max_parallel_maintenance_workers"])
+
+        current = (f"CREATE INDEX ix_conversations_embedding ON public.conversations {vector_index_sql()}", "rows=10")
+        for force, rebuilt in [(False, False), (True, True)]:
+            with self.subTest(force=force):
+                report, statements = self.maintain(1000, current, force=force)
+                self.assertEqual(report["rebuilt"], rebuilt)
+                self.assertEqual(any(sql.startswith("CREATE INDEX") for sql in statements), rebuilt)
+
+    def test_invalid_bits_index_is_rebuilt(self):
+        """Test binary mode drops a bits index left invalid by an interrupted build."""
+        from src.database import create_vector_index, vector_index_sql
+
+        current = (f"CREATE INDEX ix_conversations_embedding ON public.conversations {vector_index_sql()}", "rows=10")
+        for valid, dropped in [(False, True), (True, False), (None, False)]:
+            with self.subTest(valid=valid), patch("src.database.SEARCH_MODE", "binary"), patch("src.database.engine") as engine:
+                conn = engine.connect.return_value.__enter__.return_value
+                conn.execute.return_value.scalar.side_effect = [10, valid]
+                conn.execute.return_value.first.return_value = current
+                create_vector_index()
+
+                statements = [str(call.args[0]) for call in conn.execute.call_args_list]
+                self.assertEqual("DROP INDEX CONCURRENTLY IF EXISTS ix_conversations_embedding_bits" in statements, dropped)
+                self.assertTrue(any(sql.startswith("CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_conversations_embedding_bits") for sql in statements))
+                self.assertEqual(statements[-1], "RESET max_parallel_maintenance_workers")
+
+    def test_loads_build_the_index_only_for_pgvector_search(self):
+        """Test numpy and ivfpq modes skip the pgvector index build after a load."""
+        from src.embeddings import OpenAIEmbeddingManager
+
+        with patch.dict(os.environ, {"OPENAI_API_KEY": "test", "EMBEDDING_CACHE_PATH": ""}):
+            manager = OpenAIEmbeddingManager()
+        manager._start_ingestion = MagicMock(return_value=set())
+        manager._packed_batches = MagicMock(return_value=iter([]))
+
+        for mode, built in [("ann", True), ("binary", True), ("numpy", False), ("ivfpq", False)]:
+            manager.search_mode = mode
+            with self.subTest(mode=mode), patch("src.embeddings.init_db"), patch("src.embeddings.SessionLocal"), \
+                    patch("src.embeddings.create_vector_index") as create_vector_index:
+                manager.load_data_and_store_embeddings("processed.csv")
+                self.assertEqual(create_vector_index.called, built)
+
+    def test_ivfflat_lists_follow_row_count_drift(self):
+        """Test ivfflat lists are sized from the rows and rebuilt only past the drift threshold."""
+        from src.database import vector_index_sql
+
+        with patch("src.database.VECTOR_INDEX", "ivfflat"), patch("src.database.IVFFLAT_LISTS", 0):
+            self.assertIn("WITH (lists='45')", vector_index_sql(45_000))
+            current = (f"CREATE INDEX ix_conversations_embedding ON public.conversations {vector_index_sql(45_000)}", "rows=45000")
+
+            for rows, rebuilt, lists in [(50_000, False, 45), (60_000, True, 60), (30_000, True, 30)]:
+                with self.subTest(rows=rows):
+                    report, statements = self.maintain(rows, current)
+                    self.assertEqual(report["rebuilt"], rebuilt)
+                    self.assertEqual(report["options"], {"lists": lists})
+                    if rebuilt:
+                        self.assertIn("drifted", report["reason"])
+                        self.assertTrue(any(f"WITH (lists='{lists}')" in sql for sql in statements))
+                        self.assertIn(
+                            "DROP INDEX IF EXISTS ix_conversations_embedding; "
+                            "ALTER INDEX ix_conversations_embedding_new RENAME TO ix_conversations_embedding",
+                            statements,
+                        )
+
+    def test_ef_search_is_set_per_request(self):
+        """Test ef_search applies to the search transaction and covers binary candidates."""
+        from src.embeddings import OpenAIEmbeddingManager
+
+        with patch.dict(os.environ, {"OPENAI_API_KEY": "test", "EMBEDDING_CACHE_PATH": ""}):
+            manager = OpenAIEmbeddingManager()
+        manager.embed_query = MagicMock(return_value=[0.1] * manager.dimension)
+        manager.binary_candidates = 300
+
+        for mode, ef_search, expected in [("ann", 100, 100), ("ann", None, manager.ef_search), ("binary", 100, 300)]:
+            with self.subTest(mode=mode, ef_search=ef_search), patch("src.embeddings.SessionLocal") as session:
+                db = session.return_value
+                db.query.return_value.filter.return_value.join.return_value = db.query.return_value.filter.return_value
+                manager.search_similar("query", mode=mode, ef_search=ef_search)
+                statements = [str(call.args[0]) for call in db.execute.call_args_list]
+                self.assertEqual(statements, [f"SET LOCAL hnsw.ef_search = {expected}"])
+
+
+def write_index_corpus(directory, rows=500, dimension=16):
+    """Write a search index of random vectors and return (metadata, embeddings)."""
+    import numpy as np
+    from src.vector_index import write_index
+
+    rng = np.random.default_rng(0)
+    embeddings = rng.standard_normal((rows, dimension)).astype(np.float32) * rng.uniform(0.5, 2, (rows, 1))
+    metadata = [
+        {
+            "id": f"row-{i}", "context": f"context {i}", "response": f"response {i}",
+            "category": ["anxiety", "depression", "general"][i % 3],
+            "quality_score": float(i % 100), "context_length": 9, "response_length": 10,
+            "extra_data": {"original_id": f"hash-{i}"},
+        }
+        for i in range(rows)
+    ]
+    batches = [(metadata[start:start + 128], embeddings[start:start + 128]) for start in range(0, rows, 128)]
+    assert write_index(directory, rows, dimension, batches) == rows
+    return metadata, embeddings
+
+
+class TestNumpyVectorIndex(unittest.TestCase):
+    """In-process exact search over an exported embedding matrix."""
+
+    def test_results_match_cosine_search(self):
+        """Test top-k, filters and ordering match an exact cosine search like pgvector's."""
+        import numpy as np
+        from src.vector_index import NumpyVectorIndex
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            metadata, embeddings = write_index_corpus(tmp_dir)
+            index = NumpyVectorIndex(tmp_dir)
+            query = embeddings[7] + 0.3
+
+            vectors = embeddings.astype(np.float64)
+            cosine = vectors @ query / (np.linalg.norm(vectors, axis=1) * np.linalg.norm(query))
+            for category, min_quality in [(None, None), ("anxiety", None), ("general", 50.0)]:
+                with self.subTest(category=category, min_quality=min_quality):
+                    expected = [
+                        i for i in np.argsort(-cosine)
+                        if cosine[i] > 0.1
+                        and (category is None or metadata[i]["category"] == category)
+                        and (min_quality is None or metadata[i]["quality_score"] >= min_quality)
+                    ][:5]
+                    results = index.search(query.tolist(), 5, 0.1, category, min_quality)
+
+                    self.assertEqual([r["metadata"]["id"] for r in results], [f"row-{i}" for i in expected])
+                    np.testing.assert_allclose([r["similarity"] for r in results], cosine[expected], rtol=1e-5)
+                    self.assertEqual(results[0]["metadata"]["extra_data"], metadata[expected[0]]["extra_data"])
+
+            self.assertEqual(index.search(query.tolist(), 5, 0.1, "unknown"), [])
+
+    def test_numpy_mode_searches_the_index(self):
+        """Test search_similar answers from the exported index without the database."""
+        from src.embeddings import OpenAIEmbeddingManager
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            _, embeddings = write_index_corpus(tmp_dir)
+            env = {"OPENAI_API_KEY": "test", "EMBEDDING_CACHE_PATH": "", "SEARCH_INDEX_DIR": tmp_dir}
+            with patch.dict(os.environ, env):
+                manager = OpenAIEmbeddingManager()
+            manager.embed_query = MagicMock(return_value=embeddings[42].tolist())
+
+            with patch("src.embeddings.SessionLocal") as session:
+                results = manager.search_similar("query", top_k=3, min_similarity=0.5, mode="numpy")
+            session.assert_not_called()
+            self.assertEqual(results[0]["metadata"]["id"], "row-42")
+            self.assertAlmostEqual(results[0]["similarity"], 1.0, places=5)
+
+    def test_reexported_index_is_mapped_again(self):
+        """Test a re-export by another process is seen by the next search, in numpy and ivfpq mode."""
+        import shutil
+        from src.embeddings import OpenAIEmbeddingManager
+        from src.ivfpq import IVFPQIndex
+        from src.vector_index import NumpyVectorIndex
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            write_index_corpus(tmp_dir, rows=300)
+            IVFPQIndex.build(NumpyVectorIndex(tmp_dir).embeddings, str(Path(tmp_dir) / "ivfpq"), nlist=4, m=4)
+            env = {"OPENAI_API_KEY": "test", "EMBEDDING_CACHE_PATH": "", "SEARCH_INDEX_DIR": tmp_dir}
+            with patch.dict(os.environ, env):
+                manager = OpenAIEmbeddingManager()
+            manager.embed_query = MagicMock(return_value=[0.1] * 16)
+            self.assertEqual(len(manager.search_similar("query", min_similarity=-1.0, mode="ivfpq")), 5)
+            self.assertEqual(len(manager.vector_index), 300)
+
+            # As python -m src.vector_index would, with more rows
+            _, embeddings = write_index_corpus(tmp_dir, rows=400)
+            IVFPQIndex.build(NumpyVectorIndex(tmp_dir).embeddings, str(Path(tmp_dir) / "ivfpq"), nlist=4, m=4)
+            manager.embed_query = MagicMock(return_value=embeddings[350].tolist())
+            for mode in ("numpy", "ivfpq"):
+                with self.subTest(mode=mode):
+                    results = manager.search_similar("query", top_k=1, min_similarity=0.5, mode=mode)
+                    self.assertEqual(results[0]["metadata"]["id"], "row-350")
+
+            # An empty export removes the IVF-PQ index
+            write_index_corpus(tmp_dir, rows=0)
+            shutil.rmtree(Path(tmp_dir) / "ivfpq")
+            self.assertEqual(manager.search_similar("query", mode="ivfpq"), [])
+            self.assertEqual(manager.search_similar("query", mode="numpy"), [])
+
+
+class TestIVFPQIndex(unittest.TestCase):
+    """NumPy IVF-PQ approximate index tests."""
+
+    def test_build_load_and_search(self):
+        """Test compact memory-mapped codes, nprobe, masks and recall after rerank."""
+        import numpy as np
+        from src.ivfpq import IVFPQIndex
+
+        rng = np.random.default_rng(0)
+        centers = rng.standard_normal((40, 32))
+        vectors = (centers[rng.integers(0, 40, 3000)] + 0.3 * rng.standard_normal((3000, 32))).astype(np.float32)
+        vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            IVFPQIndex.build(vectors, tmp_dir, nlist=16, m=8)
+            index = IVFPQIndex.load(tmp_dir)
+
+            self.assertIsInstance(index.codes, np.memmap)
+            self.assertEqual((index.codes.dtype, index.codes.shape), (np.uint8, (3000, 8)))
+            self.assertEqual(sorted(index.list_rows), list(range(3000)))
+
+            recall = 0.0
+            for i in range(50):
+                query = vectors[i * 7]
+                rows, scores = index.search(query, 50, nprobe=16)
+                self.assertTrue(np.all(np.diff(scores) <= 0))
+                reranked = rows[np.argsort(-(vectors[rows] @ query))[:10]]
+                exact = np.argsort(-(vectors @ query))[:10]
+                recall += len(set(reranked) & set(exact)) / 10
+            self.assertGreaterEqual(recall / 50, 0.9)
+
+            self.assertLessEqual(len(index.search(vectors[0], 3000, nprobe=1)[0]), 3000)
+            mask = np.arange(3000) % 2 == 0
+            rows, _ = index.search(vectors[1], 20, nprobe=16, mask=mask)
+            self.assertTrue(len(rows) and np.all(rows % 2 == 0))
+
+    def test_ivfpq_mode_reranks_candidates(self):
+        """Test search_similar in ivfpq mode returns exact similarities from the index."""
+        import numpy as np
+        from src.embeddings import OpenAIEmbeddingManager
+        from src.ivfpq import IVFPQIndex
+        from src.vector_index import NumpyVectorIndex
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            _, embeddings = write_index_corpus(tmp_dir, rows=600)
+            IVFPQIndex.build(NumpyVectorIndex(tmp_dir).embeddings, str(Path(tmp_dir) / "ivfpq"), nlist=8, m=4)
+            env = {"OPENAI_API_KEY": "test", "EMBEDDING_CACHE_PATH": "", "SEARCH_INDEX_DIR": tmp_dir}
+            with patch.dict(os.environ, env):
+                manager = OpenAIEmbeddingManager()
+            manager.embed_query = MagicMock(return_value=embeddings[42].tolist())
+
+            results = manager.search_similar("query", top_k=3, min_similarity=0.0, mode="ivfpq", nprobe=8)
+            filtered = manager.search_similar(
+                "query", top_k=3, min_similarity=-1.0, category_filter="general", mode="ivfpq", nprobe=8
+            )
+
+        self.assertEqual(results[0]["metadata"]["id"], "row-42")
+        self.assertAlmostEqual(results[0]["similarity"], 1.0, places=5)
+        self.assertTrue(filtered and all(r["metadata"]["category"] == "general" for r in filtered))
+
+    def test_default_subquantizers_divide_the_dimension(self):
+        """Test dimensions that are not multiples of 16 still build with the default m."""
+        import numpy as np
+        from src.ivfpq import IVFPQIndex, default_subquantizers
+
+        self.assertEqual([default_subquantizers(d) for d in (1536, 100, 300, 7)], [96, 5, 15, 1])
+        vectors = np.random.default_rng(0).standard_normal((400, 100)).astype(np.float32)
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            index = IVFPQIndex.build(vectors, tmp_dir, nlist=4)
+            self.assertEqual(index.codes.shape, (400, 5))
+            self.assertEqual(len(index.search(vectors[0], 10)[0]), 10)
+
+    def test_ivfpq_mode_with_no_rows_returns_nothing(self):
+        """Test an empty export searches to [] instead of loading a missing IVF-PQ index."""
+        from src.embeddings import OpenAIEmbeddingManager
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            write_index_corpus(tmp_dir, rows=0)
+            env = {"OPENAI_API_KEY": "test", "EMBEDDING_CACHE_PATH": "", "SEARCH_INDEX_DIR": tmp_dir}
+            with patch.dict(os.environ, env):
+                manager = OpenAIEmbeddingManager()
+            manager.embed_query = MagicMock(return_value=[0.1] * 16)
+
+            self.assertEqual(manager.search_similar("query", mode="ivfpq"), [])
+
+
+class TestUpsertIngestion(unittest.TestCase):
+    """Content-hash keyed incremental reindex tests."""
+
+    def make_manager(self):
+        from src.embeddings import OpenAIEmbeddingManager
+
+        with patch.dict(os.environ, {"OPENAI_API_KEY": "test", "EMBEDDING_CACHE_PATH": ""}):
+            return OpenAIEmbeddingManager()
+
+    def test_stored_hashes_are_skipped_and_source_ids_collected(self):
+        """Test only rows with new content hashes are embedded."""
+        import pandas as pd
+        from datetime import datetime
+
+        manager = self.make_manager()
+        db = MagicMock()
+        db.query.return_value.filter.return_value = [("id1", None), ("id4", datetime(2024, 1, 1))]
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = str(Path(tmp_dir) / "processed.csv")
+            pd.DataFrame({
+                "id": [f"id{i}" for i in range(5)],
+                "Context": [f"context {i}" for i in range(5)],
+                "Response": [f"response {i}" for i in range(5)],
+                "category": "general",
+                "quality_score": 80.0,
+                "context_length": 9,
+                "response_length": 10,
+            }).to_csv(path, index=False)
+
+            done = manager._start_ingestion(db, resume=False, upsert=True)
+            source_ids = set()
+            batches = list(manager._packed_batches(path, done, source_ids))
+
+        db.query.return_value.delete.assert_not_called()
+        self.assertEqual([row["id"] for rows, _ in batches for row in rows], ["id0", "id2", "id3"])
+        self.assertEqual(source_ids, {f"id{i}" for i in range(5)})
+
+    def test_finish_upsert_restores_and_retires_rows(self):
+        """Test rows back in the source are restored and vanished rows soft-deleted."""
+        from datetime import datetime
+
+        manager = self.make_manager()
+        manager._existing = {
+            "kept": None,
+            "back": datetime(2024, 1, 1),
+            "gone": None,
+            "already_gone": datetime(2024, 1, 1),
+        }
+        db = MagicMock()
+        rows = db.query.return_value.filter.return_value
+
+        report = manager._finish_upsert(db, {"kept", "back", "new"}, hard_delete=False)
+
+        self.assertEqual(report, {"unchanged": 1, "restored": 1, "soft_deleted": 1})
+        updates = [call.args[0] for call in rows.update.call_args_list]
+        self.assertEqual(list(updates[0].values()), [None])
+        self.assertIsInstance(list(updates[1].values())[0], datetime)
+        rows.delete.assert_not_called()
+        db.commit.assert_called_once()
+
+        report = manager._finish_upsert(MagicMock(), {"kept"}, hard_delete=True)
+        self.assertEqual(report, {"unchanged": 1, "restored": 0, "deleted": 3})
+
+
+class TestIngestionPipeline(unittest.TestCase):
+    """Overlapped read/embed/write pipeline tests."""
+
+    def test_stages_overlap(self):
+        """Test total time is close to the slowest stage, not the sum."""
+        from src.pipeline import Pipeline
+
+        def slow(item):
+            time.sleep(0.05)
+            return item
+
+        def source():
+            for i in range(10):
+                time.sleep(0.05)
+                yield i
+
+        written = []
+        pipeline = Pipeline(("read", source()), [("embed", slow)], ("write", lambda item: written.append(slow(item))))
+        start = time.perf_counter()
+        stats = pipeline.run()
+        elapsed = time.perf_counter() - start
+
+        self.assertEqual(written, list(range(10)))
+        # Sequential would take 1.5s
+        self.assertLess(elapsed, 1.0)
+        for name in ("read", "embed", "write"):
+            self.assertEqual(stats[name]["items"], 10)
+            self.assertGreater(stats[name]["rows_per_second"], 0)
+
+    def test_queues_bound_work_in_progress(self):
+        """Test a slow sink holds back the source."""
+        from src.pipeline import Pipeline
+
+        produced = []
+
+        def source():
+            for i in range(20):
+                produced.append(i)
+                yield i
+
+        def sink(item):
+            time.sleep(0.01)
+            # Each queue holds 2 items, plus one item in hand per stage
+            self.assertLessEqual(len(produced) - item, 2 * 2 + 3)
+
+        Pipeline(("read", source()), [("embed", lambda item: item)], ("write", sink), queue_size=2).run()
+        self.assertEqual(len(produced), 20)
+
+    def test_errors_stop_the_pipeline(self):
+        """Test an error in a stage is raised from run and stops the source."""
+        from src.pipeline import Pipeline
+
+        def embed(item):
+            if item == 3:
+                raise RuntimeError("provider down")
+            return item
+
+        written = []
+        with self.assertRaisesRegex(RuntimeError, "provider down"):
+            Pipeline(("read", iter(range(1000))), [("embed", embed)], ("write", written.append), queue_size=2).run()
+        self.assertEqual(written, [0, 1, 2])
+
+
+class FakeEmbeddingsServer(ThreadingHTTPServer):
+    """Local stand-in for the embeddings API.
+
+    Answers the first rate_limited_requests requests with 429 and tracks
+    the largest number of requests served at the same time.
+    """
+
+    def __init__(self, rate_limited_requests=0, latency=0.02):
+        super().__init__(("127.0.0.1", 0), FakeEmbeddingsHandler)
+        self.rate_limited_requests = rate_limited_requests
+        self.latency = latency
+        self.requests = 0
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.lock = threading.Lock()
+
+    @property
+    def base_url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}/v1"
+
+
+class FakeEmbeddingsHandler(BaseHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+    def _send(self, status, body, headers=()):
+        payload = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        for name, value in headers:
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_POST(self):
+        server = self.server
+        request = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        with server.lock:
+            server.requests += 1
+            rate_limited = server.requests <= server.rate_limited_requests
+            server.in_flight += 1
+            server.peak_in_flight = max(server.peak_in_flight, server.in_flight)
+        try:
+            time.sleep(server.latency)
+            if rate_limited:
+                self._send(429, {"error": {"message": "Rate limit", "type": "requests"}}, [("Retry-After", "0")])
+                return
+
+            data = []
+            for index, text in enumerate(request["input"]):
+                vector = [float(len(text)), 0.5, -1.0]
+                if request.get("encoding_format") == "base64":
+                    vector = base64.b64encode(np.array(vector, dtype=np.float32).tobytes()).decode()
+                data.append({"object": "embedding", "index": index, "embedding": vector})
+            self._send(200, {
+                "object": "list", "data": data, "model": request["model"],
+                "usage": {"prompt_tokens": 1, "total_tokens": 1},
+            })
+        finally:
+            with server.lock:
+                server.in_flight -= 1
+
+
+class TestAsyncEmbeddings(unittest.TestCase):
+    """Concurrent embedding generation tests against a local fake server."""
+
+    def start_server(self, **kwargs):
+        server = FakeEmbeddingsServer(**kwargs)
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        return server
+
+    def make_generator(self, server, **kwargs):
+        from openai import AsyncOpenAI
+        from src.async_embeddings import AsyncEmbeddingGenerator
+
+        client = AsyncOpenAI(api_key="test", base_url=server.base_url, max_retries=0)
+        return AsyncEmbeddingGenerator(client, "fake-model", 3, **kwargs)
+
+    def collect(self, generator, batches):
+        async def run():
+            return [item async for item in generator.embed_batches(batches)]
+
+        return dict(asyncio.run(run()))
+
+    def test_batches_run_concurrently(self):
+        """Test several requests are in flight and every batch gets its own vectors."""
+        from src.async_embeddings import AdaptiveConcurrencyLimiter
+
+        server = self.start_server()
+        generator = self.make_generator(server, limiter=AdaptiveConcurrencyLimiter(initial=4, maximum=8))
+        batches = [(i, ["x" * i, "y" * (i + 1)]) for i in range(1, 25)]
+
+        results = self.collect(generator, batches)
+
+        self.assertEqual(sorted(results), list(range(1, 25)))
+        for i, embeddings in results.items():
+            self.assertEqual([vector[0] for vector in embeddings], [float(i), float(i + 1)])
+        self.assertGreater(server.peak_in_flight, 1)
+        self.assertLessEqual(generator.limiter.peak_in_flight, 8)
+        self.assertGreater(generator.limiter.limit, 4)
+
+    def test_rate_limits_reduce_concurrency_and_retry(self):
+        """Test 429s are retried and halve the concurrency limit."""
+        from src.async_embeddings import AdaptiveConcurrencyLimiter
+
+        server = self.start_server(rate_limited_requests=3)
+        limiter = AdaptiveConcurrencyLimiter(initial=8, maximum=8, cooldown=60)
+        generator = self.make_generator(server, limiter=limiter)
+
+        results = self.collect(generator, [(i, [f"text {i}"]) for i in range(6)])
+
+        self.assertEqual(len(results), 6)
+        self.assertEqual(generator.rate_limited, 3)
+        self.assertEqual(generator.requests, 9)
+        # One decrease per cooldown window, then additive increase
+        self.assertLess(limiter.limit, 8)
+
+    def test_request_budget_spaces_out_requests(self):
+        """Test the requests-per-minute bucket throttles once its burst is spent."""
+        from src.async_embeddings import TokenBucket
+
+        async def run():
+            bucket = TokenBucket(per_minute=600)
+            bucket.tokens = 0
+            start = time.monotonic()
+            for _ in range(3):
+                await bucket.acquire(1)
+            return time.monotonic() - start
+
+        # 600 per minute refills one request every 0.1s
+        self.assertGreaterEqual(asyncio.run(run()), 0.25)
+
+
+if __name__ == "__main__":
+    unittest.main()